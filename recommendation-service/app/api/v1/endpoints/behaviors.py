@@ -0,0 +1,82 @@
+import math
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.services.behavior_ingestion import (
+    IngestionBufferFull,
+    IngestionStopped,
+    get_behavior_ingestor,
+    parse_ndjson
+)
+from app.api.v1.deps import require_admin
+
+router = APIRouter()
+
+
+@router.post("/ingest", status_code=202)
+async def ingest_behaviors(
+    request: Request,
+    flush: bool = Query(False, description="Flush the buffer before responding (read-your-writes)"),
+    current_user: dict = Depends(require_admin)  # Service accounts / Admin
+):
+    """
+    Ingest a batch of user behaviors as NDJSON (one event per line)
+    
+    **Admin only** - Used by booking/movie services to report behaviors
+    
+    Each line: `{"user_id": 1, "movie_id": 42, "behavior": "view", "score": 1.0, "created_at": "2024-05-01T10:00:00Z"}`,
+    `score` defaults to the behavior's score (view/book/rate), `created_at` to now.
+    Ids must fit in int32, `score` must be finite and `created_at` may not be later than
+    now plus INGEST_MAX_CLOCK_SKEW_SECONDS.
+    
+    Events are buffered and written in bulk together with the aggregated user-movie
+    scores. Invalid lines are reported and skipped. Returns 429 with Retry-After when
+    the buffer is full (the whole batch is rejected and should be retried).
+    """
+    body = await request.body()
+    try:
+        events, errors, n_rejected = await run_in_threadpool(
+            parse_ndjson, body, settings.INGEST_MAX_EVENTS_PER_REQUEST
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    ingestor = get_behavior_ingestor()
+    try:
+        accepted = ingestor.submit(events)
+    except IngestionBufferFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Hệ thống đang quá tải, vui lòng thử lại sau. {e}",
+            headers={"Retry-After": str(max(1, math.ceil(ingestor.flush_interval)))}
+        )
+    except IngestionStopped:
+        raise HTTPException(status_code=503, detail="Service đang dừng, vui lòng thử lại sau")
+    
+    if flush and not await run_in_threadpool(ingestor.flush):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Đã nhận events nhưng chưa ghi được vào database: {ingestor.last_error}"
+        )
+    
+    return {
+        "accepted": accepted,
+        "rejected": n_rejected,
+        "errors": errors,
+        "buffered": ingestor.buffered
+    }
+
+
+@router.get("/ingest/stats")
+async def get_ingestion_stats(
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Buffer and flush statistics of the behavior ingestor in this worker
+    (including the most recent events dropped because the database rejected them)
+    
+    **Admin only**
+    """
+    return get_behavior_ingestor().stats()
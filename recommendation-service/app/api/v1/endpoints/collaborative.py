@@ -1,55 +1,243 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Callable, List, Literal, Optional, Set, Tuple
+import json
 
-from app.database import get_db
+from app.database import get_db, get_async_db, SessionLocal
 from app.schemas.recommendation import (
     RecommendationRequest,
     RecommendationResponse,
     CollaborativeRequest,
+    BatchRecommendationRequest,
+    FoldInRequest,
     MovieRecommendation
 )
-from app.services.collaborative_service import get_cf_service
+from app.services.collaborative_service import (
+    get_cf_service,
+    create_cf_service,
+    swap_cf_service,
+    clear_all_worker_caches,
+    publish_user_invalidations,
+    get_worker_model_status,
+    get_default_engine
+)
+from app.services.training_jobs import get_training_job_manager
+from app.services.candidate_pipeline import build_context, get_hybrid_pipeline
 from app.services.recommendation_service import RecommendationService
 from app.services.recommendation_helpers import (
     fill_with_popular_movies,
     movie_to_recommendation,
-    get_user_watched_movies,
+    get_user_watched_movies_async,
+    get_movies_by_ids_async,
     get_content_based_from_user_history
 )
-from app.models.movie import Movie
+from app.services.user_scores import UserScore
 from app.api.v1.deps import get_current_user, require_admin
 
 router = APIRouter()
 
 
-@router.post("/train")
-async def train_model(
-    db: Session = Depends(get_db),
+# Các async endpoints đọc dữ liệu per-user qua AsyncSession; phần sync (load model lần
+# đầu, CPU scoring, content-based, leaderboards) chạy trong threadpool để không block
+# event loop. Endpoints không dùng AsyncSession nhưng chạm disk/model là sync (def).
+
+def _with_session(fn: Callable, *args, **kwargs):
+    """Chạy sync service code với một Session riêng (gọi trong threadpool)"""
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def _check_cold_start(
+    db: AsyncSession,
+    cf_service,
+    user_id: int
+) -> Tuple[bool, Optional[List[UserScore]], Optional[Set[int]]]:
+    """
+    Cold-start check, chỉ đọc lịch sử user từ DB khi model không có interaction
+    count in-memory của user
+    
+    Read-only: user chưa có trong model được quyết định theo interaction_count trong
+    DB và nhận gợi ý theo item bias; fold-in do ingestion listener hoặc /fold-in làm.
+    
+    Returns:
+        (is_cold_start, user_scores, watched_movie_ids), hai giá trị sau là None
+        nếu không query DB
+    """
+    if cf_service.has_interaction_count(user_id):
+        return cf_service.is_cold_start_user(user_id), None, None
+    
+    user_scores, watched_movie_ids = await get_user_watched_movies_async(db, user_id)
+    is_cold_start = cf_service.is_cold_start_user(
+        user_id,
+        interaction_count=sum(s.interaction_count for s in user_scores)
+    )
+    return is_cold_start, user_scores, watched_movie_ids
+
+
+def _popular_recommendations(db: Session, limit: int, reason: str) -> List[MovieRecommendation]:
+    popular_movies = RecommendationService(db).get_popular_movies(limit=limit)
+    return [
+        movie_to_recommendation(
+            movie=movie,
+            recommendation_type="popularity",
+            reason=reason
+        )
+        for movie, _ in popular_movies
+    ]
+
+
+def _content_and_popular_recommendations(
+    db: Session,
+    user_scores: List[UserScore],
+    recommendations: List[MovieRecommendation],
+    existing_ids: Set[int],
+    n_content: int,
+    target_count: int,
+    num_source_movies: int,
+    reason_template: str
+) -> List[MovieRecommendation]:
+    """
+    Thêm tối đa n_content gợi ý content-based từ lịch sử user, rồi fill bằng phim phổ biến
+    """
+    rec_service = RecommendationService(db)
+    recommendations = list(recommendations)
+    
+    if n_content > 0:
+        content_based_results = get_content_based_from_user_history(
+            db=db,
+            user_behaviors=user_scores,
+            watched_movie_ids=existing_ids,
+            top_n=n_content,
+            rec_service=rec_service,
+            num_source_movies=num_source_movies
+        )
+        
+        added_content = 0
+        for movie, similarity, _, source_title in content_based_results:
+            if added_content >= n_content:
+                break
+            if movie.id not in existing_ids:
+                recommendations.append(
+                    movie_to_recommendation(
+                        movie=movie,
+                        predicted_score=round(similarity, 2),
+                        recommendation_type="content-based",
+                        reason=reason_template.format(title=source_title)
+                    )
+                )
+                existing_ids.add(movie.id)
+                added_content += 1
+    
+    return fill_with_popular_movies(
+        db=db,
+        existing_recommendations=recommendations,
+        target_count=target_count,
+        exclude_movie_ids=existing_ids,
+        rec_service=rec_service
+    )
+
+
+def _hybrid_recommendations(
+    db: Session,
+    user_id: int,
+    user_scores: List[UserScore],
+    watched_movie_ids: Set[int],
+    collaborative_weight: float,
+    top_n: int
+) -> List[MovieRecommendation]:
+    """
+    Hybrid pipeline (candidate generation + ranking), fill bằng phim phổ biến nếu thiếu
+    """
+    ctx = build_context(db, user_id, user_scores, watched_movie_ids, collaborative_weight)
+    ranked, _ = get_hybrid_pipeline().run(ctx, top_n)
+    
+    recommendations = [
+        movie_to_recommendation(
+            movie=item.movie,
+            predicted_score=round(item.score, 4),
+            recommendation_type=item.recommendation_type,
+            reason=item.reason
+        )
+        for item in ranked
+    ]
+    return fill_with_popular_movies(
+        db=db,
+        existing_recommendations=recommendations,
+        target_count=top_n,
+        exclude_movie_ids=set(watched_movie_ids) | {item.movie.id for item in ranked},
+        rec_service=ctx.rec_service
+    )
+
+
+@router.post("/train", status_code=202)
+def train_model(
+    engine: Optional[Literal["sgd", "als", "als_implicit"]] = Query(
+        None,
+        description="Training engine: SGD, explicit ALS or implicit-confidence ALS "
+                    "(default: the engine chosen by the last hyperparameter search, else SGD)"
+    ),
     current_user: dict = Depends(require_admin)  # Chỉ Admin
 ):
     """
-    Train collaborative filtering model with current data
+    Start a background job that trains the collaborative filtering model
     
     **Admin only** - Model training is resource-intensive
+    
+    Training runs in a separate process; the serving model is swapped atomically
+    when the job completes. Poll `/train/jobs/{job_id}` for status and progress.
     """
+    job_manager = get_training_job_manager()
     try:
-        cf_service = get_cf_service()
-        result = cf_service.train(db, verbose=True)
-        return {
-            "message": "Model trained successfully",
-            **result
-        }
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        job = job_manager.submit(engine or get_default_engine())
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Training failed: {str(e)}")
+    
+    return {
+        "message": "Training job started",
+        **job
+    }
+
+
+@router.get("/train/jobs")
+async def list_training_jobs(
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    List training jobs started on this worker
+    
+    **Admin only**
+    """
+    return {"jobs": get_training_job_manager().list()}
+
+
+@router.get("/train/jobs/{job_id}")
+def get_training_job(
+    job_id: str,
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Get status and progress of a training job
+    
+    **Admin only**
+    """
+    job = get_training_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job
 
 
 @router.post("/recommendations", response_model=RecommendationResponse)
 async def get_collaborative_recommendations(
     request: CollaborativeRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)  # Yêu cầu đăng nhập
 ):
     """
@@ -59,8 +247,7 @@ async def get_collaborative_recommendations(
     
     Auto fallback to popularity if cold-start user
     """
-    cf_service = get_cf_service()
-    rec_service = RecommendationService(db)
+    cf_service = await run_in_threadpool(get_cf_service)
     
     if cf_service.user_factors is None:
         raise HTTPException(
@@ -68,18 +255,12 @@ async def get_collaborative_recommendations(
             detail="Model chưa được train. Vui lòng gọi /train trước."
         )
     
-    is_cold_start = cf_service.is_cold_start_user(request.user_id, db)
+    is_cold_start, _, watched_movie_ids = await _check_cold_start(db, cf_service, request.user_id)
     
     if is_cold_start:
-        popular_movies = rec_service.get_popular_movies(limit=request.top_n)
-        recommendations = [
-            movie_to_recommendation(
-                movie=movie,
-                recommendation_type="popularity",
-                reason="User mới - đề xuất phim phổ biến"
-            )
-            for movie, _ in popular_movies
-        ]
+        recommendations = await run_in_threadpool(
+            _with_session, _popular_recommendations, request.top_n, "User mới - đề xuất phim phổ biến"
+        )
         
         return RecommendationResponse(
             recommendations=recommendations,
@@ -89,24 +270,23 @@ async def get_collaborative_recommendations(
             is_cold_start=True
         )
     
+    # User có trong interaction matrix: recommend() loại watched movies bằng CSR row
+    if watched_movie_ids is None and not cf_service.has_watched_row(request.user_id):
+        _, watched_movie_ids = await get_user_watched_movies_async(db, request.user_id)
+    
     # Get collaborative recommendations
-    cf_recommendations = cf_service.recommend(
+    cf_recommendations = await run_in_threadpool(
+        cf_service.recommend,
         user_id=request.user_id,
         top_n=request.top_n,
         exclude_watched=True,
-        db=db
+        watched_movie_ids=watched_movie_ids
     )
     
     if not cf_recommendations:
-        popular_movies = rec_service.get_popular_movies(limit=request.top_n)
-        recommendations = [
-            movie_to_recommendation(
-                movie=movie,
-                recommendation_type="popularity",
-                reason="Không đủ dữ liệu collaborative"
-            )
-            for movie, _ in popular_movies
-        ]
+        recommendations = await run_in_threadpool(
+            _with_session, _popular_recommendations, request.top_n, "Không đủ dữ liệu collaborative"
+        )
         
         return RecommendationResponse(
             recommendations=recommendations,
@@ -117,9 +297,7 @@ async def get_collaborative_recommendations(
         )
     
     # Get movie details
-    movie_ids = [rec[0] for rec in cf_recommendations]
-    movies = db.query(Movie).filter(Movie.id.in_(movie_ids)).all()
-    movie_dict = {movie.id: movie for movie in movies}
+    movie_dict = await get_movies_by_ids_async(db, [rec[0] for rec in cf_recommendations])
     
     recommendations = [
         movie_to_recommendation(
@@ -141,10 +319,55 @@ async def get_collaborative_recommendations(
     )
 
 
+@router.post("/recommendations/batch")
+async def get_batch_recommendations(
+    request: BatchRecommendationRequest,
+    current_user: dict = Depends(require_admin)  # Chỉ Admin (email/push jobs)
+):
+    """
+    Collaborative recommendations for many users, streamed as NDJSON
+    
+    **Admin only** - Intended for email/push jobs
+    
+    Each line is `{"user_id", "is_cold_start", "recommendations": [{"movie_id", "predicted_score"}]}`.
+    Users not in the model get item-popularity (bias) rankings.
+    """
+    cf_service = await run_in_threadpool(get_cf_service)
+    
+    if cf_service.user_factors is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Model chưa được train. Vui lòng gọi /train trước."
+        )
+    
+    def generate_lines():
+        # Session riêng vì response được stream sau khi handler return
+        db = SessionLocal()
+        try:
+            for user_id, is_cold_start, recs in cf_service.recommend_batch(
+                user_ids=request.user_ids,
+                top_n=request.top_n,
+                exclude_watched=request.exclude_watched,
+                db=db
+            ):
+                yield json.dumps({
+                    "user_id": user_id,
+                    "is_cold_start": is_cold_start,
+                    "recommendations": [
+                        {"movie_id": movie_id, "predicted_score": round(score, 4)}
+                        for movie_id, score in recs
+                    ]
+                }) + "\n"
+        finally:
+            db.close()
+    
+    return StreamingResponse(generate_lines(), media_type="application/x-ndjson")
+
+
 @router.post("/personalized", response_model=RecommendationResponse)
 async def get_personalized_recommendations(
     request: RecommendationRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)  # Yêu cầu đăng nhập
 ):
     """
@@ -153,10 +376,11 @@ async def get_personalized_recommendations(
     **Authentication required** - Highly personalized for each user
     
     - Cold-start users: 100% content-based (from watched movies)
-    - Regular users: Hybrid weighted combination
+    - Regular users: candidates from collaborative, content, co-watch and popular
+      sources, ranked together on one feature matrix (collaborative_weight splits
+      the weight between the collaborative and content features)
     """
-    cf_service = get_cf_service()
-    rec_service = RecommendationService(db)
+    cf_service = await run_in_threadpool(get_cf_service)
     
     if cf_service.user_factors is None:
         raise HTTPException(
@@ -164,22 +388,19 @@ async def get_personalized_recommendations(
             detail="Model chưa được train. Vui lòng gọi /train trước."
         )
     
-    is_cold_start = cf_service.is_cold_start_user(request.user_id, db)
-    user_ratings, watched_movie_ids = get_user_watched_movies(db, request.user_id)
+    is_cold_start, user_ratings, watched_movie_ids = await _check_cold_start(db, cf_service, request.user_id)
+    
+    # Content-based cần score từng movie trong lịch sử (không có trong model)
+    if user_ratings is None:
+        user_ratings, watched_movie_ids = await get_user_watched_movies_async(db, request.user_id)
     
     # --- Cold-start user: 100% content-based ---
     if is_cold_start:
         if not user_ratings:
             # No ratings at all -> popularity
-            popular_movies = rec_service.get_popular_movies(limit=request.top_n)
-            recommendations = [
-                movie_to_recommendation(
-                    movie=movie,
-                    recommendation_type="popularity",
-                    reason="User mới - đề xuất phim phổ biến"
-                )
-                for movie, _ in popular_movies
-            ]
+            recommendations = await run_in_threadpool(
+                _with_session, _popular_recommendations, request.top_n, "User mới - đề xuất phim phổ biến"
+            )
             
             return RecommendationResponse(
                 recommendations=recommendations,
@@ -189,34 +410,17 @@ async def get_personalized_recommendations(
                 is_cold_start=True
             )
         
-        # Content-based from top rated movies
-        content_based_results = get_content_based_from_user_history(
-            db=db,
-            user_behaviors=user_ratings,
-            watched_movie_ids=watched_movie_ids,
-            top_n=request.top_n,
-            rec_service=rec_service,
-            num_source_movies=3
-        )
-        
-        recommendations = [
-            movie_to_recommendation(
-                movie=movie,
-                predicted_score=round(similarity, 2),
-                recommendation_type="content-based",
-                reason=f"Tương tự với '{source_title}' mà bạn đã xem"
-            )
-            for movie, similarity, _, source_title in content_based_results[:request.top_n]
-        ]
-        
-        # Fill with popularity if needed
-        existing_ids = watched_movie_ids | {r.id for r in recommendations}
-        recommendations = fill_with_popular_movies(
-            db=db,
-            existing_recommendations=recommendations,
+        # Content-based from top rated movies, fill with popularity if needed
+        recommendations = await run_in_threadpool(
+            _with_session,
+            _content_and_popular_recommendations,
+            user_scores=user_ratings,
+            recommendations=[],
+            existing_ids=set(watched_movie_ids),
+            n_content=request.top_n,
             target_count=request.top_n,
-            exclude_movie_ids=existing_ids,
-            rec_service=rec_service
+            num_source_movies=3,
+            reason_template="Tương tự với '{title}' mà bạn đã xem"
         )
         
         return RecommendationResponse(
@@ -227,75 +431,15 @@ async def get_personalized_recommendations(
             is_cold_start=True
         )
     
-    # --- Regular user: Hybrid collaborative + content-based ---
-    # Validate and adjust weights
-    weight = max(0.0, min(1.0, request.collaborative_weight))
-    n_collaborative = int(request.top_n * weight)
-    n_content = request.top_n - n_collaborative
-    
-    recommendations = []
-    existing_ids = watched_movie_ids.copy()
-    
-    # 1. Collaborative recommendations
-    if n_collaborative > 0:
-        cf_recs = cf_service.recommend(
-            user_id=request.user_id,
-            top_n=n_collaborative,
-            exclude_watched=True,
-            db=db
-        )
-        
-        if cf_recs:
-            movie_ids = [rec[0] for rec in cf_recs]
-            movies = db.query(Movie).filter(Movie.id.in_(movie_ids)).all()
-            movie_dict = {movie.id: movie for movie in movies}
-            
-            for movie_id, score in cf_recs:
-                if movie_id in movie_dict:
-                    recommendations.append(
-                        movie_to_recommendation(
-                            movie=movie_dict[movie_id],
-                            predicted_score=round(score, 2),
-                            recommendation_type="collaborative",
-                            reason="Dựa trên người dùng tương tự"
-                        )
-                    )
-                    existing_ids.add(movie_id)
-    
-    # 2. Content-based recommendations
-    if n_content > 0:
-        content_based_results = get_content_based_from_user_history(
-            db=db,
-            user_behaviors=user_ratings,
-            watched_movie_ids=existing_ids,
-            top_n=n_content,
-            rec_service=rec_service,
-            num_source_movies=5
-        )
-        
-        added_content = 0
-        for movie, similarity, _, source_title in content_based_results:
-            if added_content >= n_content:
-                break
-            if movie.id not in existing_ids:
-                recommendations.append(
-                    movie_to_recommendation(
-                        movie=movie,
-                        predicted_score=round(similarity, 2),
-                        recommendation_type="content-based",
-                        reason=f"Tương tự '{source_title}'"
-                    )
-                )
-                existing_ids.add(movie.id)
-                added_content += 1
-    
-    # 3. Fill with popularity if needed
-    recommendations = fill_with_popular_movies(
-        db=db,
-        existing_recommendations=recommendations,
-        target_count=request.top_n,
-        exclude_movie_ids=existing_ids,
-        rec_service=rec_service
+    # --- Regular user: candidate generation from several sources + one ranking pass ---
+    recommendations = await run_in_threadpool(
+        _with_session,
+        _hybrid_recommendations,
+        user_id=request.user_id,
+        user_scores=user_ratings,
+        watched_movie_ids=watched_movie_ids,
+        collaborative_weight=request.collaborative_weight,
+        top_n=request.top_n
     )
     
     return RecommendationResponse(
@@ -307,8 +451,38 @@ async def get_personalized_recommendations(
     )
 
 
+@router.post("/fold-in")
+def fold_in_users(
+    request: FoldInRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Update latent vectors of users from their latest behaviors without a full retrain
+    
+    **Admin only** - Call after writing new user behaviors
+    
+    New users are added to the model; existing users are re-solved against the
+    current item factors.
+    """
+    cf_service = get_cf_service()
+    
+    if cf_service.user_factors is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Model chưa được train. Vui lòng gọi /train trước."
+        )
+    
+    result = cf_service.fold_in_users(request.user_ids, db)
+    publish_user_invalidations()
+    return {
+        "message": "Users folded in successfully",
+        **result
+    }
+
+
 @router.get("/predict/{user_id}/{movie_id}")
-async def predict_score(
+def predict_score(
     user_id: int, 
     movie_id: int,
     current_user: dict = Depends(get_current_user)  # Yêu cầu đăng nhập
@@ -336,34 +510,121 @@ async def predict_score(
 
 
 @router.get("/model/info")
-async def get_model_info(
+def get_model_info(
     current_user: dict = Depends(get_current_user)  # Yêu cầu đăng nhập
 ):
     """
     Get current model information and statistics
     
-    **Authentication required**
+    **Authentication required** - `worker` reports the model version loaded by the
+    worker that served the request and the CURRENT version on disk
     """
     cf_service = get_cf_service()
-    return cf_service.get_model_info()
+    return {**cf_service.get_model_info(), "worker": get_worker_model_status()}
 
 
-@router.post("/model/clear-cache")
-async def clear_cache(
+@router.get("/model/versions")
+def list_model_versions(
     current_user: dict = Depends(require_admin)  # Chỉ Admin
 ):
     """
-    Clear recommendation cache
+    List model versions kept on disk for rollback
+    
+    **Admin only**
+    """
+    cf_service = get_cf_service()
+    return {"versions": cf_service.list_model_versions()}
+
+
+@router.post("/model/rollback/{version}")
+def rollback_model(
+    version: int,
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Point the serving model to an older version and load it
+    
+    **Admin only** - Other workers load the same version on their next model store check.
+    Sync endpoint: loading the model runs in the threadpool, not on the event loop.
+    """
+    cf_service = get_cf_service()
+    try:
+        cf_service.model_store.set_current(version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    new_service = create_cf_service()
+    if new_service.model_version != version:
+        raise HTTPException(status_code=500, detail=f"Failed to load model version {version}")
+    
+    swap_cf_service(new_service)
+    return {
+        "message": f"Rolled back to model version {version}",
+        **new_service.get_model_info()
+    }
+
+
+@router.get("/model/ann")
+def evaluate_ann_index(
+    k: int = Query(10, ge=1, le=100, description="Recall cutoff"),
+    n_queries: int = Query(200, ge=1, le=5000, description="Number of sampled users"),
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Report recall@K and latency of the ANN item index against exact scoring, per nprobe
     
     **Admin only**
     """
     cf_service = get_cf_service()
-    cf_service.clear_cache()
-    return {"message": "Cache cleared successfully"}
+    
+    if cf_service.user_factors is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Model chưa được train. Vui lòng train model trước."
+        )
+    
+    return cf_service.evaluate_ann(k=k, n_queries=n_queries)
+
+
+@router.get("/model/precision")
+def evaluate_factor_precision(
+    k: int = Query(10, ge=1, le=100, description="Overlap cutoff"),
+    n_queries: int = Query(200, ge=1, le=5000, description="Number of sampled users"),
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Report factor memory and overlap@K of float16/int8 factor storage against float32
+    
+    **Admin only** - `serving_precision` is the storage used by this worker
+    (CF_SERVING_PRECISION)
+    """
+    cf_service = get_cf_service()
+    
+    if cf_service.user_factors is None or cf_service.model_version is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Model chưa được train. Vui lòng train model trước."
+        )
+    
+    return cf_service.evaluate_precision(k=k, n_queries=n_queries)
+
+
+@router.post("/model/clear-cache")
+def clear_cache(
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Clear recommendation cache
+    
+    **Admin only** - Cleared in this worker immediately and in the other workers
+    within MODEL_RELOAD_CHECK_SECONDS
+    """
+    clear_all_worker_caches()
+    return {"message": "Cache cleared successfully", "worker": get_worker_model_status()}
 
 
 @router.get("/user/{user_id}/status")
-async def get_user_status(
+def get_user_status(
     user_id: int, 
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)  # Yêu cầu đăng nhập
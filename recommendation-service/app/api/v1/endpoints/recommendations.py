@@ -10,7 +10,9 @@ from app.schemas.recommendation import (
 )
 from app.services.recommendation_service import RecommendationService
 from app.services.recommendation_helpers import movie_to_recommendation
-from app.api.v1.deps import get_current_user
+from app.services.leaderboards import get_leaderboards
+from app.services.trending import get_trending
+from app.api.v1.deps import get_current_user, require_admin
 
 router = APIRouter()
 
@@ -79,6 +81,51 @@ def get_top_rated_recommendations(
     )
 
 
+@router.get("/trending", response_model=RecommendationResponse)
+def get_trending_recommendations(
+    limit: int = Query(10, ge=1, le=50, description="Number of recommendations"),
+    genre: Optional[str] = Query(None, description="Only movies of this genre"),
+    db: Session = Depends(get_db)
+    # Public endpoint - không yêu cầu authentication
+):
+    """
+    Get movies trending right now: recent views/bookings/ratings, older activity decayed
+    
+    **Public endpoint** - No authentication required
+    
+    Served from in-memory decayed counters updated as behaviors are ingested
+    (no scan of user_behaviors per request).
+    """
+    results = get_trending().top(db, limit=limit, genre=genre)
+    
+    recommendations = [
+        movie_to_recommendation(
+            movie=movie,
+            predicted_score=round(score, 2),
+            recommendation_type="trending",
+            reason=f"Đang thịnh hành - {score:.1f} lượt tương tác gần đây"
+        )
+        for movie, score in results
+    ]
+    
+    return RecommendationResponse(
+        recommendations=recommendations,
+        total=len(recommendations),
+        method="trending",
+        genre=genre
+    )
+
+
+@router.get("/trending/info")
+def get_trending_info(
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Get status of the trending counters (size, snapshot sync, top-list refreshes)
+    """
+    return get_trending().stats()
+
+
 @router.get("/similar/{movie_id}", response_model=RecommendationResponse)
 def get_similar_movie_recommendations(
     movie_id: int,
@@ -189,5 +236,92 @@ def get_recommendations_by_genre(
         recommendations=recommendations,
         total=len(recommendations),
         method="genre-based",
-        based_on_movie_title=genre
-    )
\ No newline at end of file
+        genre=genre
+    )
+
+
+@router.get("/similar-index/info")
+def get_similar_index_info(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Get build report of the precomputed similar-movies index (build time, memory)
+    """
+    rec_service = RecommendationService(db)
+    index = rec_service.get_neighbor_index(db)
+    
+    if index is None:
+        raise HTTPException(status_code=404, detail="Chưa có đủ phim để build index")
+    
+    return {
+        "fingerprint": index.fingerprint,
+        "top_k": index.top_k,
+        "n_movies": len(index.movie_ids),
+        "index_bytes": index.nbytes,
+        "report": index.report
+    }
+
+
+@router.get("/similar-index/ann")
+def evaluate_similar_ann(
+    k: int = Query(10, ge=1, le=100, description="Recall cutoff"),
+    n_queries: int = Query(200, ge=1, le=5000, description="Number of sampled movies"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Report recall@K and latency of the TF-IDF ANN index against exact cosine, per nprobe
+    """
+    rec_service = RecommendationService(db)
+    try:
+        return rec_service.evaluate_content_ann(db, k=k, n_queries=n_queries)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/similar-index/rebuild")
+def rebuild_similar_index(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Force rebuild of the similar-movies index (e.g. after movie content updates)
+    """
+    RecommendationService.clear_content_cache()
+    rec_service = RecommendationService(db)
+    index = rec_service.get_neighbor_index(db, force_rebuild=True)
+    
+    if index is None:
+        raise HTTPException(status_code=404, detail="Chưa có đủ phim để build index")
+    
+    return {
+        "message": "Similar-movies index rebuilt",
+        "report": index.report
+    }
+
+
+@router.get("/leaderboards/info")
+def get_leaderboards_info(
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Get status of the in-memory popular/top-rated/genre leaderboards
+    """
+    return get_leaderboards().stats()
+
+
+@router.post("/leaderboards/refresh")
+def refresh_leaderboards(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)  # Chỉ Admin
+):
+    """
+    Force rebuild of the leaderboards (e.g. right after a catalog import)
+    """
+    leaderboards = get_leaderboards()
+    leaderboards.refresh(db, force=True)
+    return {
+        "message": "Leaderboards rebuilt",
+        **leaderboards.stats()
+    }
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from app.api.v1.endpoints import recommendations
 from app.api.v1.endpoints import collaborative
+from app.api.v1.endpoints import behaviors
 
 api_router = APIRouter()
 
@@ -14,4 +15,10 @@ api_router.include_router(
     collaborative.router,
     prefix="/collaborative",
     tags=["collaborative-filtering"]
+)
+
+api_router.include_router(
+    behaviors.router,
+    prefix="/behaviors",
+    tags=["behaviors"]
 )
\ No newline at end of file
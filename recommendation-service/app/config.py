@@ -13,6 +13,12 @@ class Settings(BaseSettings):
     # Database (will be loaded from Consul)
     DATABASE_URL: str = ""
     
+    # Connection pool (mỗi worker có một pool cho sync engine và một cho async engine)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    
     # Service
     SERVICE_NAME: str = "recommendation-service"
     SERVICE_PORT: int = 8002
@@ -24,6 +30,62 @@ class Settings(BaseSettings):
     # JWT
     JWT_SECRET_KEY: str = "your-secret-key"  # Default fallback
     
+    # Recommendation cache (per worker)
+    RECOMMENDATION_CACHE_SIZE: int = 10000
+    RECOMMENDATION_CACHE_TTL: float = 600.0
+    # Behaviors mới xóa cache của user ở worker nhận chúng ngay; các workers khác xóa
+    # toàn bộ cache, tối đa một lần mỗi CACHE_INVALIDATION_SECONDS (+ MODEL_RELOAD_CHECK_SECONDS)
+    CACHE_INVALIDATION_SECONDS: float = 15.0
+    
+    # ANN index (IVF) - chỉ dùng khi catalog có ít nhất ANN_MIN_ITEMS movies. ANN đổi recall
+    # lấy latency: ANN_NPROBE = 0 tự chọn nprobe nhỏ nhất đạt recall@10 >= ANN_TARGET_RECALL
+    # trên một sample queries khi build index; ANN_NPROBE > 0 cố định nprobe (recall có thể
+    # thấp hơn nhiều, vd. ~0.6 với nprobe=8 trên 5000 items ngẫu nhiên)
+    ANN_MIN_ITEMS: int = 50000
+    ANN_NPROBE: int = 0
+    ANN_TARGET_RECALL: float = 0.9
+    
+    # Dạng lưu user/item factors khi serve: float32 | float16 | int8 (per-row scale)
+    CF_SERVING_PRECISION: str = "float32"
+    
+    # Hybrid pipeline (/personalized): số candidates mỗi source và time budget mỗi stage
+    HYBRID_CANDIDATES_PER_SOURCE: int = 200
+    HYBRID_CANDIDATE_BUDGET_MS: float = 80.0
+    HYBRID_RANKING_BUDGET_MS: float = 30.0
+    
+    # Hyperparameters tốt nhất từ hyperparameter search (app/scripts/tune_cf.py)
+    CF_TUNED_CONFIG_PATH: str = "weights/cf_config.json"
+    
+    # Warm-up khi khởi động (CF model, content index, leaderboards, trending); /ready chờ warm-up xong
+    # (backfill user_movie_scores vẫn chạy khi WARMUP_ENABLED=false)
+    WARMUP_ENABLED: bool = True
+    # Stage lỗi được chạy lại sau WARMUP_RETRY_SECONDS (gấp đôi mỗi lần, tối đa 60s)
+    WARMUP_RETRY_SECONDS: float = 5.0
+    
+    # Trending: half-life của counters, snapshot dùng chung giữa workers, chu kỳ sync /
+    # tính lại top lists
+    TRENDING_HALF_LIFE_HOURS: float = 72.0
+    TRENDING_SNAPSHOT_PATH: str = "weights/trending.npz"
+    TRENDING_SYNC_SECONDS: float = 30.0
+    TRENDING_REFRESH_SECONDS: float = 5.0
+    
+    # Khoảng thời gian mỗi worker kiểm tra model version / cache generation trên disk
+    MODEL_RELOAD_CHECK_SECONDS: float = 5.0
+    
+    # Leaderboards (popular/top-rated/genre) - chu kỳ kiểm tra catalog thay đổi
+    LEADERBOARD_REFRESH_SECONDS: float = 300.0
+    
+    # Time decay của user_movie_scores (đổi giá trị cần rebuild bảng)
+    SCORE_HALF_LIFE_DAYS: float = 30.0
+    
+    # Behavior ingestion (NDJSON): buffer per worker, flush theo batch/chu kỳ
+    INGEST_BUFFER_SIZE: int = 100000
+    INGEST_FLUSH_BATCH_SIZE: int = 5000
+    INGEST_FLUSH_INTERVAL: float = 1.0
+    INGEST_MAX_EVENTS_PER_REQUEST: int = 50000
+    # created_at muộn hơn now quá mức lệch đồng hồ này (giây) bị từ chối
+    INGEST_MAX_CLOCK_SKEW_SECONDS: float = 300.0
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
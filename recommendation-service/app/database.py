@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -8,14 +10,61 @@ database_url = settings.DATABASE_URL
 if database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
+
+def _pool_kwargs(url: URL) -> dict:
+    """Pool settings cho QueuePool (SQLite dùng pool mặc định của dialect)"""
+    if url.get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE
+    }
+
+
+def to_async_url(url: str) -> URL:
+    """
+    Đổi DATABASE_URL sang async driver: postgresql -> asyncpg, sqlite -> aiosqlite
+
+    asyncpg không nhận sslmode của libpq, chuyển thành tham số ssl.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        query = dict(parsed.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return parsed.set(drivername="postgresql+asyncpg", query=query)
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    return parsed
+
+
 engine = create_engine(
     database_url,
     pool_pre_ping=True,
-    echo=settings.DEBUG
+    echo=settings.DEBUG,
+    **_pool_kwargs(make_url(database_url))
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine cho request path của các async endpoints (không block event loop khi chờ DB)
+_async_url = to_async_url(database_url)
+async_engine = create_async_engine(
+    _async_url,
+    pool_pre_ping=True,
+    echo=settings.DEBUG,
+    **_pool_kwargs(_async_url)
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
@@ -28,6 +77,12 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency for async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """Initialize database - create tables for user interactions (future use)"""
     # Import models here to register them
@@ -1,8 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.config import settings
 from app.api.v1.routers import api_router
 from app.database import init_db
+from app.services.behavior_ingestion import shutdown_behavior_ingestor
+from app.services.collaborative_service import start_model_reload, stop_model_reload
+from app.services.trending import shutdown_trending
+from app.services.metrics import metrics
+from app.services.warmup import get_warmup, start_warmup
 
 app = FastAPI(
     title=settings.SERVICE_NAME,
@@ -28,9 +34,24 @@ app.include_router(api_router, prefix=settings.API_V1_PREFIX)
 async def startup_event():
     """Initialize database on startup"""
     init_db()
+    
+    # Backfill user_movie_scores, CF model, content index, leaderboards: chạy trong
+    # background thread, /ready báo sẵn sàng khi xong
+    start_warmup()
+    # Kiểm tra model store (model mới, cache resets) trong background thread
+    start_model_reload()
     print(f"🎯 {settings.SERVICE_NAME} started on port {settings.SERVICE_PORT}")
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    """Flush behaviors còn trong buffer trước khi dừng, rồi ghi trending counters vào snapshot"""
+    get_warmup().stop()
+    stop_model_reload()
+    shutdown_behavior_ingestor()
+    shutdown_trending()
+
+
 @app.get("/")
 async def root():
     return {
@@ -46,6 +67,22 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 khi mọi warm-up stage của worker đã thành công, 503 trong lúc warm-up
+    hoặc khi còn stage lỗi đang được chạy lại"""
+    status = get_warmup().status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/metrics")
+async def get_metrics(format: str = "prometheus"):
+    """Metrics của worker này (Prometheus text format, hoặc ?format=json)"""
+    if format == "json":
+        return JSONResponse(metrics.snapshot())
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -1,4 +1,5 @@
 from app.models.movie import Movie
 from app.models.user_behavior import UserBehavior
+from app.models.user_movie_score import UserMovieScore
 
-__all__ = ["Movie", "UserBehavior"]
\ No newline at end of file
+__all__ = ["Movie", "UserBehavior", "UserMovieScore"]
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, Float, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+class UserMovieScore(Base):
+    """
+    Điểm tổng hợp theo cặp (user, movie), cập nhật khi ghi user behaviors
+
+    score được lưu theo forward decay (xem app/services/user_scores.py):
+    giá trị hiện tại = score * 2^(-(now - DECAY_EPOCH) / half_life)
+    """
+    __tablename__ = "user_movie_scores"
+    
+    user_id = Column(Integer, primary_key=True)
+    movie_id = Column(Integer, primary_key=True)
+    score = Column(Float, nullable=False, default=0.0)
+    interaction_count = Column(Integer, nullable=False, default=0)
+    last_interaction_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<UserMovieScore(user_id={self.user_id}, movie_id={self.movie_id}, interactions={self.interaction_count})>"
@@ -3,6 +3,8 @@ from app.schemas.recommendation import (
     RecommendationResponse,
     RecommendationRequest,
     CollaborativeRequest,
+    BatchRecommendationRequest,
+    FoldInRequest,
     ContentBasedRequest,
     PopularMoviesParams,
     TopRatedParams,
@@ -18,6 +20,8 @@ __all__ = [
     'RecommendationResponse',
     'RecommendationRequest',
     'CollaborativeRequest',
+    'BatchRecommendationRequest',
+    'FoldInRequest',
     'ContentBasedRequest',
     'PopularMoviesParams',
     'TopRatedParams',
@@ -18,7 +18,7 @@ class MovieRecommendation(BaseModel):
     # Recommendation metadata
     predicted_score: Optional[float] = Field(None, description="CF predicted score or similarity score")
     similarity_score: Optional[float] = Field(None, description="Content-based similarity score (deprecated, use predicted_score)")
-    recommendation_type: Literal["collaborative", "content-based", "popularity", "hybrid"] = Field(
+    recommendation_type: Literal["collaborative", "content-based", "co-watch", "trending", "popularity", "hybrid"] = Field(
         default="popularity",
         description="Type of recommendation algorithm used"
     )
@@ -35,6 +35,7 @@ class RecommendationResponse(BaseModel):
     method: str = Field(description="Algorithm method used")
     based_on_movie_id: Optional[int] = None
     based_on_movie_title: Optional[str] = None
+    genre: Optional[str] = Field(default=None, description="Genre filter applied to the results")
     user_id: Optional[int] = None
     is_cold_start: Optional[bool] = None
 
@@ -58,6 +59,18 @@ class CollaborativeRequest(BaseModel):
     top_n: int = Field(default=10, ge=1, le=50)
 
 
+class BatchRecommendationRequest(BaseModel):
+    """Request for collaborative recommendations of many users at once"""
+    user_ids: List[int] = Field(min_length=1, max_length=100000)
+    top_n: int = Field(default=10, ge=1, le=50)
+    exclude_watched: bool = Field(default=True, description="Exclude movies user has already watched")
+
+
+class FoldInRequest(BaseModel):
+    """Request to fold new behaviors of users into the collaborative model"""
+    user_ids: List[int] = Field(min_length=1, max_length=1000)
+
+
 class ContentBasedRequest(BaseModel):
     """Request for content-based recommendations"""
     movie_id: int
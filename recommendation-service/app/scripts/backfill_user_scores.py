@@ -0,0 +1,51 @@
+import sys
+import time
+from pathlib import Path
+
+# Thêm root directory vào Python path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.config import settings
+from app.database import SessionLocal, engine, Base
+from app.services.user_scores import rebuild_user_movie_scores
+
+
+def backfill(batch_size: int):
+    """
+    Tính lại user_movie_scores từ toàn bộ user_behaviors
+    """
+    db = SessionLocal()
+    try:
+        # Tạo tables nếu chưa có
+        Base.metadata.create_all(bind=engine)
+        
+        start = time.perf_counter()
+        result = rebuild_user_movie_scores(db, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        
+        print(f"✓ {result['behaviors']} behaviors -> {result['pairs']} user-movie pairs "
+              f"(half-life {settings.SCORE_HALF_LIFE_DAYS} days) in {elapsed:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"\n✗ Error: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Rebuild user_movie_scores from user_behaviors')
+    parser.add_argument('--batch-size', type=int, default=50000,
+                       help='Rows fetched per batch while streaming user_behaviors')
+    
+    args = parser.parse_args()
+    
+    print("="*60)
+    print("BACKFILL USER MOVIE SCORES")
+    print("="*60)
+    
+    backfill(args.batch_size)
@@ -0,0 +1,488 @@
+"""
+Offline evaluation + latency benchmark cho các recommendation strategies
+
+Chạy hoàn toàn local: mỗi scale dùng một SQLite in-memory database, không cần
+Postgres hay Consul. Dữ liệu là synthetic (thể loại/đạo diễn/diễn viên, users có
+sở thích thể loại, popularity lệch) hoặc copy từ DATABASE_URL với --from-db.
+
+User behaviors được chia theo thời gian: chỉ train period được ghi vào database
+dùng để train/serve, test period dùng làm ground truth.
+
+Báo cáo cho từng strategy (popularity, content-based, cf-<engine>, hybrid):
+- precision@K, recall@K, NDCG@K, catalog coverage
+- thời gian build/train và peak memory (tracemalloc)
+- p50/p99 latency mỗi request, cùng với recommend() và
+  get_similar_movies_content_based()
+
+Ví dụ:
+    python app/scripts/benchmark.py --scales 1000:500 5000:2000 --engines als als_implicit
+"""
+import os
+import sys
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+# Thêm root directory vào Python path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+# Benchmark không cần Consul/Postgres (app.config đọc các biến này khi import)
+os.environ.setdefault("CONSUL_ADDR", "http://127.0.0.1:8500")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.config import settings
+from app.database import Base
+from app.models.movie import Movie
+from app.models.user_behavior import UserBehavior
+from app.services.collaborative_service import CollaborativeFilteringService, TRAINING_ENGINES
+from app.services.evaluation import evaluate_rankings, latency_percentiles, time_based_split
+from app.services.leaderboards import get_leaderboards
+from app.services.recommendation_helpers import (
+    get_content_based_from_user_history,
+    get_user_watched_movies
+)
+from app.services.recommendation_service import RecommendationService
+from app.services.user_scores import record_behaviors
+
+# Định nghĩa behavior scores (giống seed.py)
+BEHAVIOR_SCORES = {
+    'view': 1.0,
+    'book': 3.0,
+    'rate': 5.0,
+}
+
+GENRES = [
+    'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Drama',
+    'Family', 'Fantasy', 'Film-Noir', 'History', 'Horror', 'Music', 'Musical',
+    'Mystery', 'Romance', 'Sci-Fi', 'Sport', 'Thriller', 'War', 'Western'
+]
+
+# Tỷ lệ CF trong hybrid (giống default collaborative_weight của /personalized)
+HYBRID_COLLABORATIVE_WEIGHT = 0.7
+
+
+class Behavior(NamedTuple):
+    user_id: int
+    movie_id: int
+    behavior: str
+    score: float
+    created_at: datetime
+
+
+def generate_movies(n_movies: int, seed: int = 42) -> List[Dict]:
+    """
+    Tạo catalog giả lập: mỗi movie có 1-3 thể loại, overview lấy từ từ vựng
+    của thể loại chính, đạo diễn/diễn viên lặp lại giữa các movies
+    """
+    rng = np.random.RandomState(seed)
+    genre_words = {
+        genre: [f"{genre.lower()}_{i}" for i in range(40)] for genre in GENRES
+    }
+    n_directors = max(1, n_movies // 5)
+    n_stars = max(4, n_movies // 2)
+    popularity_rank = rng.permutation(n_movies)
+
+    movies = []
+    for movie_id in range(1, n_movies + 1):
+        n_genres = rng.randint(1, 4)
+        genres = list(rng.choice(GENRES, n_genres, replace=False))
+        words = rng.choice(genre_words[genres[0]], 12)
+        stars = rng.choice(n_stars, 4, replace=False)
+        movies.append({
+            'id': movie_id,
+            'series_title': f"Movie {movie_id}",
+            'released_year': str(1950 + rng.randint(0, 75)),
+            'genre': ', '.join(genres),
+            'imdb_rating': round(float(rng.uniform(5.0, 9.3)), 1),
+            'meta_score': int(rng.randint(40, 100)),
+            'director': f"Director {rng.randint(n_directors)}",
+            'overview': ' '.join(words),
+            'star1': f"Star {stars[0]}",
+            'star2': f"Star {stars[1]}",
+            'star3': f"Star {stars[2]}",
+            'star4': f"Star {stars[3]}",
+            # Popularity lệch (Zipf-like) theo thứ tự ngẫu nhiên
+            'no_of_votes': int(2_000_000 / (1 + popularity_rank[movie_id - 1]) ** 0.8)
+        })
+    return movies
+
+
+def generate_behaviors(
+    n_users: int,
+    movies: List[Dict],
+    behaviors_per_user: int = 30,
+    days: int = 90,
+    seed: int = 42
+) -> List[Behavior]:
+    """
+    Tạo user behaviors: mỗi user thích 2 thể loại, xác suất chọn movie tỷ lệ với
+    popularity và tăng mạnh nếu movie thuộc thể loại yêu thích
+    """
+    rng = np.random.RandomState(seed)
+    movie_ids = np.array([m['id'] for m in movies])
+    popularity = np.array([m['no_of_votes'] for m in movies], dtype=np.float64) ** 0.5
+    genre_sets = [set(m['genre'].split(', ')) for m in movies]
+    in_genre = {
+        genre: np.array([genre in genres for genres in genre_sets]) for genre in GENRES
+    }
+
+    behavior_names = list(BEHAVIOR_SCORES.keys())
+    start = datetime.now() - timedelta(days=days)
+    behaviors = []
+
+    for user_id in range(1, n_users + 1):
+        liked = rng.choice(GENRES, 2, replace=False)
+        weights = popularity * (1.0 + 8.0 * (in_genre[liked[0]] | in_genre[liked[1]]))
+        weights /= weights.sum()
+
+        n_behaviors = min(len(movie_ids), 3 + rng.poisson(behaviors_per_user))
+        chosen = rng.choice(len(movie_ids), n_behaviors, replace=False, p=weights)
+        for idx in chosen:
+            behavior = behavior_names[rng.choice(3, p=[0.5, 0.3, 0.2])]
+            behaviors.append(Behavior(
+                user_id=user_id,
+                movie_id=int(movie_ids[idx]),
+                behavior=behavior,
+                score=BEHAVIOR_SCORES[behavior],
+                created_at=start + timedelta(seconds=float(rng.uniform(0, days * 86400)))
+            ))
+    return behaviors
+
+
+def load_from_db() -> Tuple[List[Dict], List[Behavior]]:
+    """
+    Lấy movies và user behaviors thật từ DATABASE_URL
+    """
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        columns = [c.name for c in Movie.__table__.columns if c.name not in ('created_at', 'updated_at')]
+        movies = [dict(row._mapping) for row in db.query(*[getattr(Movie, c) for c in columns]).all()]
+        behaviors = [
+            Behavior(b.user_id, b.movie_id, b.behavior, b.score, b.created_at)
+            for b in db.query(UserBehavior).filter(UserBehavior.created_at.isnot(None)).all()
+        ]
+        return movies, behaviors
+    finally:
+        db.close()
+
+
+def create_database(movies: List[Dict], behaviors: List[Behavior]) -> sessionmaker:
+    """
+    SQLite in-memory database với movies + behaviors (chỉ train period) và user_movie_scores
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Movie), movies)
+        if behaviors:
+            conn.execute(insert(UserBehavior), [b._asdict() for b in behaviors])
+
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    try:
+        record_behaviors(db, behaviors)
+        db.commit()
+    finally:
+        db.close()
+    return SessionFactory
+
+
+def measure(fn: Callable, track_memory: bool = True) -> Tuple[object, float, Optional[int]]:
+    """
+    Chạy fn, trả về (result, seconds, peak bytes theo tracemalloc)
+    """
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn()
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = None
+        if track_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def popular_ids(rec_service: RecommendationService, watched: Set[int], k: int) -> List[int]:
+    popular = rec_service.get_popular_movies(limit=k + len(watched))
+    return [movie.id for movie, _ in popular if movie.id not in watched][:k]
+
+
+def content_ids(db: Session, rec_service: RecommendationService, user_id: int, k: int) -> List[int]:
+    user_behaviors, watched = get_user_watched_movies(db, user_id)
+    results = get_content_based_from_user_history(
+        db=db,
+        user_behaviors=user_behaviors,
+        watched_movie_ids=watched,
+        top_n=k,
+        rec_service=rec_service,
+        num_source_movies=5
+    )
+    return [movie.id for movie, _, _, _ in results][:k]
+
+
+def hybrid_ids(
+    db: Session,
+    rec_service: RecommendationService,
+    cf_service: CollaborativeFilteringService,
+    user_id: int,
+    k: int
+) -> List[int]:
+    """
+    Cùng cách trộn với /collaborative/personalized cho user đã có model:
+    CF top n_collaborative + content-based phần còn lại + fill bằng popular
+    """
+    user_behaviors, watched = get_user_watched_movies(db, user_id)
+    n_collaborative = int(k * HYBRID_COLLABORATIVE_WEIGHT)
+    n_content = k - n_collaborative
+
+    recommended = [
+        movie_id for movie_id, _ in cf_service.recommend(user_id, n_collaborative, exclude_watched=True, db=db)
+    ]
+    existing = watched | set(recommended)
+
+    if n_content > 0:
+        results = get_content_based_from_user_history(
+            db=db,
+            user_behaviors=user_behaviors,
+            watched_movie_ids=existing,
+            top_n=n_content,
+            rec_service=rec_service,
+            num_source_movies=5
+        )
+        added = [movie.id for movie, _, _, _ in results if movie.id not in existing][:n_content]
+        recommended += added
+        existing.update(added)
+
+    if len(recommended) < k:
+        recommended += popular_ids(rec_service, existing, k - len(recommended))
+    return recommended[:k]
+
+
+def run_strategy(users: List[int], recommend: Callable[[int], List[int]]) -> Tuple[Dict[int, List[int]], List[float]]:
+    """Gọi recommend cho từng user, trả về (recommendations, latency samples)"""
+    recommendations, samples = {}, []
+    for user_id in users:
+        start = time.perf_counter()
+        recommendations[user_id] = recommend(user_id)
+        samples.append(time.perf_counter() - start)
+    return recommendations, samples
+
+
+def benchmark_scale(
+    label: str,
+    movies: List[Dict],
+    behaviors: List[Behavior],
+    args,
+    work_dir: Path
+) -> Dict:
+    """
+    Chạy toàn bộ strategies trên một dataset
+    """
+    k = args.k
+    train, test, cutoff = time_based_split(behaviors, args.test_fraction)
+
+    train_watched: Dict[int, Set[int]] = {}
+    for b in train:
+        train_watched.setdefault(b.user_id, set()).add(b.movie_id)
+    relevant: Dict[int, Set[int]] = {}
+    for b in test:
+        if b.user_id in train_watched and b.movie_id not in train_watched[b.user_id]:
+            relevant.setdefault(b.user_id, set()).add(b.movie_id)
+
+    eval_users = sorted(relevant)
+    if len(eval_users) > args.max_eval_users:
+        eval_users = sorted(random.Random(args.seed).sample(eval_users, args.max_eval_users))
+
+    print(f"\n[{label}] movies={len(movies)}, behaviors={len(behaviors)} "
+          f"(train={len(train)}, test={len(test)}, cutoff={cutoff}), eval users={len(eval_users)}")
+
+    SessionFactory = create_database(movies, train)
+    db = SessionFactory()
+
+    # Cache per-process của service được build lại cho database này
+    RecommendationService.clear_content_cache()
+    RecommendationService.NEIGHBOR_INDEX_PATH = str(work_dir / label / "content_index")
+    rec_service = RecommendationService(db)
+
+    report = {
+        "label": label,
+        "n_movies": len(movies),
+        "n_users": len({b.user_id for b in behaviors}),
+        "n_behaviors": len(behaviors),
+        "n_train": len(train),
+        "n_test": len(test),
+        "n_eval_users": len(eval_users),
+        "k": k,
+        "strategies": {},
+        "latency": {}
+    }
+    strategies = report["strategies"]
+
+    try:
+        # Popularity: leaderboards build
+        _, build_seconds, peak = measure(lambda: get_leaderboards().refresh(db, force=True), args.memory)
+        recs, samples = run_strategy(eval_users, lambda u: popular_ids(rec_service, train_watched[u], k))
+        strategies["popularity"] = {
+            **evaluate_rankings(recs, relevant, k, len(movies)),
+            "build_seconds": round(build_seconds, 3), "peak_memory_bytes": peak,
+            "latency": latency_percentiles(samples)
+        }
+
+        # Content-based: TF-IDF + neighbor index build
+        _, build_seconds, peak = measure(lambda: rec_service.get_neighbor_index(db, force_rebuild=True), args.memory)
+        recs, samples = run_strategy(eval_users, lambda u: content_ids(db, rec_service, u, k))
+        strategies["content"] = {
+            **evaluate_rankings(recs, relevant, k, len(movies)),
+            "build_seconds": round(build_seconds, 3), "peak_memory_bytes": peak,
+            "latency": latency_percentiles(samples)
+        }
+
+        movie_sample = random.Random(args.seed).sample(
+            [m['id'] for m in movies], min(args.latency_samples, len(movies))
+        )
+        _, samples = run_strategy(
+            movie_sample, lambda m: rec_service.get_similar_movies_content_based(db, m, limit=k)
+        )
+        report["latency"]["get_similar_movies_content_based"] = latency_percentiles(samples)
+
+        # Collaborative filtering: mỗi engine một model (cache tắt để đo đúng latency)
+        cf_services = {}
+        for engine in args.engines:
+            cf_service = CollaborativeFilteringService(
+                n_iterations=args.sgd_iterations,
+                model_path=str(work_dir / label / f"cf_model_{engine}"),
+                legacy_model_path=None,
+                cache_size=0,
+                ann_min_items=settings.ANN_MIN_ITEMS,
+                ann_nprobe=settings.ANN_NPROBE
+            )
+            _, train_seconds, peak = measure(lambda: cf_service.train(db, verbose=False, engine=engine), args.memory)
+            recs, samples = run_strategy(
+                eval_users,
+                lambda u: [m for m, _ in cf_service.recommend(u, k, exclude_watched=True, db=db)]
+            )
+            strategies[f"cf-{engine}"] = {
+                **evaluate_rankings(recs, relevant, k, len(movies)),
+                "build_seconds": round(train_seconds, 3), "peak_memory_bytes": peak,
+                "latency": latency_percentiles(samples)
+            }
+            report["latency"][f"recommend[{engine}]"] = latency_percentiles(samples)
+            cf_services[engine] = cf_service
+
+        # Hybrid: CF engine đầu tiên + content-based
+        engine = args.engines[0]
+        recs, samples = run_strategy(
+            eval_users, lambda u: hybrid_ids(db, rec_service, cf_services[engine], u, k)
+        )
+        strategies["hybrid"] = {
+            **evaluate_rankings(recs, relevant, k, len(movies)),
+            "build_seconds": round(strategies["content"]["build_seconds"] + strategies[f"cf-{engine}"]["build_seconds"], 3),
+            "peak_memory_bytes": None,
+            "latency": latency_percentiles(samples)
+        }
+    finally:
+        db.close()
+
+    return report
+
+
+def format_bytes(n: Optional[int]) -> str:
+    return "-" if n is None else f"{n / 1024 / 1024:.1f}MB"
+
+
+def print_report(report: Dict):
+    k = report["k"]
+    print(f"\n{'strategy':<18}{'P@' + str(k):>8}{'R@' + str(k):>8}{'NDCG':>8}{'cover':>8}"
+          f"{'build':>10}{'peak mem':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, s in report["strategies"].items():
+        print(f"{name:<18}{s['precision']:>8.4f}{s['recall']:>8.4f}{s['ndcg']:>8.4f}{s['coverage']:>8.3f}"
+              f"{s['build_seconds']:>9.2f}s{format_bytes(s['peak_memory_bytes']):>10}"
+              f"{s['latency']['p50_ms']:>9}{s['latency']['p99_ms']:>9}")
+    for name, latency in report["latency"].items():
+        print(f"  {name}: p50={latency['p50_ms']}ms p99={latency['p99_ms']}ms (n={latency['n']})")
+
+
+def parse_scale(value: str) -> Tuple[int, int]:
+    n_movies, n_users = value.split(':')
+    return int(n_movies), int(n_users)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Offline evaluation and latency benchmark of recommendation strategies')
+    parser.add_argument('--from-db', action='store_true',
+                       help='Use movies and user_behaviors from DATABASE_URL instead of synthetic data')
+    parser.add_argument('--scales', nargs='+', type=parse_scale, default=[(1000, 500), (5000, 2000)],
+                       help='Synthetic scales as MOVIES:USERS')
+    parser.add_argument('--behaviors-per-user', type=int, default=30, help='Average behaviors per synthetic user')
+    parser.add_argument('--test-fraction', type=float, default=0.2, help='Newest fraction of behaviors used as test set')
+    parser.add_argument('--k', type=int, default=10, help='Cutoff for precision/recall/NDCG')
+    parser.add_argument('--max-eval-users', type=int, default=500, help='Maximum number of evaluated users per scale')
+    parser.add_argument('--latency-samples', type=int, default=200, help='Movies sampled for similar-movies latency')
+    parser.add_argument('--engines', nargs='+', choices=TRAINING_ENGINES, default=['als'],
+                       help='CF engines to evaluate (the first one is used by hybrid)')
+    parser.add_argument('--sgd-iterations', type=int, default=100, help='SGD epochs')
+    parser.add_argument('--ann-min-items', type=int, default=None,
+                       help='Override ANN_MIN_ITEMS (e.g. 0 to benchmark the ANN paths)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                       help='Skip tracemalloc (it slows down pure-Python training such as SGD)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', type=str, default=None, help='Write the full report as JSON')
+
+    args = parser.parse_args()
+
+    if args.ann_min_items is not None:
+        settings.ANN_MIN_ITEMS = args.ann_min_items
+
+    if args.from_db:
+        movies, behaviors = load_from_db()
+        datasets = [("db", movies, behaviors)]
+    else:
+        datasets = []
+        for n_movies, n_users in args.scales:
+            movies = generate_movies(n_movies, seed=args.seed)
+            behaviors = generate_behaviors(n_users, movies, args.behaviors_per_user, seed=args.seed)
+            datasets.append((f"{n_movies}x{n_users}", movies, behaviors))
+
+    print("=" * 60)
+    print("RECOMMENDATION BENCHMARK")
+    print(f"  - Datasets: {', '.join(label for label, _, _ in datasets)}")
+    print(f"  - K={args.k}, engines={args.engines}, test fraction={args.test_fraction}")
+    print("=" * 60)
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, movies, behaviors in datasets:
+            if not movies or not behaviors:
+                print(f"[{label}] Không có dữ liệu để đánh giá")
+                continue
+            report = benchmark_scale(label, movies, behaviors, args, Path(tmp_dir))
+            print_report(report)
+            reports.append(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2, default=str)
+        print(f"\n✓ Report saved to {args.output}")
@@ -0,0 +1,113 @@
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Thêm root directory vào Python path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.services.collaborative_service import CollaborativeFilteringService, TRAINING_ENGINES
+
+# Định nghĩa behavior scores (giống seed.py)
+BEHAVIOR_SCORES = [1.0, 3.0, 5.0]
+
+
+def generate_rating_data(n_users: int, n_movies: int, n_ratings: int, seed: int = 42):
+    """
+    Tạo sparse rating data giả lập với phân phối popularity lệch (Zipf-like)
+    """
+    rng = np.random.RandomState(seed)
+    popularity = 1.0 / np.arange(1, n_movies + 1) ** 0.8
+    popularity /= popularity.sum()
+
+    users = rng.randint(0, n_users, n_ratings)
+    movies = rng.choice(n_movies, n_ratings, p=popularity)
+    scores = rng.choice(BEHAVIOR_SCORES, n_ratings, p=[0.5, 0.3, 0.2])
+
+    # Aggregate theo user-movie giống GROUP BY trong _build_sparse_rating_data
+    keys = users.astype(np.int64) * n_movies + movies
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse, weights=scores)
+
+    rating_data = [
+        (int(k // n_movies), int(k % n_movies), float(total))
+        for k, total in zip(unique_keys, totals)
+    ]
+    user_id_map = {user_id: user_id for user_id in range(n_users)}
+    movie_id_map = {movie_id: movie_id for movie_id in range(n_movies)}
+    return rating_data, user_id_map, movie_id_map
+
+
+def load_rating_data_from_db():
+    """
+    Lấy rating data thật từ bảng user_behaviors
+    """
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        service = CollaborativeFilteringService(
+            model_path=str(Path(tempfile.mkdtemp()) / "cf_model"),
+            legacy_model_path=None
+        )
+        return service._build_sparse_rating_data(db)
+    finally:
+        db.close()
+
+
+def compare(rating_data, user_id_map, movie_id_map, engines, n_iterations: int):
+    """
+    Train cùng một dataset với từng engine và đo thời gian
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for engine in engines:
+            service = CollaborativeFilteringService(
+                n_iterations=n_iterations,
+                model_path=str(Path(tmp_dir) / f"cf_model_{engine}"),
+                legacy_model_path=None
+            )
+            start = time.perf_counter()
+            result = service.fit(rating_data, user_id_map, movie_id_map, engine=engine, verbose=False)
+            elapsed = time.perf_counter() - start
+            results.append((engine, elapsed, result["final_rmse"]))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare SGD and ALS training time on the same data')
+    parser.add_argument('--from-db', action='store_true',
+                       help='Use user_behaviors from the database instead of synthetic data')
+    parser.add_argument('--users', type=int, default=2000, help='Number of synthetic users')
+    parser.add_argument('--movies', type=int, default=1000, help='Number of synthetic movies')
+    parser.add_argument('--ratings', type=int, default=50000, help='Number of synthetic behaviors')
+    parser.add_argument('--sgd-iterations', type=int, default=100, help='SGD epochs')
+    parser.add_argument('--engines', nargs='+', choices=TRAINING_ENGINES, default=list(TRAINING_ENGINES))
+
+    args = parser.parse_args()
+
+    if args.from_db:
+        rating_data, user_id_map, movie_id_map = load_rating_data_from_db()
+    else:
+        rating_data, user_id_map, movie_id_map = generate_rating_data(args.users, args.movies, args.ratings)
+
+    if not rating_data:
+        print("Không có dữ liệu để train model")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("COMPARE CF TRAINING ENGINES")
+    print(f"  - Users: {len(user_id_map)}, Movies: {len(movie_id_map)}, Ratings: {len(rating_data)}")
+    print("=" * 60)
+
+    results = compare(rating_data, user_id_map, movie_id_map, args.engines, args.sgd_iterations)
+
+    baseline = next((elapsed for engine, elapsed, _ in results if engine == "sgd"), None)
+    for engine, elapsed, rmse in results:
+        speedup = f"{baseline / elapsed:.1f}x" if baseline else "-"
+        print(f"{engine:<14} time={elapsed:8.2f}s  rmse={rmse:.4f}  speedup vs sgd={speedup}")
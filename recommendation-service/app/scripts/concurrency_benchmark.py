@@ -0,0 +1,217 @@
+"""
+Concurrency benchmark cho các async endpoints của collaborative API
+
+Gửi requests song song (httpx.AsyncClient) tới một service đang chạy, với nhiều
+mức concurrency, và báo cáo cho từng endpoint:
+- throughput (requests/giây), p50/p99 latency, số lỗi
+- latency của /health đo song song trong lúc tải (event loop bị block bởi DB/CPU
+  sync thì /health chậm theo)
+
+So sánh trước/sau một thay đổi: chạy với phiên bản cũ và lưu --output, rồi chạy
+với phiên bản mới kèm --compare <file cũ>.
+
+Ví dụ:
+    uvicorn app.main:app --port 8002 --workers 1
+    python app/scripts/concurrency_benchmark.py --concurrency 1 16 64 --requests 2000 --output before.json
+    python app/scripts/concurrency_benchmark.py --concurrency 1 16 64 --requests 2000 --compare before.json
+"""
+import sys
+import json
+import asyncio
+import random
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import jwt
+
+# Thêm root directory vào Python path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.config import settings
+from app.services.evaluation import latency_percentiles
+
+ENDPOINTS = {
+    'recommendations': '/api/v1/collaborative/recommendations',
+    'personalized': '/api/v1/collaborative/personalized',
+}
+
+# Khoảng cách giữa hai lần probe /health (giây)
+HEALTH_PROBE_INTERVAL = 0.05
+
+
+def make_token(secret: str, user_id: int = 1, role: str = "SUPER_ADMIN") -> str:
+    """JWT giống format của user service (userId/sub/role)"""
+    return jwt.encode({"userId": user_id, "sub": "benchmark@local", "role": role}, secret, algorithm="HS256")
+
+
+def load_user_ids(n_users: int, seed: int) -> List[int]:
+    """Lấy ngẫu nhiên n_users user có behaviors từ DATABASE_URL"""
+    from app.database import SessionLocal
+    from app.services.user_scores import get_interaction_counts
+
+    db = SessionLocal()
+    try:
+        user_ids = sorted(get_interaction_counts(db))
+    finally:
+        db.close()
+    if not user_ids:
+        raise SystemExit("Không có user nào trong user_movie_scores, truyền --user-ids")
+    random.Random(seed).shuffle(user_ids)
+    return user_ids[:n_users]
+
+
+async def _probe_health(client: httpx.AsyncClient, stop: asyncio.Event, samples: List[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get("/health")
+            samples.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(HEALTH_PROBE_INTERVAL)
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    path: str,
+    user_ids: List[int],
+    concurrency: int,
+    n_requests: int,
+    top_n: int,
+    seed: int
+) -> Dict:
+    """Chạy n_requests requests với concurrency workers, trả về throughput + latency"""
+    rng = random.Random(seed)
+    bodies = [{"user_id": rng.choice(user_ids), "top_n": top_n} for _ in range(n_requests)]
+    latencies: List[float] = []
+    health_samples: List[float] = []
+    errors: Dict[str, int] = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < n_requests:
+            body = bodies[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe_health(client, stop, health_samples))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        "latency": latency_percentiles(latencies),
+        "health_latency": latency_percentiles(health_samples),
+        "errors": errors
+    }
+
+
+async def run_benchmark(args) -> Dict:
+    token = args.token or make_token(settings.JWT_SECRET_KEY)
+    user_ids = args.user_ids or load_user_ids(args.n_users, args.seed)
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 1)
+
+    report = {"base_url": args.base_url, "n_users": len(user_ids), "top_n": args.top_n, "results": {}}
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=args.timeout,
+        limits=limits
+    ) as client:
+        for name in args.endpoints:
+            path = ENDPOINTS[name]
+            # Warm-up: load model/content caches trước khi đo
+            await run_level(client, path, user_ids, 4, min(50, args.requests), args.top_n, args.seed)
+
+            levels = []
+            for concurrency in args.concurrency:
+                if args.clear_cache:
+                    try:
+                        await client.post("/api/v1/collaborative/model/clear-cache")
+                    except httpx.HTTPError as e:
+                        print(f"  ⚠️  clear-cache failed: {type(e).__name__}")
+                result = await run_level(client, path, user_ids, concurrency, args.requests, args.top_n, args.seed)
+                levels.append(result)
+                print(
+                    f"  {name:<16} c={concurrency:<4} {result['throughput_rps']} req/s  "
+                    f"p50={result['latency']['p50_ms']}ms p99={result['latency']['p99_ms']}ms  "
+                    f"health p99={result['health_latency']['p99_ms']}ms  errors={result['errors'] or 0}"
+                )
+            report["results"][name] = levels
+    return report
+
+
+def print_comparison(report: Dict, baseline: Dict):
+    """In throughput/p99 của report so với baseline (cùng endpoint + concurrency)"""
+    print("\nSo sánh với baseline:")
+    print(f"  {'endpoint':<16} {'c':>4} {'rps before':>11} {'rps after':>10} {'x':>6} {'p99 before':>11} {'p99 after':>10}")
+    for name, levels in report["results"].items():
+        before_levels = {r["concurrency"]: r for r in baseline.get("results", {}).get(name, [])}
+        for after in levels:
+            before = before_levels.get(after["concurrency"])
+            if before is None:
+                continue
+            ratio = (
+                after["throughput_rps"] / before["throughput_rps"]
+                if before["throughput_rps"] and after["throughput_rps"] else None
+            )
+            print(
+                f"  {name:<16} {after['concurrency']:>4} {before['throughput_rps']:>11} {after['throughput_rps']:>10} "
+                f"{(f'{ratio:.2f}' if ratio else '-'):>6} {before['latency']['p99_ms']!s:>11} {after['latency']['p99_ms']!s:>10}"
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Concurrency benchmark of the async collaborative endpoints')
+    parser.add_argument('--base-url', type=str, default=f"http://localhost:{settings.SERVICE_PORT}",
+                        help='URL of a running service')
+    parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32, 64],
+                        help='Concurrent clients per level')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per level')
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--user-ids', nargs='+', type=int, default=None,
+                        help='User IDs to request (default: sampled from DATABASE_URL)')
+    parser.add_argument('--n-users', type=int, default=1000, help='Users sampled from the database')
+    parser.add_argument('--token', type=str, default=None,
+                        help='Bearer token (default: admin token signed with JWT_SECRET_KEY)')
+    parser.add_argument('--keep-cache', dest='clear_cache', action='store_false',
+                        help='Do not clear recommendation caches before each level')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Request timeout (seconds)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', type=str, default=None, help='Write the report as JSON')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline report (JSON) to compare against')
+    args = parser.parse_args()
+
+    print(f"🚀 Benchmarking {args.base_url} ...")
+    report = asyncio.run(run_benchmark(args))
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Report written to {args.output}")
@@ -0,0 +1,247 @@
+"""
+Sinh dataset lớn (movies + user_behaviors + user_movie_scores) cho load test
+
+Dataset deterministic theo --seed và --end-date (xem app/services/synthetic_data.py):
+cùng tham số luôn cho cùng dữ liệu, để benchmark (app/scripts/benchmark.py --from-db,
+app/scripts/concurrency_benchmark.py) và capacity tests chạy trên cùng dataset.
+
+Dữ liệu được ghi theo block, memory không tăng theo kích thước dataset:
+- PostgreSQL: COPY ... FROM STDIN (psycopg2), một COPY mỗi block
+- database khác: multi-row INSERT mỗi block
+
+Script thay thế toàn bộ user_behaviors và user_movie_scores; bảng movies (dùng chung
+với movie-service) chỉ được ghi đè khi truyền --replace-movies.
+
+Ví dụ:
+    python app/scripts/generate_scale_data.py --movies 100000 --users 200000 \\
+        --behaviors-per-user 25 --seed 7 --end-date 2026-01-01 --replace-movies
+    python app/scripts/generate_scale_data.py --movies 100000 --users 200000 --dry-run
+"""
+import sys
+import csv
+import io
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+# Thêm root directory vào Python path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, engine, Base
+from app.models.movie import Movie
+from app.models.user_behavior import UserBehavior
+from app.models.user_movie_score import UserMovieScore
+from app.services.synthetic_data import (
+    BEHAVIOR_NAMES,
+    SyntheticDataset,
+    aggregate_block,
+    to_datetimes,
+    to_iso_strings
+)
+
+MOVIE_COLUMNS = [
+    'id', 'series_title', 'released_year', 'genre', 'imdb_rating', 'meta_score', 'director',
+    'overview', 'star1', 'star2', 'star3', 'star4', 'no_of_votes'
+]
+BEHAVIOR_COLUMNS = ['user_id', 'movie_id', 'behavior', 'score', 'created_at']
+SCORE_COLUMNS = ['user_id', 'movie_id', 'score', 'interaction_count', 'last_interaction_at']
+
+
+def write_rows(db: Session, table, columns: List[str], rows: Sequence[Sequence]):
+    """
+    Ghi một block rows: COPY (CSV) trên PostgreSQL, multi-row INSERT với database khác
+
+    rows là tuples theo thứ tự columns; với INSERT, datetime phải là datetime objects.
+    """
+    connection = db.connection()
+    if connection.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+        return
+
+    db.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+
+def _behavior_rows(block, use_copy: bool) -> Iterable[tuple]:
+    timestamps = (
+        to_iso_strings(block.created_at).tolist() if use_copy
+        else to_datetimes(block.created_at)
+    )
+    names = np.array(BEHAVIOR_NAMES)[block.behavior_codes]
+    return zip(block.user_ids.tolist(), block.movie_ids.tolist(), names.tolist(),
+               block.scores.tolist(), timestamps)
+
+
+def _score_rows(scores, use_copy: bool) -> Iterable[tuple]:
+    timestamps = (
+        to_iso_strings(scores.last_interaction_at).tolist() if use_copy
+        else to_datetimes(scores.last_interaction_at)
+    )
+    return zip(scores.user_ids.tolist(), scores.movie_ids.tolist(), scores.scores.tolist(),
+               scores.interaction_counts.tolist(), timestamps)
+
+
+def popularity_summary(movie_counts: np.ndarray) -> Dict:
+    """Mức độ lệch của interactions: tỷ lệ thuộc về top 1% / 10% movies"""
+    total = movie_counts.sum()
+    if total == 0:
+        return {}
+    ordered = np.sort(movie_counts)[::-1]
+    top = lambda fraction: float(ordered[:max(1, int(len(ordered) * fraction))].sum() / total)
+    return {
+        "top_1pct_share": round(top(0.01), 3),
+        "top_10pct_share": round(top(0.10), 3),
+        "movies_with_interactions": int((movie_counts > 0).sum())
+    }
+
+
+def generate(dataset: SyntheticDataset, replace_movies: bool, dry_run: bool):
+    """
+    Sinh dataset và ghi vào DATABASE_URL (hoặc chỉ sinh + thống kê với dry_run)
+    """
+    db = None if dry_run else SessionLocal()
+    start = time.perf_counter()
+    n_movies_written = n_behaviors = n_pairs = 0
+    movie_counts = np.zeros(dataset.n_movies + 1, dtype=np.int64)
+
+    try:
+        use_copy = False
+        if db is not None:
+            Base.metadata.create_all(bind=engine)
+            use_copy = db.connection().dialect.name == "postgresql"
+
+            existing_movies = db.query(Movie.id).first() is not None
+            if existing_movies and not replace_movies:
+                print("✗ Bảng movies đã có dữ liệu. Truyền --replace-movies để ghi đè catalog.")
+                return
+
+            print("Đang xóa dữ liệu cũ...")
+            if use_copy:
+                db.execute(text("TRUNCATE user_movie_scores, user_behaviors"))
+            else:
+                db.query(UserMovieScore).delete(synchronize_session=False)
+                db.query(UserBehavior).delete(synchronize_session=False)
+            db.query(Movie).delete(synchronize_session=False)
+            db.commit()
+
+        print(f"Movies: {dataset.n_movies} ({dataset.n_movie_blocks} blocks)")
+        for rows in dataset.movie_blocks():
+            if db is not None:
+                write_rows(db, Movie.__table__, MOVIE_COLUMNS, [tuple(r[c] for c in MOVIE_COLUMNS) for r in rows])
+                db.commit()
+            n_movies_written += len(rows)
+
+        if db is not None and use_copy:
+            # COPY với id tường minh không cập nhật sequence của movies
+            db.execute(text("SELECT setval(pg_get_serial_sequence('movies', 'id'), (SELECT MAX(id) FROM movies))"))
+            db.commit()
+
+        print(f"Users: {dataset.n_users} ({dataset.n_user_blocks} blocks)")
+        for index, block in enumerate(dataset.behavior_blocks(), start=1):
+            scores = aggregate_block(block, dataset.n_movies)
+            movie_counts += np.bincount(block.movie_ids, minlength=dataset.n_movies + 1)
+
+            if db is not None:
+                # Behaviors và scores của block trong cùng transaction
+                write_rows(db, UserBehavior.__table__, BEHAVIOR_COLUMNS, list(_behavior_rows(block, use_copy)))
+                write_rows(db, UserMovieScore.__table__, SCORE_COLUMNS, list(_score_rows(scores, use_copy)))
+                db.commit()
+
+            n_behaviors += len(block.user_ids)
+            n_pairs += len(scores.user_ids)
+            if index % 20 == 0 or index == dataset.n_user_blocks:
+                elapsed = time.perf_counter() - start
+                print(f"✓ {index}/{dataset.n_user_blocks} blocks - {n_behaviors} behaviors "
+                      f"({n_behaviors / elapsed:,.0f} rows/s)")
+
+        if db is not None and use_copy:
+            db.execute(text("ANALYZE movies"))
+            db.execute(text("ANALYZE user_behaviors"))
+            db.execute(text("ANALYZE user_movie_scores"))
+            db.commit()
+
+        elapsed = time.perf_counter() - start
+        print(f"\n{'='*60}")
+        print(f"✓ {'Generated (dry run)' if dry_run else 'Loaded'} in {elapsed:.1f}s")
+        print(f"  - Movies: {n_movies_written}")
+        print(f"  - Users: {dataset.n_users}")
+        print(f"  - Behaviors: {n_behaviors} ({n_behaviors / dataset.n_users:.1f} per user)")
+        print(f"  - User-movie pairs: {n_pairs}")
+        print(f"  - Window: {dataset.start:%Y-%m-%d} .. {dataset.end:%Y-%m-%d}, seed {dataset.seed}")
+        for key, value in popularity_summary(movie_counts[1:]).items():
+            print(f"  - {key}: {value}")
+        print(f"{'='*60}")
+
+    except Exception as e:
+        if db is not None:
+            db.rollback()
+        print(f"\n✗ Error: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        if db is not None:
+            db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate a large deterministic synthetic dataset')
+    parser.add_argument('--movies', type=int, default=50000, help='Number of movies')
+    parser.add_argument('--users', type=int, default=100000, help='Number of users')
+    parser.add_argument('--behaviors-per-user', type=float, default=30.0, help='Mean behaviors per user')
+    parser.add_argument('--clusters', type=int, default=12, help='Genre affinity clusters')
+    parser.add_argument('--zipf', type=float, default=1.0, help='Zipf exponent of movie popularity')
+    parser.add_argument('--genre-affinity', type=float, default=8.0,
+                        help='Weight boost for movies in the user cluster genres')
+    parser.add_argument('--explore-fraction', type=float, default=0.2,
+                        help='Fraction of events sampled from global popularity')
+    parser.add_argument('--burst-fraction', type=float, default=0.4,
+                        help='Fraction of events that fall in a movie burst')
+    parser.add_argument('--burst-days', type=float, default=7.0, help='Mean burst length (days)')
+    parser.add_argument('--days', type=int, default=365, help='Length of the time window (days)')
+    parser.add_argument('--end-date', type=datetime.fromisoformat, default=None,
+                        help='End of the time window, e.g. 2026-01-01 (default: today 00:00 UTC)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--replace-movies', action='store_true',
+                        help='Overwrite a non-empty movies table with the synthetic catalog')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Generate and print statistics without writing to the database')
+
+    args = parser.parse_args()
+
+    print("="*60)
+    print("GENERATE SCALE DATA")
+    print("="*60)
+
+    dataset = SyntheticDataset(
+        n_movies=args.movies,
+        n_users=args.users,
+        behaviors_per_user=args.behaviors_per_user,
+        n_clusters=args.clusters,
+        zipf_exponent=args.zipf,
+        genre_affinity=args.genre_affinity,
+        explore_fraction=args.explore_fraction,
+        burst_fraction=args.burst_fraction,
+        burst_days=args.burst_days,
+        days=args.days,
+        end=args.end_date,
+        seed=args.seed
+    )
+    generate(dataset, replace_movies=args.replace_movies, dry_run=args.dry_run)
@@ -12,6 +12,7 @@ from sqlalchemy.orm import Session
 from app.database import SessionLocal, engine, Base
 from app.models.user_behavior import UserBehavior
 from app.models.movie import Movie
+from app.services.user_scores import rebuild_user_movie_scores
 
 # Định nghĩa behavior scores
 BEHAVIOR_SCORES = {
@@ -89,6 +90,9 @@ def seed_user_behaviors(n_users: int = 50, n_behaviors_per_user: int = 20):
                 print(f"✓ Created behaviors for {user_id}/{n_users} users...")
         
         db.commit()
+        
+        # Cập nhật bảng điểm tổng hợp từ behaviors vừa tạo
+        rebuild_user_movie_scores(db)
         print(f"\n{'='*60}")
         print(f"✓ Seed completed successfully!")
         print(f"  - Total users: {n_users}")
@@ -182,6 +186,9 @@ def seed_diverse_behaviors(n_users: int = 100):
                 print(f"✓ Created behaviors for {user_id}/{n_users} users...")
         
         db.commit()
+        
+        # Cập nhật bảng điểm tổng hợp từ behaviors vừa tạo
+        rebuild_user_movie_scores(db)
         print(f"\n{'='*60}")
         print(f"✓ Diverse seed completed!")
         print(f"  - Heavy users (30-50 behaviors): 20")
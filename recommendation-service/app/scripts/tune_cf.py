@@ -0,0 +1,158 @@
+"""
+Hyperparameter search song song cho collaborative filtering model
+
+Train các candidates (grid hoặc sample ngẫu nhiên của SEARCH_SPACES) trên mọi cores,
+xếp hạng theo validation RMSE / precision / recall / NDCG@K cùng cấu hình mặc định
+hiện tại (baseline, đánh dấu *), và ghi cấu hình tốt nhất ra CF_TUNED_CONFIG_PATH
+nếu nó tốt hơn baseline. create_cf_service() và /train (không truyền engine)
+dùng cấu hình này từ lần load/train tiếp theo.
+
+Ví dụ:
+    python app/scripts/tune_cf.py --engines als als_implicit --objective ndcg
+    python app/scripts/tune_cf.py --n-candidates 40 --workers 8 --output search.json
+    python app/scripts/tune_cf.py --synthetic 20000:5000 --no-write
+"""
+import sys
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+# Thêm root directory vào Python path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.config import settings
+from app.services.collaborative_service import TRAINING_ENGINES
+from app.services.hyperparameter_search import (
+    OBJECTIVES,
+    RatingData,
+    default_candidate,
+    generate_candidates,
+    load_rating_data,
+    run_search,
+    to_rating_data,
+    write_tuned_config
+)
+
+
+def load_from_db() -> RatingData:
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return load_rating_data(db)
+    finally:
+        db.close()
+
+
+def load_synthetic(n_users: int, n_movies: int, seed: int) -> RatingData:
+    """Dataset của app/services/synthetic_data.py, score đã decay tại cuối time window"""
+    from app.services.synthetic_data import SyntheticDataset, aggregate_block
+    from app.services.user_scores import decay_factor
+
+    dataset = SyntheticDataset(n_movies=n_movies, n_users=n_users, seed=seed)
+    blocks = [aggregate_block(block, n_movies) for block in dataset.behavior_blocks()]
+    return to_rating_data(
+        np.concatenate([b.user_ids for b in blocks]),
+        np.concatenate([b.movie_ids for b in blocks]),
+        np.concatenate([b.scores for b in blocks]) * decay_factor(dataset.end)
+    )
+
+
+def parse_synthetic(value: str) -> Tuple[int, int]:
+    users, movies = value.split(":")
+    return int(users), int(movies)
+
+
+def print_results(report, top: int):
+    print(f"\n{'rank':>4} {'engine':<13} {'rmse':>7} {'ndcg':>7} {'recall':>7} {'prec':>7} {'fit s':>7}  params")
+    for rank, result in enumerate(report["results"][:top], start=1):
+        print(
+            f"{rank:>4} {result['engine']:<13} {result['rmse']:>7.4f} {result['ndcg']:>7.4f} "
+            f"{result['recall']:>7.4f} {result['precision']:>7.4f} {result['fit_seconds']:>7.2f} "
+            f"{'*' if result.get('baseline') else ' '}{result['searched']}"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter search for the CF model')
+    parser.add_argument('--engines', nargs='+', choices=TRAINING_ENGINES, default=list(TRAINING_ENGINES))
+    parser.add_argument('--n-candidates', type=int, default=None,
+                        help='Random sample of the grid (default: full grid)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--validation-fraction', type=float, default=0.2,
+                        help='Fraction of each user ratings held out for validation')
+    parser.add_argument('--k', type=int, default=10, help='Cutoff for ranking metrics')
+    parser.add_argument('--max-eval-users', type=int, default=2000,
+                        help='Users sampled for ranking metrics')
+    parser.add_argument('--objective', choices=sorted(OBJECTIVES), default='ndcg',
+                        help='Metric used to pick the best configuration')
+    parser.add_argument('--sgd-iterations', type=int, default=None, help='SGD epochs (default: CF_SERVICE_CONFIG)')
+    parser.add_argument('--synthetic', type=parse_synthetic, default=None, metavar='USERS:MOVIES',
+                        help='Search on a synthetic dataset instead of the database')
+    parser.add_argument('--top', type=int, default=10, help='Results to print')
+    parser.add_argument('--output', type=str, default=None, help='Write the full report as JSON')
+    parser.add_argument('--config-path', type=str, default=settings.CF_TUNED_CONFIG_PATH,
+                        help='Where the best configuration is written')
+    parser.add_argument('--no-write', action='store_true', help='Do not write the best configuration')
+    parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.synthetic:
+        data = load_synthetic(*args.synthetic, seed=args.seed)
+    else:
+        data = load_from_db()
+
+    if len(data.ratings) == 0:
+        print("Không có dữ liệu để train model")
+        sys.exit(1)
+
+    fixed_params = {"n_iterations": args.sgd_iterations} if args.sgd_iterations else None
+    candidates = generate_candidates(args.engines, args.n_candidates, fixed_params, seed=args.seed)
+
+    print("=" * 60)
+    print("CF HYPERPARAMETER SEARCH")
+    print(f"  - Users: {len(data.user_ids)}, Movies: {len(data.movie_ids)}, Ratings: {len(data.ratings)}")
+    print(f"  - Candidates: {len(candidates)}, Workers: {args.workers}, Objective: {args.objective}@{args.k}")
+    print("=" * 60)
+
+    report = run_search(
+        data,
+        candidates,
+        workers=args.workers,
+        validation_fraction=args.validation_fraction,
+        k=args.k,
+        max_eval_users=args.max_eval_users,
+        objective=args.objective,
+        seed=args.seed,
+        baseline=default_candidate()
+    )
+
+    print_results(report, args.top)
+    print(f"\n✓ {len(report['results'])} candidates in {report['seconds']}s on {report['workers']} workers")
+    for failed in report["failed"]:
+        print(f"✗ {failed['engine']} {failed['searched']}: {failed['error']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report written to {args.output}")
+
+    if report["best"] is None:
+        print("✗ Không có candidate nào thành công")
+        sys.exit(1)
+
+    if not args.no_write:
+        try:
+            path = write_tuned_config(report, args.config_path)
+            print(f"✅ Best config ({report['best']['engine']}) written to {path}")
+        except ValueError as e:
+            print(f"✗ Config not written: {e}")
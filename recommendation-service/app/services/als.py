@@ -0,0 +1,254 @@
+"""
+Alternating Least Squares cho Matrix Factorization
+
+Thay vòng lặp SGD từng rating bằng các bước giải least-squares theo block:
+mỗi block user (hoặc item) được giải cùng lúc bằng batched NumPy linear algebra
+trên sparse user x item CSR matrix.
+
+- Explicit: r_ui ~ global_mean + b_u + b_i + p_u . q_i
+- Implicit (Hu, Koren, Volinsky 2008): preference 1 với confidence 1 + alpha * r_ui
+"""
+import numpy as np
+from scipy.sparse import csr_matrix
+from typing import Callable, Dict, Optional, Union
+
+# Giới hạn bộ nhớ cho gram matrices và design vectors của một block (bytes)
+_BLOCK_MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+def build_rating_matrix(
+    user_indices: np.ndarray,
+    item_indices: np.ndarray,
+    ratings: np.ndarray,
+    n_users: int,
+    n_items: int
+) -> csr_matrix:
+    """
+    Tạo sparse user x item CSR matrix từ các cặp (user_idx, item_idx, rating)
+    """
+    matrix = csr_matrix(
+        (np.asarray(ratings, dtype=np.float64),
+         (np.asarray(user_indices, dtype=np.int64), np.asarray(item_indices, dtype=np.int64))),
+        shape=(n_users, n_items)
+    )
+    matrix.sum_duplicates()
+    matrix.sort_indices()
+    return matrix
+
+
+def solve_least_squares(
+    gram_weights: csr_matrix,
+    rhs_weights: csr_matrix,
+    design: np.ndarray,
+    regularization: Union[float, np.ndarray],
+    base_gram: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Giải regularized least-squares cho mọi row của sparse weight matrices
+
+    Với mỗi row u:
+        A_u = base_gram + sum_j gram_weights[u, j] * x_j x_j^T + lambda_u * I
+        b_u = sum_j rhs_weights[u, j] * x_j
+        solution_u = A_u^-1 b_u
+    trong đó x_j = design[j] và lambda_u là regularization (scalar hoặc array
+    theo từng row). Với mỗi block rows, các x_j của từng row được xếp thành một
+    tensor (rows, max_nnz, dim) pad bằng 0, A của cả block là một batched matmul
+    X_u^T (W_u X_u) và được giải bằng một lần np.linalg.solve batched. Rows được
+    duyệt theo số nonzeros tăng dần để padding ít, và block được giới hạn sao cho
+    bộ nhớ chỉ phụ thuộc _BLOCK_MEMORY_BUDGET (không phụ thuộc số rows của design).
+
+    Returns:
+        Array (n_rows, design.shape[1])
+    """
+    n_rows = gram_weights.shape[0]
+    dim = design.shape[1]
+    solutions = np.zeros((n_rows, dim))
+
+    row_regularization = np.broadcast_to(np.asarray(regularization, dtype=np.float64), (n_rows,))
+    diagonal = np.arange(dim)
+
+    rhs = rhs_weights @ design
+
+    counts = np.diff(gram_weights.indptr)
+    order = np.argsort(counts, kind='stable')
+    block_size = max(1, _BLOCK_MEMORY_BUDGET // (dim * dim * 8))
+    start = 0
+    while start < n_rows:
+        end = min(start + block_size, n_rows)
+        # Hai tensor pad (rows, max_nnz, dim) của block cũng nằm trong budget
+        max_nnz = max(int(counts[order[end - 1]]), 1)
+        end = min(end, start + max(1, _BLOCK_MEMORY_BUDGET // (2 * max_nnz * dim * 8)))
+
+        rows = order[start:end]
+        block = gram_weights[rows]
+        block_counts = np.diff(block.indptr)
+        row_of = np.repeat(np.arange(len(rows)), block_counts)
+        slot = np.arange(block.nnz) - block.indptr[row_of]
+        vectors = np.zeros((len(rows), int(block_counts.max(initial=0)), dim))
+        vectors[row_of, slot] = design[block.indices]
+        weighted = np.zeros_like(vectors)
+        weighted[row_of, slot] = vectors[row_of, slot] * block.data[:, None]
+
+        A = np.matmul(vectors.transpose(0, 2, 1), weighted)
+        if base_gram is not None:
+            A += base_gram
+        A[:, diagonal, diagonal] += row_regularization[rows, None]
+        solutions[rows] = np.linalg.solve(A, rhs[rows, :, None])[:, :, 0]
+        start = end
+
+    return solutions
+
+
+def _with_data(matrix: csr_matrix, data: np.ndarray) -> csr_matrix:
+    """
+    Tạo CSR matrix cùng structure với matrix nhưng giá trị khác
+    """
+    return csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def _explicit_rmse(
+    matrix: csr_matrix,
+    global_mean: float,
+    user_factors: np.ndarray,
+    item_factors: np.ndarray,
+    user_bias: np.ndarray,
+    item_bias: np.ndarray,
+    chunk_size: int = 200000
+) -> float:
+    """
+    RMSE trên các rating đã quan sát, tính theo chunk để giới hạn bộ nhớ
+    """
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    cols = matrix.indices
+    total = 0.0
+    for lo in range(0, matrix.nnz, chunk_size):
+        hi = min(lo + chunk_size, matrix.nnz)
+        u, i = rows[lo:hi], cols[lo:hi]
+        prediction = (
+            global_mean + user_bias[u] + item_bias[i] +
+            np.einsum('ij,ij->i', user_factors[u], item_factors[i])
+        )
+        total += float(np.sum((matrix.data[lo:hi] - prediction) ** 2))
+    return float(np.sqrt(total / max(matrix.nnz, 1)))
+
+
+def als_explicit(
+    matrix: csr_matrix,
+    n_factors: int,
+    regularization: float,
+    n_iterations: int,
+    random_state: np.random.RandomState,
+    progress_callback: Optional[Callable[[int, float], None]] = None
+) -> Dict:
+    """
+    Explicit ALS với bias terms
+
+    Bias được học cùng factors bằng cách mở rộng vector: user [p_u, b_u] với
+    item design [q_i, 1], và ngược lại item [q_i, b_i] với user design [p_u, 1].
+    Regularization được nhân với số rating của mỗi row (ALS-WR) để user/item
+    ít tương tác không bị overfit.
+    """
+    n_users, n_items = matrix.shape
+    global_mean = float(matrix.data.mean()) if matrix.nnz else 0.0
+
+    scale = 0.1 / np.sqrt(n_factors)
+    user_factors = random_state.normal(0, scale, (n_users, n_factors))
+    item_factors = random_state.normal(0, scale, (n_items, n_factors))
+    user_bias = np.zeros(n_users)
+    item_bias = np.zeros(n_items)
+
+    matrix_t = matrix.T.tocsr()
+    matrix_t.sort_indices()
+    user_ones = _with_data(matrix, np.ones(matrix.nnz))
+    item_ones = _with_data(matrix_t, np.ones(matrix_t.nnz))
+    user_regularization = regularization * np.maximum(np.diff(matrix.indptr), 1)
+    item_regularization = regularization * np.maximum(np.diff(matrix_t.indptr), 1)
+
+    rmse = 0.0
+    for iteration in range(n_iterations):
+        # Fix items, giải users
+        design = np.hstack([item_factors, np.ones((n_items, 1))])
+        targets = matrix.data - global_mean - item_bias[matrix.indices]
+        solution = solve_least_squares(
+            user_ones, _with_data(matrix, targets), design, user_regularization
+        )
+        user_factors, user_bias = solution[:, :n_factors], solution[:, n_factors]
+
+        # Fix users, giải items
+        design = np.hstack([user_factors, np.ones((n_users, 1))])
+        targets = matrix_t.data - global_mean - user_bias[matrix_t.indices]
+        solution = solve_least_squares(
+            item_ones, _with_data(matrix_t, targets), design, item_regularization
+        )
+        item_factors, item_bias = solution[:, :n_factors], solution[:, n_factors]
+
+        rmse = _explicit_rmse(matrix, global_mean, user_factors, item_factors, user_bias, item_bias)
+        if progress_callback:
+            progress_callback(iteration, rmse)
+
+    return {
+        "user_factors": user_factors,
+        "item_factors": item_factors,
+        "user_bias": user_bias,
+        "item_bias": item_bias,
+        "global_mean": global_mean,
+        "rmse": rmse
+    }
+
+
+def als_implicit(
+    matrix: csr_matrix,
+    n_factors: int,
+    regularization: float,
+    n_iterations: int,
+    alpha: float,
+    random_state: np.random.RandomState,
+    progress_callback: Optional[Callable[[int, float], None]] = None
+) -> Dict:
+    """
+    Implicit-confidence ALS (Hu, Koren, Volinsky)
+
+    Mỗi tương tác được coi là preference 1 với confidence c = 1 + alpha * score.
+    Không có bias terms: global_mean và biases bằng 0, score dự đoán là p_u . q_i.
+    RMSE được tính giữa preference dự đoán và 1 trên các cặp đã quan sát.
+    """
+    n_users, n_items = matrix.shape
+
+    scale = 0.1 / np.sqrt(n_factors)
+    user_factors = random_state.normal(0, scale, (n_users, n_factors))
+    item_factors = random_state.normal(0, scale, (n_items, n_factors))
+
+    matrix_t = matrix.T.tocsr()
+    matrix_t.sort_indices()
+    user_confidence = _with_data(matrix, 1.0 + alpha * matrix.data)
+    item_confidence = _with_data(matrix_t, 1.0 + alpha * matrix_t.data)
+    user_gram = _with_data(matrix, alpha * matrix.data)
+    item_gram = _with_data(matrix_t, alpha * matrix_t.data)
+
+    zero_users = np.zeros(n_users)
+    zero_items = np.zeros(n_items)
+    preferences = _with_data(matrix, np.ones(matrix.nnz))
+
+    rmse = 0.0
+    for iteration in range(n_iterations):
+        user_factors = solve_least_squares(
+            user_gram, user_confidence, item_factors, regularization,
+            base_gram=item_factors.T @ item_factors
+        )
+        item_factors = solve_least_squares(
+            item_gram, item_confidence, user_factors, regularization,
+            base_gram=user_factors.T @ user_factors
+        )
+
+        rmse = _explicit_rmse(preferences, 0.0, user_factors, item_factors, zero_users, zero_items)
+        if progress_callback:
+            progress_callback(iteration, rmse)
+
+    return {
+        "user_factors": user_factors,
+        "item_factors": item_factors,
+        "user_bias": zero_users,
+        "item_bias": zero_items,
+        "global_mean": 0.0,
+        "rmse": rmse
+    }
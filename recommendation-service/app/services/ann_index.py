@@ -0,0 +1,412 @@
+"""
+Approximate nearest-neighbor index (IVF) cho item factors và TF-IDF vectors
+
+Coarse quantizer là spherical k-means: mỗi item được gán vào một list (cluster),
+khi search chỉ score các items trong nprobe lists gần query nhất. nprobe điều
+chỉnh trade-off recall/latency (nprobe = n_lists tương đương exact search); mặc
+định nprobe được chọn khi build bằng tune_nprobe theo recall mục tiêu.
+
+- metric="cosine": vectors (dense hoặc scipy sparse) đã L2-normalize
+- metric="ip": inner product (MIPS). Khi clustering, items được augment thêm
+  một chiều sqrt(M^2 - |x|^2) để mọi item có cùng norm M, nên cluster theo
+  cosine vẫn đúng cho inner product; query được augment bằng 0.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("ip", "cosine")
+
+DEFAULT_NPROBE = 8
+
+# Recall@k mục tiêu khi tự chọn nprobe (tune_nprobe): nprobe nhỏ nhất đạt mức này
+DEFAULT_TARGET_RECALL = 0.9
+
+# Số queries (sample) dùng để tune nprobe
+TUNING_QUERIES = 200
+
+# Số điểm train k-means tối đa cho mỗi list
+_TRAIN_POINTS_PER_LIST = 64
+
+# Giới hạn bộ nhớ cho dense block khi gán items vào lists (bytes)
+_ASSIGN_MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+def _row_norms(vectors) -> np.ndarray:
+    if sp.issparse(vectors):
+        return np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+    return np.linalg.norm(vectors, axis=1)
+
+
+def _to_dense(rows) -> np.ndarray:
+    return rows.toarray() if sp.issparse(rows) else np.asarray(rows)
+
+
+def _normalize_dense(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    """Inverted-file index: centroids + items của từng list (CSR-style offsets)"""
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_items: np.ndarray,
+        metric: str,
+        nprobe: int = DEFAULT_NPROBE
+    ):
+        if metric not in METRICS:
+            raise ValueError(f"Metric không hợp lệ: {metric}. Hỗ trợ: {', '.join(METRICS)}")
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_items = list_items
+        self.metric = metric
+        self.nprobe = min(nprobe or DEFAULT_NPROBE, self.n_lists)
+        self.vectors = None
+        # Kết quả tune_nprobe (None nếu nprobe do cấu hình chỉ định)
+        self.tuning: Optional[Dict] = None
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.list_offsets) - 1
+
+    @property
+    def n_items(self) -> int:
+        return len(self.list_items)
+
+    @property
+    def _probe_centroids(self) -> np.ndarray:
+        # Query của "ip" có chiều augment bằng 0, nên chỉ cần d chiều đầu
+        if self.metric == "ip":
+            return self.centroids[:, :-1]
+        return self.centroids
+
+    @staticmethod
+    def _clustering_points(vectors, metric: str):
+        """Vectors dùng để clustering: normalize (và augment nếu metric="ip")"""
+        norms = _row_norms(vectors)
+        if metric == "cosine":
+            scale = 1.0 / np.maximum(norms, 1e-12)
+            if sp.issparse(vectors):
+                return (sp.diags(scale) @ vectors).tocsr()
+            return vectors * scale[:, None]
+
+        max_norm = max(float(norms.max()), 1e-12)
+        extra = np.sqrt(np.maximum(max_norm ** 2 - norms ** 2, 0.0))[:, None]
+        if sp.issparse(vectors):
+            return (sp.hstack([vectors, sp.csr_matrix(extra)]).tocsr() / max_norm).tocsr()
+        return np.hstack([vectors, extra]) / max_norm
+
+    @staticmethod
+    def _assign(points, centroids: np.ndarray) -> np.ndarray:
+        """Gán mỗi point vào centroid gần nhất (theo cosine), xử lý theo block"""
+        n_points = points.shape[0]
+        block_size = max(1, _ASSIGN_MEMORY_BUDGET // max(len(centroids) * 4, 1))
+        assignment = np.empty(n_points, dtype=np.int64)
+        for lo in range(0, n_points, block_size):
+            hi = min(lo + block_size, n_points)
+            sims = np.asarray(points[lo:hi] @ centroids.T)
+            assignment[lo:hi] = np.argmax(sims, axis=1)
+        return assignment
+
+    @classmethod
+    def build(
+        cls,
+        vectors,
+        metric: str = "ip",
+        n_lists: Optional[int] = None,
+        nprobe: int = DEFAULT_NPROBE,
+        n_iterations: int = 10,
+        random_state: int = 42
+    ) -> "IVFIndex":
+        """
+        Build index bằng spherical k-means trên một sample của vectors
+
+        Args:
+            vectors: (n_items, dim) ndarray hoặc scipy sparse matrix
+            metric: "ip" hoặc "cosine"
+            n_lists: số lists (mặc định sqrt(n_items))
+            nprobe: số lists được search mặc định
+            n_iterations: số vòng lặp k-means
+            random_state: seed cho reproducibility
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Metric không hợp lệ: {metric}. Hỗ trợ: {', '.join(METRICS)}")
+
+        start = time.perf_counter()
+        n_items = vectors.shape[0]
+        n_lists = max(1, min(n_lists or int(round(np.sqrt(n_items))), n_items))
+        rng = np.random.RandomState(random_state)
+
+        points = cls._clustering_points(vectors, metric)
+
+        n_train = min(n_items, n_lists * _TRAIN_POINTS_PER_LIST)
+        train = points[np.sort(rng.choice(n_items, n_train, replace=False))]
+        centroids = _normalize_dense(_to_dense(train[rng.choice(n_train, n_lists, replace=False)]))
+
+        for _ in range(n_iterations):
+            assignment = cls._assign(train, centroids)
+            membership = sp.csr_matrix(
+                (np.ones(n_train), (assignment, np.arange(n_train))),
+                shape=(n_lists, n_train)
+            )
+            sums = _to_dense(membership @ train)
+            counts = np.bincount(assignment, minlength=n_lists)
+
+            # List rỗng -> khởi tạo lại bằng một điểm ngẫu nhiên
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = _to_dense(train[rng.choice(n_train, len(empty), replace=False)])
+            centroids = _normalize_dense(sums)
+
+        assignment = cls._assign(points, centroids)
+        list_items = np.argsort(assignment, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+
+        index = cls(centroids.astype(np.float32), list_offsets, list_items, metric, nprobe)
+        index.vectors = vectors
+        logger.info(
+            f"IVF index built: {n_items} items, {n_lists} lists, metric={metric}, "
+            f"{time.perf_counter() - start:.2f}s"
+        )
+        return index
+
+    def _probe(self, queries, nprobe: int) -> np.ndarray:
+        probe_scores = np.asarray(queries @ self._probe_centroids.T)
+        if nprobe >= self.n_lists:
+            return np.tile(np.arange(self.n_lists), (probe_scores.shape[0], 1))
+        return np.argpartition(-probe_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+    def _candidates(self, lists: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            self.list_items[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists
+        ])
+
+    def _score(self, candidates: np.ndarray, query) -> np.ndarray:
+        scores = self.vectors[candidates] @ (query.T if sp.issparse(query) else query)
+        return _to_dense(scores).ravel().astype(np.float64)
+
+    @staticmethod
+    def _top_k(candidates: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(scores))
+        if k == 0:
+            return candidates[:0], scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        finite = np.isfinite(scores[top])
+        return candidates[top][finite], scores[top][finite]
+
+    def search(
+        self,
+        queries,
+        k: int,
+        nprobe: Optional[int] = None,
+        exclude: Optional[Sequence[Optional[np.ndarray]]] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Approximate top-k search
+
+        Args:
+            queries: (n_queries, dim) ndarray hoặc sparse matrix
+            k: số kết quả cho mỗi query
+            nprobe: số lists được search (mặc định self.nprobe)
+            exclude: với mỗi query, các item positions bị loại (ví dụ đã xem)
+
+        Returns:
+            List of (item_positions, scores) cho từng query, score giảm dần
+        """
+        if self.vectors is None:
+            raise RuntimeError("IVF index chưa được gắn vectors")
+
+        nprobe = max(1, min(nprobe or self.nprobe, self.n_lists))
+        probes = self._probe(queries, nprobe)
+
+        results = []
+        for i in range(queries.shape[0]):
+            candidates = self._candidates(probes[i])
+            scores = self._score(candidates, queries[i])
+            if exclude is not None and exclude[i] is not None and len(exclude[i]):
+                scores[np.isin(candidates, exclude[i])] = -np.inf
+            results.append(self._top_k(candidates, scores, k))
+        return results
+
+    def exact_search(
+        self,
+        queries,
+        k: int,
+        exclude: Optional[Sequence[Optional[np.ndarray]]] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Brute-force search với cùng API (baseline cho recall)"""
+        all_items = np.arange(self.n_items)
+        results = []
+        for i in range(queries.shape[0]):
+            scores = self._score(all_items, queries[i])
+            if exclude is not None and exclude[i] is not None and len(exclude[i]):
+                scores[exclude[i]] = -np.inf
+            results.append(self._top_k(all_items, scores, k))
+        return results
+
+    def evaluate(self, queries, k: int = 10, nprobe_values: Optional[List[int]] = None) -> Dict:
+        """
+        Đo recall@k so với exact search và latency cho từng giá trị nprobe
+        """
+        if nprobe_values is None:
+            nprobe_values = sorted({
+                v for v in (1, 2, 4, 8, 16, 32, 64, self.nprobe) if v <= self.n_lists
+            })
+        n_queries = queries.shape[0]
+
+        start = time.perf_counter()
+        exact = self.exact_search(queries, k)
+        exact_ms = (time.perf_counter() - start) * 1000 / max(n_queries, 1)
+
+        list_sizes = np.diff(self.list_offsets)
+        report = []
+        for nprobe in nprobe_values:
+            start = time.perf_counter()
+            approx = self.search(queries, k, nprobe=nprobe)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / max(n_queries, 1)
+
+            recall = self._recall(approx, exact)
+            scanned = list_sizes[self._probe(queries, min(nprobe, self.n_lists))].sum(axis=1)
+            report.append({
+                "nprobe": int(nprobe),
+                f"recall@{k}": round(recall, 4) if recall is not None else None,
+                "ms_per_query": round(elapsed_ms, 3),
+                "scanned_fraction": round(float(scanned.mean()) / max(self.n_items, 1), 4)
+            })
+
+        return {
+            "metric": self.metric,
+            "k": k,
+            "n_queries": int(n_queries),
+            "n_items": self.n_items,
+            "n_lists": self.n_lists,
+            "default_nprobe": self.nprobe,
+            "tuning": self.tuning,
+            "exact_ms_per_query": round(exact_ms, 3),
+            "results": report
+        }
+
+    @staticmethod
+    def _recall(approx: List[Tuple[np.ndarray, np.ndarray]], exact: List[Tuple[np.ndarray, np.ndarray]]) -> Optional[float]:
+        recalls = [
+            len(np.intersect1d(a_items, e_items)) / len(e_items)
+            for (a_items, _), (e_items, _) in zip(approx, exact)
+            if len(e_items)
+        ]
+        return float(np.mean(recalls)) if recalls else None
+
+    def tune_nprobe(self, queries, k: int = 10, target_recall: float = DEFAULT_TARGET_RECALL) -> int:
+        """
+        Chọn nprobe mặc định: giá trị nhỏ nhất đạt recall@k >= target_recall trên queries
+
+        Thử 1, 2, 4, ... rồi binary search trong khoảng cuối cùng; nprobe = n_lists
+        (exact) luôn đạt. Queries nên là một sample của queries thật (user vectors,
+        TF-IDF rows) vì recall phụ thuộc phân bố dữ liệu.
+        """
+        exact = self.exact_search(queries, k)
+
+        def recall_at(nprobe: int) -> float:
+            recall = self._recall(self.search(queries, k, nprobe=nprobe), exact)
+            return 1.0 if recall is None else recall
+
+        low, high = 0, 1
+        recalls = {}
+        while high < self.n_lists:
+            recalls[high] = recall_at(high)
+            if recalls[high] >= target_recall:
+                break
+            low, high = high, min(high * 2, self.n_lists)
+        else:
+            recalls.setdefault(high, 1.0)
+        while high - low > 1:
+            middle = (low + high) // 2
+            recalls[middle] = recall_at(middle)
+            if recalls[middle] >= target_recall:
+                high = middle
+            else:
+                low = middle
+
+        self.nprobe = high
+        self.tuning = {
+            "target_recall": target_recall,
+            f"recall@{k}": round(recalls[high], 4),
+            "n_queries": int(queries.shape[0])
+        }
+        logger.info(f"IVF nprobe tuned to {high}/{self.n_lists} lists: {self.tuning}")
+        return high
+
+    def metadata(self) -> Dict:
+        metadata = {"metric": self.metric, "n_lists": self.n_lists, "nprobe": self.nprobe}
+        if self.tuning is not None:
+            metadata["tuning"] = self.tuning
+        return metadata
+
+    def to_arrays(self, prefix: str = "ann_") -> Dict[str, np.ndarray]:
+        """Arrays để lưu cùng model artifacts"""
+        return {
+            f"{prefix}centroids": self.centroids,
+            f"{prefix}list_offsets": self.list_offsets,
+            f"{prefix}list_items": self.list_items
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], metadata: Dict, vectors, prefix: str = "ann_") -> "IVFIndex":
+        index = cls(
+            centroids=np.asarray(arrays[f"{prefix}centroids"]),
+            list_offsets=np.asarray(arrays[f"{prefix}list_offsets"]),
+            list_items=np.asarray(arrays[f"{prefix}list_items"]),
+            metric=metadata["metric"],
+            nprobe=metadata.get("nprobe", DEFAULT_NPROBE)
+        )
+        index.tuning = metadata.get("tuning")
+        if index.n_items != vectors.shape[0]:
+            raise ValueError(f"IVF index có {index.n_items} items, vectors có {vectors.shape[0]}")
+        index.vectors = vectors
+        return index
+
+    def save(self, path: str, extra_metadata: Optional[Dict] = None):
+        """
+        Lưu index vào thư mục: ann.npz (arrays + metadata JSON)
+
+        Ghi vào file tạm riêng của lần lưu rồi rename atomic (workers có thể lưu cùng lúc).
+        """
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        metadata = json.dumps({**self.metadata(), **(extra_metadata or {})})
+        fd, tmp_path = tempfile.mkstemp(prefix=".ann-", suffix=".npz", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, metadata=np.array(metadata), **self.to_arrays(prefix=""))
+            os.replace(tmp_path, directory / "ann.npz")
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path: str, vectors) -> Tuple[Optional["IVFIndex"], Dict]:
+        """Load index từ thư mục, (None, {}) nếu chưa có hoặc không khớp vectors"""
+        directory = Path(path)
+        try:
+            with np.load(directory / "ann.npz") as data:
+                metadata = json.loads(str(data["metadata"]))
+                arrays = {name: data[name] for name in ("centroids", "list_offsets", "list_items")}
+            return cls.from_arrays(arrays, metadata, vectors, prefix=""), metadata
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Failed to load IVF index from {directory}: {e}")
+            return None, {}
@@ -0,0 +1,450 @@
+"""
+Bulk ingestion cho user behaviors (view/book/rate) từ các service khác
+
+Events được parse từ NDJSON, đưa vào buffer in-memory và một background thread
+flush theo batch: một multi-row INSERT (hoặc COPY trên PostgreSQL) vào
+user_behaviors và upsert user_movie_scores trong cùng transaction. Sau khi commit,
+các flush listeners cập nhật state in-process của worker (interaction counts và
+recommendation cache của CF service, trending counters).
+
+Backpressure: khi buffer đầy, submit() từ chối cả batch (IngestionBufferFull) để
+client retry sau, thay vì để memory tăng không giới hạn.
+
+Batch lỗi do dữ liệu (DataError / IntegrityError) được chia đôi và flush lại cho tới
+khi cô lập được event lỗi; event đó bị loại khỏi buffer vào dead letters (đếm trong
+stats) thay vì bị requeue mãi. Lỗi khác (mất kết nối DB...) giữ nguyên batch trong
+buffer để thử lại ở chu kỳ sau.
+"""
+import csv
+import io
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.user_behavior import UserBehavior
+from app.services.user_scores import record_behaviors
+
+logger = logging.getLogger(__name__)
+
+# Điểm mặc định theo behavior (giống seed.py)
+BEHAVIOR_SCORES = {
+    'view': 1.0,
+    'book': 3.0,
+    'rate': 5.0,
+}
+
+# Số lỗi parse tối đa trả về cho client
+MAX_REPORTED_ERRORS = 20
+
+# user_id / movie_id là cột INTEGER (int32)
+MAX_ID = 2 ** 31 - 1
+
+# Số dead-lettered events gần nhất giữ lại để xem qua stats
+MAX_DEAD_LETTERS = 100
+
+# Tên exception DB-API 2.0 cho lỗi do dữ liệu của row (SQLAlchemy wrap cùng tên,
+# COPY qua raw psycopg2 cursor raise trực tiếp exception của driver)
+_DATA_ERROR_NAMES = {"DataError", "IntegrityError"}
+
+
+class BehaviorEvent(NamedTuple):
+    user_id: int
+    movie_id: int
+    behavior: str
+    score: float
+    created_at: datetime
+
+
+class IngestionBufferFull(Exception):
+    """Buffer không đủ chỗ cho batch, client nên retry sau"""
+
+
+class IngestionStopped(Exception):
+    """Ingestor đã dừng (worker đang shutdown)"""
+
+
+def _parse_event(data: Dict) -> BehaviorEvent:
+    user_id = data.get('user_id')
+    movie_id = data.get('movie_id')
+    behavior = data.get('behavior')
+    for name, value in (('user_id', user_id), ('movie_id', movie_id)):
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 < value <= MAX_ID:
+            raise ValueError(f"{name} phải là số nguyên dương (tối đa {MAX_ID})")
+    if not isinstance(behavior, str) or not behavior or len(behavior) > 50:
+        raise ValueError("behavior không hợp lệ")
+
+    score = data.get('score')
+    if score is None:
+        if behavior not in BEHAVIOR_SCORES:
+            raise ValueError(f"behavior '{behavior}' không có điểm mặc định, cần truyền score")
+        score = BEHAVIOR_SCORES[behavior]
+    elif not isinstance(score, (int, float)) or isinstance(score, bool) or not math.isfinite(score):
+        raise ValueError("score phải là số hữu hạn")
+
+    now = datetime.now(timezone.utc)
+    created_at = data.get('created_at')
+    if created_at is None:
+        created_at = now
+    else:
+        created_at = datetime.fromisoformat(str(created_at).replace('Z', '+00:00'))
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        if (created_at - now).total_seconds() > settings.INGEST_MAX_CLOCK_SKEW_SECONDS:
+            raise ValueError("created_at nằm trong tương lai")
+
+    return BehaviorEvent(user_id, movie_id, behavior, float(score), created_at)
+
+
+def parse_ndjson(body: bytes, max_events: int) -> Tuple[List[BehaviorEvent], List[Dict], int]:
+    """
+    Parse NDJSON body, mỗi dòng một event
+
+    Dòng lỗi bị bỏ qua và được báo lại (số dòng + lý do), các dòng hợp lệ vẫn được nhận.
+
+    Returns:
+        (events, errors, n_rejected)
+
+    Raises:
+        ValueError: nếu body có nhiều hơn max_events events
+    """
+    events: List[BehaviorEvent] = []
+    errors: List[Dict] = []
+    n_rejected = 0
+
+    for line_no, line in enumerate(body.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if len(events) + n_rejected >= max_events:
+            raise ValueError(f"Tối đa {max_events} events mỗi request")
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError("mỗi dòng phải là một JSON object")
+            events.append(_parse_event(data))
+        except (ValueError, TypeError) as e:
+            n_rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": line_no, "error": str(e)})
+
+    return events, errors, n_rejected
+
+
+class BehaviorIngestor:
+    """In-memory buffer + background flusher cho user behaviors"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_buffer: int = 100000,
+        flush_batch_size: int = 5000,
+        flush_interval: float = 1.0
+    ):
+        """
+        Args:
+            session_factory: tạo DB session cho mỗi lần flush
+            max_buffer: số events tối đa đang chờ flush (vượt quá -> backpressure)
+            flush_batch_size: số events tối đa mỗi transaction
+            flush_interval: thời gian tối đa (giây) một event nằm trong buffer
+        """
+        self.session_factory = session_factory
+        self.max_buffer = max_buffer
+        self.flush_batch_size = flush_batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer: Deque[BehaviorEvent] = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._listeners: List[Callable[[List[BehaviorEvent]], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+        self.counters = {
+            "accepted": 0,
+            "rejected_full": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dead_lettered": 0
+        }
+        self.dead_letters: Deque[Dict] = deque(maxlen=MAX_DEAD_LETTERS)
+        self.last_error: Optional[str] = None
+        self.last_flush_seconds: Optional[float] = None
+
+    def add_flush_listener(self, listener: Callable[[List[BehaviorEvent]], None]):
+        """
+        Đăng ký callback chạy sau mỗi flush đã commit (cập nhật state per-user)
+        """
+        self._listeners.append(listener)
+
+    def start(self):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name="behavior-ingestor", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """
+        Dừng nhận events và flush phần còn lại trong buffer
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def submit(self, events: List[BehaviorEvent]) -> int:
+        """
+        Đưa một batch events vào buffer (all-or-nothing)
+
+        Raises:
+            IngestionBufferFull: buffer không đủ chỗ cho cả batch
+            IngestionStopped: ingestor đã dừng
+        """
+        with self._condition:
+            if self._stopped:
+                raise IngestionStopped("Ingestion đã dừng")
+            if len(self._buffer) + len(events) > self.max_buffer:
+                self.counters["rejected_full"] += len(events)
+                raise IngestionBufferFull(
+                    f"Buffer đầy ({len(self._buffer)}/{self.max_buffer} events)"
+                )
+            self._buffer.extend(events)
+            self.counters["accepted"] += len(events)
+            if len(self._buffer) >= self.flush_batch_size:
+                self._condition.notify()
+        return len(events)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopped and len(self._buffer) < self.flush_batch_size:
+                    self._condition.wait(self.flush_interval)
+                stopped = self._stopped
+            if stopped:
+                return
+            if self._buffer and not self.flush() and self._buffer:
+                # DB lỗi: chờ một chu kỳ rồi thử lại, events vẫn nằm trong buffer
+                time.sleep(self.flush_interval)
+
+    def _take_batch(self) -> List[BehaviorEvent]:
+        with self._condition:
+            n = min(self.flush_batch_size, len(self._buffer))
+            return [self._buffer.popleft() for _ in range(n)]
+
+    def _requeue(self, batch: List[BehaviorEvent]):
+        with self._condition:
+            self._buffer.extendleft(reversed(batch))
+
+    def flush(self) -> bool:
+        """
+        Flush toàn bộ buffer theo batch
+
+        Returns:
+            False nếu DB lỗi (phần chưa ghi của batch được đưa lại vào đầu buffer)
+        """
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return True
+                pending = self._flush_isolating(batch)
+                if pending:
+                    self._requeue(pending)
+                    return False
+
+    def _flush_isolating(self, batch: List[BehaviorEvent]) -> List[BehaviorEvent]:
+        """
+        Flush batch; nếu lỗi do dữ liệu thì chia đôi để cô lập và dead-letter event lỗi
+
+        Returns:
+            Các events chưa ghi được vì lỗi không do dữ liệu (cần thử lại sau)
+        """
+        error = self._flush_batch(batch)
+        if error is None:
+            return []
+        if not _is_data_error(error):
+            return batch
+        if len(batch) == 1:
+            self._dead_letter(batch[0], error)
+            return []
+        middle = len(batch) // 2
+        pending = self._flush_isolating(batch[:middle])
+        if pending:
+            return pending + batch[middle:]
+        return self._flush_isolating(batch[middle:])
+
+    def _dead_letter(self, event: BehaviorEvent, error: Exception):
+        self.counters["dead_lettered"] += 1
+        self.dead_letters.append({
+            **event._asdict(),
+            "created_at": event.created_at.isoformat(),
+            "error": str(error)
+        })
+        logger.error(f"Dropped behavior event {event}: {error}")
+
+    def _flush_batch(self, batch: List[BehaviorEvent]) -> Optional[Exception]:
+        """
+        Ghi một batch trong một transaction
+
+        Returns:
+            None nếu đã commit, exception nếu lỗi (transaction đã rollback)
+        """
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            self._insert_behaviors(db, batch)
+            record_behaviors(db, batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.counters["failed_flushes"] += 1
+            self.last_error = str(e)
+            logger.error(f"Behavior flush failed ({len(batch)} events): {e}")
+            return e
+        finally:
+            db.close()
+
+        self.counters["flushed"] += len(batch)
+        self.counters["flushes"] += 1
+        self.last_flush_seconds = time.perf_counter() - start
+
+        for listener in self._listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                logger.warning(f"Behavior flush listener failed: {e}")
+        return None
+
+    @staticmethod
+    def _insert_behaviors(db: Session, batch: List[BehaviorEvent]):
+        """
+        COPY trên PostgreSQL (psycopg2), multi-row INSERT với các database khác
+        """
+        connection = db.connection()
+        if connection.dialect.name == "postgresql":
+            cursor = connection.connection.cursor()
+            if hasattr(cursor, "copy_expert"):
+                rows = io.StringIO()
+                writer = csv.writer(rows)
+                for e in batch:
+                    writer.writerow((e.user_id, e.movie_id, e.behavior, e.score, e.created_at.isoformat()))
+                rows.seek(0)
+                try:
+                    cursor.copy_expert(
+                        "COPY user_behaviors (user_id, movie_id, behavior, score, created_at) "
+                        "FROM STDIN WITH (FORMAT csv)",
+                        rows
+                    )
+                finally:
+                    cursor.close()
+                return
+            cursor.close()
+
+        db.execute(insert(UserBehavior), [e._asdict() for e in batch])
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "buffered": self.buffered,
+            "max_buffer": self.max_buffer,
+            "flush_batch_size": self.flush_batch_size,
+            "flush_interval": self.flush_interval,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "last_flush_seconds": round(self.last_flush_seconds, 4) if self.last_flush_seconds is not None else None,
+            "last_error": self.last_error,
+            "dead_letters": list(self.dead_letters)
+        }
+
+
+def _is_data_error(error: Exception) -> bool:
+    """Lỗi do dữ liệu của một số rows (thử lại nguyên batch sẽ lỗi tiếp)"""
+    return any(cls.__name__ in _DATA_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _update_cf_service(events: List[BehaviorEvent]):
+    """
+    Cập nhật interaction counts, watched pairs và xóa cached recommendations của
+    users vừa có behaviors mới (ở worker này ngay, ở các workers khác theo rate limit)
+
+    Users chưa có trong model được fold-in từ user_movie_scores ở đây (flusher thread),
+    không phải trên request path.
+    """
+    from app.database import SessionLocal
+    from app.services.collaborative_service import get_cf_service, publish_user_invalidations
+
+    counts: Dict[int, int] = {}
+    for e in events:
+        counts[e.user_id] = counts.get(e.user_id, 0) + 1
+
+    cf_service = get_cf_service()
+    cf_service.record_interactions(counts)
+    cf_service.record_watched((e.user_id, e.movie_id) for e in events)
+
+    new_users = [user_id for user_id in counts if user_id not in cf_service.user_id_map]
+    if new_users and cf_service.item_factors is not None:
+        db = SessionLocal()
+        try:
+            cf_service.fold_in_users(new_users, db)
+        finally:
+            db.close()
+
+    for user_id in counts:
+        cf_service.invalidate_user(user_id)
+    publish_user_invalidations()
+
+
+def _update_trending(events: List[BehaviorEvent]):
+    """Cộng events vào trending counters, ghi snapshot theo chu kỳ"""
+    from app.services.trending import get_trending
+
+    trending = get_trending()
+    trending.add(events)
+    trending.maybe_sync()
+
+
+# Singleton instance (per worker)
+_ingestor = None
+
+
+def get_behavior_ingestor() -> BehaviorIngestor:
+    """
+    Get or create behavior ingestor (flusher thread được start khi tạo)
+    """
+    global _ingestor
+    if _ingestor is None:
+        from app.database import SessionLocal
+
+        _ingestor = BehaviorIngestor(
+            session_factory=SessionLocal,
+            max_buffer=settings.INGEST_BUFFER_SIZE,
+            flush_batch_size=settings.INGEST_FLUSH_BATCH_SIZE,
+            flush_interval=settings.INGEST_FLUSH_INTERVAL
+        )
+        _ingestor.add_flush_listener(_update_cf_service)
+        _ingestor.add_flush_listener(_update_trending)
+        _ingestor.start()
+    return _ingestor
+
+
+def shutdown_behavior_ingestor():
+    """
+    Flush events còn trong buffer khi worker dừng (không tạo ingestor nếu chưa dùng)
+    """
+    if _ingestor is not None:
+        _ingestor.stop()
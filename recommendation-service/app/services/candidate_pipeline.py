@@ -0,0 +1,365 @@
+"""
+Hybrid recommendations hai stage cho /personalized
+
+1. Candidate generation: mỗi source (CF top-K, content profile, co-watch, trending,
+   popular) trả về tối đa HYBRID_CANDIDATES_PER_SOURCE movies; sources chạy lần
+   lượt theo thứ tự ưu tiên; source đầu tiên luôn chạy, các sources còn lại bị bỏ
+   qua khi hết time budget của stage.
+2. Ranking: mọi candidate được score trên cùng một feature matrix
+   (n_candidates, n_features) - CF predicted score, content similarity, co-watch,
+   trending, popularity, mỗi feature min-max về [0, 1] trên các candidates - rồi
+   kết hợp tuyến tính bằng một matrix-vector product. Feature đầu tiên luôn được
+   tính, các features chưa tính khi hết budget của stage được coi là 0.
+
+Chi phí ranking theo số candidates (vài trăm), không theo kích thước catalog; thêm
+source mới chỉ thêm candidates, không thêm lượt scan toàn catalog. Thời gian mỗi
+stage / source được ghi vào metrics hybrid_stage_seconds / hybrid_source_seconds.
+"""
+import logging
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.catalog import MovieCatalog, MovieRecord, get_movie_catalog
+from app.services.leaderboards import POPULAR_MIN_VOTES, get_leaderboards
+from app.services.metrics import metrics
+from app.services.trending import get_trending
+from app.services.user_scores import UserScore
+
+logger = logging.getLogger(__name__)
+
+# Số movies có score cao nhất trong lịch sử dùng làm seeds (content profile, co-watch)
+NUM_SEED_MOVIES = 5
+
+# Trọng số của các features ngoài collaborative/content (hai features này chia nhau
+# collaborative_weight của request)
+FEATURE_WEIGHTS = {
+    "co_watch": 0.15,
+    "trending": 0.1,
+    "popularity": 0.05
+}
+
+# Feature -> (recommendation_type, reason) khi feature đó đóng góp nhiều nhất
+FEATURE_LABELS = {
+    "collaborative": ("collaborative", "Dựa trên người dùng tương tự"),
+    "content": ("content-based", "Tương tự '{title}'"),
+    "co_watch": ("co-watch", "Người xem phim bạn thích cũng xem phim này"),
+    "trending": ("trending", "Đang thịnh hành"),
+    "popularity": ("popularity", "Phim phổ biến")
+}
+
+# Label khi không feature nào đóng góp (mọi contribution của row bằng 0)
+NEUTRAL_LABEL = ("hybrid", "Gợi ý dành cho bạn")
+
+
+class PipelineContext(NamedTuple):
+    """Dữ liệu của một request, dùng chung cho các sources và features"""
+    db: Session
+    user_id: int
+    user_scores: List[UserScore]
+    watched_movie_ids: Set[int]
+    collaborative_weight: float
+    cf_service: object
+    rec_service: object
+    catalog: MovieCatalog
+
+    @property
+    def movie_scores(self) -> Dict[int, float]:
+        return {s.movie_id: s.score for s in self.user_scores}
+
+    def seed_movies(self) -> List[int]:
+        ranked = sorted(self.user_scores, key=lambda s: s.score, reverse=True)
+        return [s.movie_id for s in ranked[:NUM_SEED_MOVIES]]
+
+
+class RankedMovie(NamedTuple):
+    movie: MovieRecord
+    score: float
+    recommendation_type: str
+    reason: str
+
+
+# Source: (context, limit) -> [(movie_id, source score), ...], score lớn hơn là tốt hơn
+CandidateSource = Callable[[PipelineContext, int], List[Tuple[int, float]]]
+
+
+def _collaborative_candidates(ctx: PipelineContext, limit: int) -> List[Tuple[int, float]]:
+    # CSR row in-memory khi có (watched_movie_ids vẫn được loại ở bước ranking)
+    return ctx.cf_service.recommend(
+        user_id=ctx.user_id,
+        top_n=limit,
+        exclude_watched=True,
+        watched_movie_ids=None if ctx.cf_service.has_watched_row(ctx.user_id) else ctx.watched_movie_ids
+    )
+
+
+def _content_candidates(ctx: PipelineContext, limit: int) -> List[Tuple[int, float]]:
+    results = ctx.rec_service.get_content_based_from_profile(
+        db=ctx.db,
+        movie_scores=ctx.movie_scores,
+        exclude_movie_ids=ctx.watched_movie_ids,
+        limit=limit,
+        num_source_movies=NUM_SEED_MOVIES
+    )
+    return [(movie.id, similarity) for movie, similarity, _, _ in results]
+
+
+def _co_watch_candidates(ctx: PipelineContext, limit: int) -> List[Tuple[int, float]]:
+    return [
+        (movie_id, float(count))
+        for movie_id, count in ctx.cf_service.co_watched_movies(ctx.seed_movies(), limit)
+    ]
+
+
+def _trending_candidates(ctx: PipelineContext, limit: int) -> List[Tuple[int, float]]:
+    return [(movie.id, score) for movie, score in get_trending().top(ctx.db, limit=limit)]
+
+
+def _popular_candidates(ctx: PipelineContext, limit: int) -> List[Tuple[int, float]]:
+    movies = get_leaderboards().ranked(ctx.db, limit=limit, min_votes=POPULAR_MIN_VOTES[0])
+    # Score theo thứ hạng trong leaderboard
+    return [(movie.id, float(len(movies) - rank)) for rank, movie in enumerate(movies)]
+
+
+# Thứ tự ưu tiên khi hết time budget
+CANDIDATE_SOURCES: Dict[str, CandidateSource] = {
+    "collaborative": _collaborative_candidates,
+    "content": _content_candidates,
+    "co_watch": _co_watch_candidates,
+    "trending": _trending_candidates,
+    "popular": _popular_candidates
+}
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    """Min-max về [0, 1] trên các candidates; NaN (không có giá trị) -> 0"""
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    result = np.zeros(len(values))
+    if not finite.any():
+        return result
+    low, high = values[finite].min(), values[finite].max()
+    result[finite] = (values[finite] - low) / (high - low) if high > low else 1.0
+    return result
+
+
+def _source_column(candidates: Dict[str, Tuple[np.ndarray, np.ndarray]], source: str, movie_ids: np.ndarray) -> np.ndarray:
+    """Score của một source cho từng candidate (NaN nếu source không trả về movie đó)"""
+    values = np.full(len(movie_ids), np.nan)
+    if source in candidates:
+        source_ids, source_scores = candidates[source]
+        # movie_ids đã sort; movies bị loại (watched, ngoài catalog) không có trong đó
+        pos = np.minimum(np.searchsorted(movie_ids, source_ids), max(len(movie_ids) - 1, 0))
+        found = (movie_ids[pos] == source_ids) if len(movie_ids) else np.zeros(len(source_ids), dtype=bool)
+        values[pos[found]] = source_scores[found]
+    return values
+
+
+class HybridPipeline:
+    """Candidate generation + ranking với time budget cho từng stage"""
+
+    def __init__(
+        self,
+        sources: Optional[Dict[str, CandidateSource]] = None,
+        candidates_per_source: int = settings.HYBRID_CANDIDATES_PER_SOURCE,
+        candidate_budget_ms: float = settings.HYBRID_CANDIDATE_BUDGET_MS,
+        ranking_budget_ms: float = settings.HYBRID_RANKING_BUDGET_MS
+    ):
+        self.sources = sources if sources is not None else dict(CANDIDATE_SOURCES)
+        self.candidates_per_source = candidates_per_source
+        self.candidate_budget_ms = candidate_budget_ms
+        self.ranking_budget_ms = ranking_budget_ms
+        # Features theo thứ tự tính (khi hết budget, các features sau bị bỏ qua)
+        self.features: Dict[str, Callable] = {
+            "collaborative": self._collaborative_feature,
+            "content": self._content_feature,
+            "co_watch": self._co_watch_feature,
+            "trending": self._trending_feature,
+            "popularity": self._popularity_feature
+        }
+
+    def generate_candidates(self, ctx: PipelineContext) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], Dict]:
+        """
+        Returns:
+            (source -> (movie_ids, scores), report)
+        """
+        start = time.perf_counter()
+        candidates = {}
+        report = {"budget_ms": self.candidate_budget_ms, "sources": {}, "skipped": [], "failed": []}
+
+        for name, source in self.sources.items():
+            # Source đầu tiên luôn chạy, các sources sau chỉ khi còn budget
+            if candidates and (time.perf_counter() - start) * 1000 >= self.candidate_budget_ms:
+                report["skipped"].append(name)
+                continue
+            source_start = time.perf_counter()
+            try:
+                results = source(ctx, self.candidates_per_source)
+            except Exception as e:
+                # Một source lỗi không làm hỏng request, các sources khác vẫn được dùng
+                logger.warning(f"Candidate source {name} failed for user {ctx.user_id}: {e}")
+                report["failed"].append(name)
+                continue
+            seconds = time.perf_counter() - source_start
+            metrics.observe("hybrid_source_seconds", seconds, labels={"source": name})
+
+            if results:
+                movie_ids = np.fromiter((movie_id for movie_id, _ in results), dtype=np.int64, count=len(results))
+                scores = np.fromiter((score for _, score in results), dtype=np.float64, count=len(results))
+                # Một movie chỉ giữ score đầu tiên (cao nhất) của source
+                movie_ids, first = np.unique(movie_ids, return_index=True)
+                candidates[name] = (movie_ids, scores[first])
+            report["sources"][name] = {"count": len(results or []), "seconds": round(seconds, 4)}
+
+        report["seconds"] = round(time.perf_counter() - start, 4)
+        self._record_stage("candidates", report["seconds"], self.candidate_budget_ms, bool(report["skipped"]))
+        return candidates, report
+
+    def rank(
+        self,
+        ctx: PipelineContext,
+        candidates: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        top_n: int
+    ) -> Tuple[List[RankedMovie], Dict]:
+        """
+        Score toàn bộ candidates trên feature matrix và chọn top N
+        """
+        start = time.perf_counter()
+        report = {"budget_ms": self.ranking_budget_ms, "features": [], "skipped": []}
+
+        movie_ids = (
+            np.unique(np.concatenate([ids for ids, _ in candidates.values()]))
+            if candidates else np.empty(0, dtype=np.int64)
+        )
+        positions = ctx.catalog.positions(movie_ids)
+        keep = positions >= 0
+        if ctx.watched_movie_ids:
+            watched = np.fromiter(ctx.watched_movie_ids, dtype=np.int64, count=len(ctx.watched_movie_ids))
+            keep &= ~np.isin(movie_ids, watched)
+        movie_ids, positions = movie_ids[keep], positions[keep]
+        report["n_candidates"] = len(movie_ids)
+
+        weight = max(0.0, min(1.0, ctx.collaborative_weight))
+        weights = dict(FEATURE_WEIGHTS, collaborative=weight, content=1.0 - weight)
+
+        names = list(self.features)
+        features = np.zeros((len(movie_ids), len(names)))
+        state = {}
+        for column, name in enumerate(names):
+            if report["features"] and (time.perf_counter() - start) * 1000 >= self.ranking_budget_ms:
+                report["skipped"].append(name)
+                continue
+            features[:, column] = self.features[name](ctx, movie_ids, positions, candidates, state)
+            report["features"].append(name)
+
+        weight_vector = np.array([weights.get(name, 0.0) for name in names])
+        contributions = features * weight_vector
+        scores = contributions.sum(axis=1)
+
+        results = []
+        k = min(top_n, len(movie_ids))
+        if k > 0:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            dominant = np.argmax(contributions[top], axis=1)
+            has_signal = contributions[top].max(axis=1) > 0
+            for row, feature, signal in zip(top, dominant, has_signal):
+                if signal:
+                    recommendation_type = FEATURE_LABELS[names[feature]][0]
+                    reason = self._reason(names[feature], row, state)
+                else:
+                    recommendation_type, reason = NEUTRAL_LABEL
+                results.append(RankedMovie(
+                    movie=ctx.catalog.record(positions[row]),
+                    score=float(scores[row]),
+                    recommendation_type=recommendation_type,
+                    reason=reason
+                ))
+
+        report["seconds"] = round(time.perf_counter() - start, 4)
+        self._record_stage("ranking", report["seconds"], self.ranking_budget_ms, bool(report["skipped"]))
+        return results, report
+
+    def run(self, ctx: PipelineContext, top_n: int) -> Tuple[List[RankedMovie], Dict]:
+        candidates, candidate_report = self.generate_candidates(ctx)
+        results, ranking_report = self.rank(ctx, candidates, top_n)
+        report = {"candidates": candidate_report, "ranking": ranking_report}
+        logger.debug(f"Hybrid pipeline for user {ctx.user_id}: {report}")
+        return results, report
+
+    def _record_stage(self, stage: str, seconds: float, budget_ms: float, truncated: bool):
+        metrics.observe("hybrid_stage_seconds", seconds, labels={"stage": stage})
+        if truncated or seconds * 1000 > budget_ms:
+            metrics.inc("hybrid_budget_exceeded_total", labels={"stage": stage})
+
+    # --- Features: (ctx, movie_ids, catalog positions, candidates, state) -> values [0, 1] ---
+
+    def _collaborative_feature(self, ctx, movie_ids, positions, candidates, state) -> np.ndarray:
+        return _normalize(ctx.cf_service.score_items(ctx.user_id, movie_ids))
+
+    def _content_feature(self, ctx, movie_ids, positions, candidates, state) -> np.ndarray:
+        similarities, source_titles = ctx.rec_service.content_similarity(
+            ctx.db, ctx.movie_scores, movie_ids, num_source_movies=NUM_SEED_MOVIES
+        )
+        state["content_titles"] = source_titles
+        return _normalize(similarities)
+
+    def _co_watch_feature(self, ctx, movie_ids, positions, candidates, state) -> np.ndarray:
+        return _normalize(_source_column(candidates, "co_watch", movie_ids))
+
+    def _trending_feature(self, ctx, movie_ids, positions, candidates, state) -> np.ndarray:
+        # Tra counters của chính các candidates (không chỉ top trending)
+        return _normalize(get_trending().scores(movie_ids))
+
+    def _popularity_feature(self, ctx, movie_ids, positions, candidates, state) -> np.ndarray:
+        # Rating IMDB nhân log số votes, giống thứ tự của leaderboards
+        ratings = ctx.catalog.imdb_rating[positions]
+        votes = np.maximum(ctx.catalog.no_of_votes[positions], 0)
+        return _normalize(np.nan_to_num(ratings, nan=0.0) * np.log1p(votes))
+
+    def _reason(self, feature: str, row: int, state: Dict) -> str:
+        reason = FEATURE_LABELS[feature][1]
+        if feature == "content":
+            titles = state.get("content_titles")
+            title = titles[row] if titles is not None else None
+            return reason.format(title=title) if title else "Tương tự các phim bạn đã xem"
+        return reason
+
+
+def build_context(
+    db: Session,
+    user_id: int,
+    user_scores: List[UserScore],
+    watched_movie_ids: Set[int],
+    collaborative_weight: float
+) -> PipelineContext:
+    from app.services.collaborative_service import get_cf_service
+    from app.services.recommendation_service import RecommendationService
+
+    return PipelineContext(
+        db=db,
+        user_id=user_id,
+        user_scores=user_scores,
+        watched_movie_ids=watched_movie_ids,
+        collaborative_weight=collaborative_weight,
+        cf_service=get_cf_service(),
+        rec_service=RecommendationService(db),
+        catalog=get_movie_catalog(db)
+    )
+
+
+# Singleton instance (per worker)
+_pipeline = None
+
+
+def get_hybrid_pipeline() -> HybridPipeline:
+    """
+    Get or create hybrid pipeline
+    """
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = HybridPipeline()
+    return _pipeline
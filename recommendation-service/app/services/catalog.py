@@ -0,0 +1,265 @@
+"""
+Movie catalog dùng chung cho các cache in-process
+
+- catalog_fingerprint: version rẻ của bảng movies (một aggregate query)
+- MovieRecord: bản copy read-only của một movie row, dùng được ngoài DB session
+- MovieCatalog: catalog dạng cột (numpy arrays + interned string table) với
+  inverted indexes thể loại / đạo diễn / diễn viên -> movie positions
+
+Positions là thứ tự theo movie id tăng dần, giống các TF-IDF rows.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.movie import Movie
+
+logger = logging.getLogger(__name__)
+
+STAR_ATTRS = ('star1', 'star2', 'star3', 'star4')
+
+
+def split_genres(genre: Optional[str]) -> List[str]:
+    """Tách chuỗi genre "Crime, Drama" thành list"""
+    if not genre:
+        return []
+    return [g.strip() for g in genre.split(',') if g.strip()]
+
+
+def catalog_fingerprint(db: Session) -> str:
+    """
+    Cheap catalog version: one aggregate query instead of loading every movie
+
+    count(*) catches inserts/deletes, max(id) catches delete+insert, and
+    max(updated_at) catches content edits (movie-service bumps it on update).
+    """
+    count, max_id, max_updated_at = db.query(
+        func.count(Movie.id),
+        func.max(Movie.id),
+        func.max(Movie.updated_at)
+    ).one()
+
+    updated = max_updated_at.isoformat() if hasattr(max_updated_at, 'isoformat') else max_updated_at
+    return f"{count}:{max_id}:{updated}"
+
+
+class MovieRecord(NamedTuple):
+    """Read-only movie row (cùng tên field với Movie model)"""
+    id: int
+    series_title: str
+    released_year: Optional[str]
+    genre: Optional[str]
+    imdb_rating: Optional[float]
+    meta_score: Optional[int]
+    director: Optional[str]
+    poster_link: Optional[str]
+    overview: Optional[str]
+    no_of_votes: Optional[int]
+    star1: Optional[str]
+    star2: Optional[str]
+    star3: Optional[str]
+    star4: Optional[str]
+
+
+class _InvertedIndex:
+    """key code -> movie positions, lưu dạng CSR (keys sorted + offsets + positions)"""
+
+    def __init__(self, keys: np.ndarray, positions: np.ndarray):
+        valid = keys >= 0
+        keys, positions = keys[valid], positions[valid]
+        order = np.lexsort((positions, keys))
+        sorted_keys = keys[order]
+        self.keys, starts = np.unique(sorted_keys, return_index=True)
+        self.offsets = np.append(starts, len(sorted_keys)).astype(np.int64)
+        self.positions = positions[order].astype(np.int32)
+
+    def get(self, key: int) -> np.ndarray:
+        i = int(np.searchsorted(self.keys, key))
+        if i >= len(self.keys) or self.keys[i] != key:
+            return self.positions[:0]
+        return self.positions[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.keys.nbytes + self.offsets.nbytes + self.positions.nbytes)
+
+
+class MovieCatalog:
+    """Read-only columnar catalog"""
+
+    STRING_FIELDS = ('series_title', 'released_year', 'genre', 'director', 'poster_link', 'overview')
+
+    def __init__(self, movies: Sequence, fingerprint: str):
+        """
+        Args:
+            movies: Movie rows (hoặc tuples có cùng tên cột) theo thứ tự id tăng dần
+            fingerprint: catalog_fingerprint tại thời điểm load
+        """
+        start = time.perf_counter()
+        self.fingerprint = fingerprint
+        n_movies = len(movies)
+
+        # Interned string table, code -1 = NULL
+        self._strings: List[str] = []
+        string_codes: Dict[str, int] = {}
+
+        def intern(value: Optional[str]) -> int:
+            if value is None:
+                return -1
+            code = string_codes.get(value)
+            if code is None:
+                code = string_codes[value] = len(self._strings)
+                self._strings.append(value)
+            return code
+
+        self.ids = np.array([m.id for m in movies], dtype=np.int64)
+        self.imdb_rating = np.array(
+            [m.imdb_rating if m.imdb_rating is not None else np.nan for m in movies], dtype=np.float64
+        )
+        self.no_of_votes = np.array(
+            [m.no_of_votes if m.no_of_votes is not None else -1 for m in movies], dtype=np.int64
+        )
+        self.meta_score = np.array(
+            [m.meta_score if m.meta_score is not None else -1 for m in movies], dtype=np.int32
+        )
+        self.columns: Dict[str, np.ndarray] = {
+            field: np.array([intern(getattr(m, field)) for m in movies], dtype=np.int32)
+            for field in self.STRING_FIELDS
+        }
+        self.stars = np.array(
+            [[intern(getattr(m, attr)) for attr in STAR_ATTRS] for m in movies], dtype=np.int32
+        ).reshape(n_movies, len(STAR_ATTRS))
+
+        # Genres: vocab + movie -> genre codes (CSR) + inverted index
+        genre_lists = [split_genres(m.genre) for m in movies]
+        self.genre_vocab: List[str] = sorted({g for genres in genre_lists for g in genres})
+        genre_code = {g: i for i, g in enumerate(self.genre_vocab)}
+        self.genre_indptr = np.zeros(n_movies + 1, dtype=np.int64)
+        self.genre_indptr[1:] = np.cumsum([len(genres) for genres in genre_lists])
+        self.genre_codes = np.array(
+            [genre_code[g] for genres in genre_lists for g in genres], dtype=np.int32
+        )
+        genre_rows = np.repeat(np.arange(n_movies), np.diff(self.genre_indptr))
+        self._genre_index = _InvertedIndex(self.genre_codes.astype(np.int64), genre_rows)
+
+        self.director = self.columns['director']
+        self._director_index = _InvertedIndex(self.director.astype(np.int64), np.arange(n_movies))
+        self._cast_index = _InvertedIndex(
+            self.stars.ravel().astype(np.int64),
+            np.repeat(np.arange(n_movies), len(STAR_ATTRS))
+        )
+        self._string_codes = string_codes
+
+        self.build_seconds = time.perf_counter() - start
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def string(self, code: int) -> Optional[str]:
+        return self._strings[code] if code >= 0 else None
+
+    def position(self, movie_id: int) -> Optional[int]:
+        pos = int(np.searchsorted(self.ids, movie_id))
+        if pos < len(self.ids) and self.ids[pos] == movie_id:
+            return pos
+        return None
+
+    def positions(self, movie_ids) -> np.ndarray:
+        """Vectorized: movie ids -> positions, -1 nếu không có"""
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if len(self.ids) == 0 or len(movie_ids) == 0:
+            return np.full(len(movie_ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, movie_ids), len(self.ids) - 1)
+        return np.where(self.ids[pos] == movie_ids, pos, -1)
+
+    def record(self, pos: int) -> MovieRecord:
+        """Materialize một row thành MovieRecord"""
+        rating = self.imdb_rating[pos]
+        votes = self.no_of_votes[pos]
+        meta_score = self.meta_score[pos]
+        columns = self.columns
+        return MovieRecord(
+            id=int(self.ids[pos]),
+            series_title=self.string(columns['series_title'][pos]),
+            released_year=self.string(columns['released_year'][pos]),
+            genre=self.string(columns['genre'][pos]),
+            imdb_rating=None if np.isnan(rating) else float(rating),
+            meta_score=None if meta_score < 0 else int(meta_score),
+            director=self.string(columns['director'][pos]),
+            poster_link=self.string(columns['poster_link'][pos]),
+            overview=self.string(columns['overview'][pos]),
+            no_of_votes=None if votes < 0 else int(votes),
+            star1=self.string(self.stars[pos, 0]),
+            star2=self.string(self.stars[pos, 1]),
+            star3=self.string(self.stars[pos, 2]),
+            star4=self.string(self.stars[pos, 3])
+        )
+
+    def genres_of(self, pos: int) -> np.ndarray:
+        """Genre codes của một movie"""
+        return self.genre_codes[self.genre_indptr[pos]:self.genre_indptr[pos + 1]]
+
+    def movies_with_genre(self, genre_code: int) -> np.ndarray:
+        return self._genre_index.get(genre_code)
+
+    def movies_by_director(self, director: str) -> np.ndarray:
+        code = self._string_codes.get(director)
+        return self._director_index.get(code) if code is not None else self._director_index.positions[:0]
+
+    def movies_with_cast(self, star: str) -> np.ndarray:
+        code = self._string_codes.get(star)
+        return self._cast_index.get(code) if code is not None else self._cast_index.positions[:0]
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.ids, self.imdb_rating, self.no_of_votes, self.meta_score, self.stars,
+                  self.genre_indptr, self.genre_codes, *self.columns.values()]
+        index_bytes = self._genre_index.nbytes + self._director_index.nbytes + self._cast_index.nbytes
+        return int(sum(a.nbytes for a in arrays) + index_bytes)
+
+    def stats(self) -> Dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "n_movies": len(self),
+            "n_genres": len(self.genre_vocab),
+            "n_strings": len(self._strings),
+            "array_bytes": self.nbytes,
+            "string_bytes": sum(len(s) for s in self._strings),
+            "build_seconds": round(self.build_seconds, 4)
+        }
+
+
+# Catalog đang dùng trong worker (thay khi fingerprint thay đổi)
+_catalog: Optional[MovieCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_movie_catalog(db: Session, fingerprint: Optional[str] = None) -> MovieCatalog:
+    """
+    Get the columnar catalog, reloading movies only when the fingerprint changed
+
+    Args:
+        db: Database session
+        fingerprint: Catalog fingerprint if the caller already has it
+    """
+    global _catalog
+    if fingerprint is None:
+        fingerprint = catalog_fingerprint(db)
+
+    catalog = _catalog
+    if catalog is not None and catalog.fingerprint == fingerprint:
+        return catalog
+
+    with _catalog_lock:
+        if _catalog is None or _catalog.fingerprint != fingerprint:
+            # Chỉ lấy các cột cần thiết, không hydrate ORM objects
+            columns = [getattr(Movie, field) for field in MovieRecord._fields]
+            movies = db.query(*columns).order_by(Movie.id).all()
+            _catalog = MovieCatalog(movies, fingerprint)
+            logger.info(f"Movie catalog loaded: {_catalog.stats()}")
+        return _catalog
@@ -1,18 +1,40 @@
 import numpy as np
+from scipy.sparse import csr_matrix
 import pickle
+import json
 import os
-from pathlib import Path
+import threading
+import time
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Tuple, Optional, Dict
+from typing import Callable, Iterable, Iterator, List, Set, Tuple, Optional, Dict
 from datetime import datetime
 import logging
 
-from app.models.user_behavior import UserBehavior
 from app.models.movie import Movie
+from app.services.als import build_rating_matrix, als_explicit, als_implicit, solve_least_squares
+from app.services.model_store import IdIndex, ModelStore
+from app.services.ann_index import DEFAULT_TARGET_RECALL, TUNING_QUERIES, IVFIndex
+from app.services.interaction_matrix import InteractionMatrix
+from app.services.factor_storage import PRECISIONS, CompactFactors, append_rows, factor_nbytes, factor_scores
+from app.services.recommendation_cache import RecommendationCache
+from app.services.metrics import metrics
+from app.services.evaluation import overlap_at_k
+from app.services.user_scores import (
+    get_all_scores,
+    get_interaction_counts,
+    get_user_interaction_count,
+    get_user_scores,
+    get_watched_movie_ids,
+    get_watched_pairs,
+    UserScore
+)
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Các engine training được hỗ trợ
+TRAINING_ENGINES = ("sgd", "als", "als_implicit")
+
 class CollaborativeFilteringService:
     def __init__(
         self, 
@@ -20,10 +42,22 @@ class CollaborativeFilteringService:
         learning_rate: float = 0.01,
         n_iterations: int = 100, 
         regularization: float = 0.02,
-        model_path: str = "weights/cf_model.pkl",
+        model_path: str = "weights/cf_model",
         min_interactions: int = 3,
         lr_decay: float = 0.95,
-        random_seed: int = 42
+        random_seed: int = 42,
+        als_iterations: int = 15,
+        als_regularization: float = 0.1,
+        implicit_alpha: float = 40.0,
+        legacy_model_path: Optional[str] = "weights/cf_model.pkl",
+        keep_versions: int = 5,
+        cache_size: int = 10000,
+        cache_ttl: float = 600.0,
+        ann_min_items: int = 50000,
+        ann_nprobe: int = 0,
+        ann_target_recall: float = DEFAULT_TARGET_RECALL,
+        serving_precision: str = "float32",
+        load_model: bool = True
     ):
         """
         Initialize Matrix Factorization model với bias terms
@@ -33,10 +67,24 @@ class CollaborativeFilteringService:
             learning_rate: learning rate cho SGD
             n_iterations: số vòng lặp training
             regularization: lambda cho regularization
-            model_path: đường dẫn lưu model
+            model_path: thư mục chứa các version của model (xem model_store)
             min_interactions: số tương tác tối thiểu để user được coi là "active"
             lr_decay: tỷ lệ giảm learning rate mỗi epoch
             random_seed: seed cho reproducibility
+            als_iterations: số vòng lặp cho ALS engine
+            als_regularization: lambda cho ALS (lớn hơn SGD vì giải closed-form)
+            implicit_alpha: hệ số confidence cho implicit ALS (c = 1 + alpha * score)
+            legacy_model_path: file pickle cũ, được migrate sang format mới nếu chưa có version nào
+            keep_versions: số version giữ lại để rollback
+            cache_size: số users tối đa trong recommendation cache
+            cache_ttl: thời gian sống (giây) của một cache entry
+            ann_min_items: số movies tối thiểu để dùng ANN index thay cho exact scoring
+            ann_nprobe: số IVF lists được search cho mỗi query (0 = tự chọn khi build index)
+            ann_target_recall: recall@10 mục tiêu khi tự chọn nprobe (xem IVFIndex.tune_nprobe)
+            serving_precision: float32 | float16 | int8 - dạng lưu factors của model đã load
+                (xem factor_storage); training luôn dùng full precision
+            load_model: load version hiện tại từ disk (False khi instance chỉ để train
+                rồi lưu version mới, ví dụ training job)
         """
         self.n_factors = n_factors
         self.initial_lr = learning_rate
@@ -44,8 +92,21 @@ class CollaborativeFilteringService:
         self.n_iterations = n_iterations
         self.regularization = regularization
         self.model_path = model_path
+        self.legacy_model_path = legacy_model_path
+        self.model_store = ModelStore(model_path, keep_versions=keep_versions)
+        self.model_version = None
         self.min_interactions = min_interactions
         self.lr_decay = lr_decay
+        self.random_seed = random_seed
+        self.als_iterations = als_iterations
+        self.als_regularization = als_regularization
+        self.implicit_alpha = implicit_alpha
+        self.ann_min_items = ann_min_items
+        self.ann_nprobe = ann_nprobe
+        self.ann_target_recall = ann_target_recall
+        if serving_precision not in PRECISIONS:
+            raise ValueError(f"Precision không hợp lệ: {serving_precision}. Hỗ trợ: {', '.join(PRECISIONS)}")
+        self.serving_precision = serving_precision
         
         # Set random seed
         np.random.seed(random_seed)
@@ -56,53 +117,62 @@ class CollaborativeFilteringService:
         self.user_bias = None
         self.item_bias = None
         self.global_mean = 0.0
+        self.engine = None
+        
+        # Gram matrix của item factors cho implicit fold-in: (item_factors, gram)
+        self._item_gram_cache = None
+        
+        # ANN index trên [item_factors, item_bias] (None khi catalog nhỏ)
+        self.ann_index: Optional[IVFIndex] = None
+        
+        # Mappings (id -> index, tra cứu bằng searchsorted trên sorted int arrays)
+        self.user_id_map = IdIndex(np.empty(0, dtype=np.int64))
+        self.movie_id_map = IdIndex(np.empty(0, dtype=np.int64))
+        
+        # Số behaviors theo user index (seed từ training data, tăng khi có behaviors mới)
+        # dùng cho cold-start check không cần query DB; None với model cũ chưa có array này
+        self.user_interactions: Optional[np.ndarray] = None
         
-        # Mappings
-        self.user_id_map = {}
-        self.movie_id_map = {}
-        self.reverse_user_map = {}
-        self.reverse_movie_map = {}
+        # Buffers có capacity dư cho user rows thêm bởi fold-in (xem append_rows)
+        self._user_row_buffers: Dict[str, np.ndarray] = {}
+        
+        # Các cặp user-movie đã tương tác (CSR, cập nhật khi có behaviors mới) để loại
+        # watched movies không cần query DB; None với model cũ chưa có
+        self.watched: Optional[InteractionMatrix] = None
         
         # Cache
-        self._recommendation_cache = {}
+        self._recommendation_cache = RecommendationCache(max_entries=cache_size, ttl_seconds=cache_ttl)
+        # Khóa cập nhật user arrays (fold-in chạy song song trong threadpool)
+        self._update_lock = threading.Lock()
         self._last_train_time = None
         
         # Load model if exists
-        self._load_model()
+        if load_model:
+            self._load_model()
     
     def _build_sparse_rating_data(self, db: Session) -> Tuple[List, Dict, Dict]:
         """
-        Xây dựng sparse rating data từ user behaviors
+        Xây dựng sparse rating data từ user_movie_scores (điểm đã decay theo thời gian)
         Trả về list of (user_idx, item_idx, rating) thay vì dense matrix
         """
-        # Aggregate behaviors theo user-movie
-        behaviors = db.query(
-            UserBehavior.user_id,
-            UserBehavior.movie_id,
-            func.sum(UserBehavior.score).label('total_score'),
-            func.count(UserBehavior.id).label('interaction_count')
-        ).group_by(
-            UserBehavior.user_id,
-            UserBehavior.movie_id
-        ).all()
-        
-        if not behaviors:
+        # Một row cho mỗi cặp user-movie, đã được tổng hợp khi ghi behaviors
+        scores = get_all_scores(db)
+        
+        if not scores:
             return [], {}, {}
         
         # Tạo mapping
-        unique_users = sorted(set(b.user_id for b in behaviors))
-        unique_movies = sorted(set(b.movie_id for b in behaviors))
+        unique_users = sorted(set(user_id for user_id, _, _ in scores))
+        unique_movies = sorted(set(movie_id for _, movie_id, _ in scores))
         
         user_id_map = {user_id: idx for idx, user_id in enumerate(unique_users)}
         movie_id_map = {movie_id: idx for idx, movie_id in enumerate(unique_movies)}
         
         # Tạo sparse rating list
-        rating_data = []
-        for behavior in behaviors:
-            user_idx = user_id_map[behavior.user_id]
-            movie_idx = movie_id_map[behavior.movie_id]
-            rating = behavior.total_score
-            rating_data.append((user_idx, movie_idx, rating))
+        rating_data = [
+            (user_id_map[user_id], movie_id_map[movie_id], rating)
+            for user_id, movie_id, rating in scores
+        ]
         
         return rating_data, user_id_map, movie_id_map
     
@@ -120,13 +190,27 @@ class CollaborativeFilteringService:
         """
         Tính global mean rating
         """
-        if not rating_data:
+        if len(rating_data) == 0:
             return 0.0
-        return np.mean([r[2] for r in rating_data])
+        return float(np.mean(np.asarray(rating_data, dtype=np.float64)[:, 2]))
     
-    def train(self, db: Session, verbose: bool = True):
+    def train(
+        self,
+        db: Session,
+        verbose: bool = True,
+        engine: str = "sgd",
+        progress_callback: Optional[Callable[[int, int, float], None]] = None,
+        save: bool = True
+    ):
         """
-        Train Matrix Factorization model với SGD và bias terms
+        Train Matrix Factorization model từ user behaviors
+        
+        Args:
+            db: database session
+            verbose: log tiến trình training
+            engine: "sgd" (mặc định), "als" (explicit ALS) hoặc "als_implicit"
+            progress_callback: gọi sau mỗi iteration với (iteration, n_iterations, rmse)
+            save: lưu model thành version mới (lỗi khi lưu chỉ được log, xem save_model)
         """
         logger.info("Starting collaborative filtering training...")
         
@@ -136,23 +220,103 @@ class CollaborativeFilteringService:
         if not rating_data:
             raise ValueError("Không có dữ liệu để train model")
         
-        self.user_id_map = user_id_map
-        self.movie_id_map = movie_id_map
+        return self.fit(
+            rating_data, user_id_map, movie_id_map,
+            engine=engine, verbose=verbose, progress_callback=progress_callback,
+            interaction_counts=get_interaction_counts(db), save=save
+        )
+    
+    def fit(
+        self,
+        rating_data: List[Tuple],
+        user_id_map: Dict,
+        movie_id_map: Dict,
+        engine: str = "sgd",
+        verbose: bool = True,
+        progress_callback: Optional[Callable[[int, int, float], None]] = None,
+        interaction_counts: Optional[Dict[int, int]] = None,
+        save: bool = True
+    ) -> Dict:
+        """
+        Train model từ sparse rating data đã build sẵn
+        
+        Args:
+            rating_data: list of (user_idx, item_idx, rating) hoặc array shape (n, 3)
+            user_id_map: user_id -> user_idx
+            movie_id_map: movie_id -> item_idx
+            engine: "sgd", "als" hoặc "als_implicit"
+            verbose: log tiến trình training
+            progress_callback: gọi sau mỗi iteration với (iteration, n_iterations, rmse)
+            interaction_counts: user_id -> số behaviors (mặc định: số movies trong rating_data)
+            save: lưu model thành version mới (False khi chỉ đánh giá, ví dụ hyperparameter search)
+        """
+        if engine not in TRAINING_ENGINES:
+            raise ValueError(f"Engine không hợp lệ: {engine}. Hỗ trợ: {', '.join(TRAINING_ENGINES)}")
         
-        # Create reverse mappings
-        self.reverse_user_map = {v: k for k, v in user_id_map.items()}
-        self.reverse_movie_map = {v: k for k, v in movie_id_map.items()}
+        self.user_id_map = IdIndex.from_mapping(user_id_map)
+        self.movie_id_map = IdIndex.from_mapping(movie_id_map)
         
         n_users = len(user_id_map)
         n_movies = len(movie_id_map)
+        n_ratings = len(rating_data)
         
+        logger.info(f"Training ({engine}) with {n_users} users, {n_movies} movies, {n_ratings} ratings")
+        
+        if engine == "sgd":
+            rmse = self._fit_sgd(rating_data, n_users, n_movies, verbose, progress_callback)
+        else:
+            rmse = self._fit_als(rating_data, n_users, n_movies, engine, verbose, progress_callback)
+        
+        self.engine = engine
+        self._build_ann_index()
+        
+        pairs = np.asarray(rating_data)[:, :2].astype(np.int64) if n_ratings else np.empty((0, 2), dtype=np.int64)
+        self.watched = InteractionMatrix.from_pairs(pairs[:, 0], pairs[:, 1], self.user_id_map, n_movies)
+        
+        self.user_interactions = np.zeros(n_users, dtype=np.int32)
+        if interaction_counts is None:
+            np.add.at(self.user_interactions, pairs[:, 0], 1)
+        else:
+            for user_id, user_idx in user_id_map.items():
+                self.user_interactions[user_idx] = interaction_counts.get(user_id, 0)
+        
+        # Clear cache after training
+        self._recommendation_cache.clear()
+        self._last_train_time = datetime.now()
+        
+        # Save model
+        if save:
+            self._save_model()
+        
+        logger.info("Training completed successfully!")
+        
+        return {
+            "engine": engine,
+            "n_users": n_users,
+            "n_movies": n_movies,
+            "n_ratings": n_ratings,
+            "final_rmse": rmse,
+            "global_mean": self.global_mean
+        }
+    
+    def _fit_sgd(
+        self,
+        rating_data: List[Tuple],
+        n_users: int,
+        n_movies: int,
+        verbose: bool,
+        progress_callback: Optional[Callable[[int, int, float], None]] = None
+    ) -> float:
+        """
+        Train Matrix Factorization model với SGD và bias terms
+        """
         # Initialize factors and bias
         self._initialize_factors(n_users, n_movies)
+        self.learning_rate = self.initial_lr
         
         # Compute global mean
         self.global_mean = self._compute_global_mean(rating_data)
         
-        logger.info(f"Training with {n_users} users, {n_movies} movies, {len(rating_data)} ratings")
         logger.info(f"Global mean rating: {self.global_mean:.2f}")
         
         # Convert to numpy array for faster indexing
@@ -210,44 +374,88 @@ class CollaborativeFilteringService:
             
             if verbose and (iteration + 1) % 10 == 0:
                 logger.info(f"Iteration {iteration + 1}/{self.n_iterations} - RMSE: {rmse:.4f}, LR: {self.learning_rate:.6f}")
+            
+            if progress_callback:
+                progress_callback(iteration, self.n_iterations, float(rmse))
         
-        # Clear cache after training
-        self._recommendation_cache.clear()
-        self._last_train_time = datetime.now()
+        return rmse
+    
+    def _fit_als(
+        self,
+        rating_data: List[Tuple],
+        n_users: int,
+        n_movies: int,
+        engine: str,
+        verbose: bool,
+        progress_callback: Optional[Callable[[int, int, float], None]] = None
+    ) -> float:
+        """
+        Train bằng Alternating Least Squares trên sparse CSR matrix
+        """
+        rating_array = np.asarray(rating_data, dtype=np.float64)
+        matrix = build_rating_matrix(
+            rating_array[:, 0].astype(np.int64),
+            rating_array[:, 1].astype(np.int64),
+            rating_array[:, 2],
+            n_users,
+            n_movies
+        )
         
-        # Save model
-        self._save_model()
+        def log_progress(iteration: int, rmse: float):
+            if verbose:
+                logger.info(f"ALS iteration {iteration + 1}/{self.als_iterations} - RMSE: {rmse:.4f}")
+            if progress_callback:
+                progress_callback(iteration, self.als_iterations, rmse)
         
-        logger.info("Training completed successfully!")
+        random_state = np.random.RandomState(self.random_seed)
+        if engine == "als":
+            result = als_explicit(
+                matrix,
+                n_factors=self.n_factors,
+                regularization=self.als_regularization,
+                n_iterations=self.als_iterations,
+                random_state=random_state,
+                progress_callback=log_progress
+            )
+        else:
+            result = als_implicit(
+                matrix,
+                n_factors=self.n_factors,
+                regularization=self.als_regularization,
+                n_iterations=self.als_iterations,
+                alpha=self.implicit_alpha,
+                random_state=random_state,
+                progress_callback=log_progress
+            )
         
-        return {
-            "n_users": n_users,
-            "n_movies": n_movies,
-            "n_ratings": n_ratings,
-            "final_rmse": rmse,
-            "global_mean": self.global_mean
-        }
+        self.user_factors = result["user_factors"]
+        self.item_factors = result["item_factors"]
+        self.user_bias = result["user_bias"]
+        self.item_bias = result["item_bias"]
+        self.global_mean = result["global_mean"]
+        
+        return result["rmse"]
     
     def predict(self, user_id: int, movie_id: int) -> float:
         """
         Dự đoán score cho một user-movie pair
         """
         if self.user_factors is None:
-            return self.global_mean
+            return float(self.global_mean)
         
         # Check if user exists
         if user_id not in self.user_id_map:
             # Cold-start user: return item bias + global mean
             if movie_id in self.movie_id_map:
                 movie_idx = self.movie_id_map[movie_id]
-                return self.global_mean + self.item_bias[movie_idx]
-            return self.global_mean
+                return float(self.global_mean + self.item_bias[movie_idx])
+            return float(self.global_mean)
         
         # Check if movie exists
         if movie_id not in self.movie_id_map:
             # Cold-start item: return user bias + global mean
             user_idx = self.user_id_map[user_id]
-            return self.global_mean + self.user_bias[user_idx]
+            return float(self.global_mean + self.user_bias[user_idx])
         
         user_idx = self.user_id_map[user_id]
         movie_idx = self.movie_id_map[movie_id]
@@ -261,162 +469,867 @@ class CollaborativeFilteringService:
         
         return float(prediction)
     
+    def _ann_item_vectors(self) -> np.ndarray:
+        """
+        Item vectors cho ANN: [q_i, b_i], query tương ứng là [p_u, 1]
+        
+        Khi đó inner product = score - global_mean - user_bias (hằng số theo user)
+        """
+        return np.hstack([
+            np.asarray(self.item_factors, dtype=np.float32),
+            np.asarray(self.item_bias, dtype=np.float32)[:, None]
+        ])
+    
+    def _ann_serving_vectors(self, vectors: np.ndarray):
+        """Vectors gắn vào ANN index để score candidates (nén theo serving_precision)"""
+        if self.serving_precision == "float32":
+            return vectors
+        return CompactFactors.quantize(vectors, self.serving_precision)
+    
+    def _ann_user_queries(self, user_indices: np.ndarray) -> np.ndarray:
+        factors = np.asarray(self.user_factors[user_indices], dtype=np.float32)
+        return np.hstack([factors, np.ones((len(factors), 1), dtype=np.float32)])
+    
+    def _build_ann_index(self):
+        """
+        Build ANN index cho item factors nếu catalog đủ lớn
+        """
+        if self.item_factors is None or len(self.item_factors) < self.ann_min_items:
+            self.ann_index = None
+            return
+        
+        self.ann_index = self._new_ann_index()
+    
+    def _new_ann_index(self) -> IVFIndex:
+        """
+        IVF index trên item vectors; nprobe theo cấu hình, hoặc tune trên một sample users
+        """
+        vectors = self._ann_item_vectors()
+        index = IVFIndex.build(
+            vectors,
+            metric="ip",
+            nprobe=self.ann_nprobe,
+            random_state=self.random_seed
+        )
+        index.vectors = self._ann_serving_vectors(vectors)
+        if self.ann_nprobe <= 0:
+            self._tune_ann_index(index)
+        return index
+    
+    def _tune_ann_index(self, index: IVFIndex):
+        rng = np.random.RandomState(self.random_seed)
+        n_users = len(self.user_factors)
+        sample = rng.choice(n_users, min(TUNING_QUERIES, n_users), replace=False)
+        index.tune_nprobe(self._ann_user_queries(sample), target_recall=self.ann_target_recall)
+    
+    def evaluate_ann(self, k: int = 10, n_queries: int = 200, nprobe_values: Optional[List[int]] = None) -> Dict:
+        """
+        Đo recall@k của ANN index so với exact scoring trên một sample users
+        """
+        if self.user_factors is None:
+            raise ValueError("Model chưa được train")
+        
+        index = self.ann_index
+        if index is None:
+            # Catalog nhỏ: build tạm một index để xem trade-off
+            index = self._new_ann_index()
+        
+        rng = np.random.RandomState(self.random_seed)
+        n_users = len(self.user_factors)
+        sample = rng.choice(n_users, min(n_queries, n_users), replace=False)
+        report = index.evaluate(self._ann_user_queries(sample), k=k, nprobe_values=nprobe_values)
+        report["serving"] = self.ann_index is not None
+        return report
+    
+    def evaluate_precision(self, k: int = 10, n_queries: int = 200, block_size: int = 64) -> Dict:
+        """
+        So sánh factors float16/int8 với float32 đã lưu: bytes của user/item factors,
+        overlap@k của top-k (exact scoring trên toàn catalog) và sai số score
+        """
+        if self.user_factors is None or self.model_version is None:
+            raise ValueError("Model chưa được train")
+        
+        arrays, _ = self.model_store.load(version=self.model_version, mmap=True, verify=False)
+        user_factors, item_factors = arrays['user_factors'], arrays['item_factors']
+        item_bias = np.asarray(arrays['item_bias'], dtype=np.float32)
+        k = min(k, len(item_factors))
+        
+        rng = np.random.RandomState(self.random_seed)
+        sample = np.sort(rng.choice(len(user_factors), min(n_queries, len(user_factors)), replace=False))
+        
+        def top_k(scores: np.ndarray) -> np.ndarray:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+        
+        # User bias là hằng số theo user, không ảnh hưởng thứ tự
+        reference = {}
+        start_time = time.perf_counter()
+        for start in range(0, len(sample), block_size):
+            queries = np.asarray(user_factors[sample[start:start + block_size]], dtype=np.float32)
+            scores = queries @ np.asarray(item_factors, dtype=np.float32).T + item_bias
+            reference[start] = (scores, top_k(scores))
+        reference_ms = (time.perf_counter() - start_time) * 1000.0 / len(sample)
+        
+        full_bytes = 4 * (user_factors.size + item_factors.size)
+        report = {"k": k, "n_queries": len(sample), "serving_precision": self.serving_precision, "precisions": {}}
+        for precision in PRECISIONS:
+            if precision == "float32":
+                report["precisions"][precision] = {
+                    "factor_bytes": int(full_bytes), "memory_ratio": 1.0, "saved_bytes": 0,
+                    "overlap_at_k": 1.0, "overlap_at_k_min": 1.0, "max_abs_score_error": 0.0,
+                    "scoring_ms_per_query": round(reference_ms, 3)
+                }
+                continue
+            
+            compact_items = CompactFactors.quantize(item_factors, precision)
+            # Quantization theo từng row: chỉ cần nén các users được sample
+            compact_users = CompactFactors.quantize(user_factors[sample], precision)
+            overlaps, max_error = [], 0.0
+            start_time = time.perf_counter()
+            for start, (ref_scores, ref_top) in reference.items():
+                scores = compact_items.scores(compact_users[start:start + block_size]) + item_bias
+                max_error = max(max_error, float(np.abs(scores - ref_scores).max()))
+                for recommended, expected in zip(top_k(scores), ref_top):
+                    overlaps.append(overlap_at_k(recommended.tolist(), expected.tolist(), k))
+            elapsed = time.perf_counter() - start_time
+            
+            # Bytes cho toàn bộ users, ước tính từ bytes/row của sample
+            user_bytes = compact_users.nbytes / max(1, len(sample)) * len(user_factors)
+            factor_bytes = int(compact_items.nbytes + user_bytes)
+            report["precisions"][precision] = {
+                "factor_bytes": factor_bytes,
+                "memory_ratio": round(factor_bytes / full_bytes, 4) if full_bytes else None,
+                "saved_bytes": int(full_bytes - factor_bytes),
+                "overlap_at_k": round(float(np.mean(overlaps)), 4),
+                "overlap_at_k_min": round(float(np.min(overlaps)), 4),
+                "max_abs_score_error": round(max_error, 6),
+                "scoring_ms_per_query": round(elapsed * 1000.0 / len(sample), 3)
+            }
+        return report
+    
     def _get_watched_movies(self, user_id: int, db: Session) -> set:
         """
         Lấy danh sách movies đã xem của user
         """
-        watched = db.query(UserBehavior.movie_id).filter(
-            UserBehavior.user_id == user_id
-        ).distinct().all()
-        return {m[0] for m in watched}
+        return get_watched_movie_ids(db, user_id)
     
     def recommend(
         self, 
         user_id: int, 
         top_n: int = 10,
         exclude_watched: bool = True, 
-        db: Session = None
+        db: Session = None,
+        watched_movie_ids: Optional[Set[int]] = None
     ) -> List[Tuple[int, float]]:
         """
         Gợi ý top N movies cho user (vectorized)
+        
+        Kết quả được tính và cache ở max(top_n, cache.max_top_n), request nhỏ hơn
+        được cắt từ cùng một entry. watched_movie_ids (đã load sẵn, ví dụ qua
+        AsyncSession) thay cho query watched movies bằng db.
         """
         if self.user_factors is None:
             return []
         
         # Check cache
-        cache_key = f"{user_id}_{top_n}_{exclude_watched}"
-        if cache_key in self._recommendation_cache:
-            return self._recommendation_cache[cache_key]
+        cached = self._recommendation_cache.get(user_id, exclude_watched, top_n)
+        if cached is not None:
+            return cached
         
-        # Get watched movies
-        watched_movies = set()
-        if exclude_watched and db:
-            watched_movies = self._get_watched_movies(user_id, db)
+        n_results = max(top_n, self._recommendation_cache.max_top_n)
+        # Invalidation trong lúc tính (ingest listener) làm put() bỏ qua kết quả này
+        cache_token = self._recommendation_cache.token()
         
-        # User không có trong training set (cold-start)
-        if user_id not in self.user_id_map:
-            # Return popular items based on item bias
-            all_movie_ids = list(self.movie_id_map.keys())
-            predictions = []
-            
-            for movie_id in all_movie_ids:
-                if movie_id in watched_movies:
-                    continue
-                movie_idx = self.movie_id_map[movie_id]
-                score = self.global_mean + self.item_bias[movie_idx]
-                predictions.append((movie_id, score))
-            
-            predictions.sort(key=lambda x: x[1], reverse=True)
-            result = predictions[:top_n]
-            self._recommendation_cache[cache_key] = result
-            return result
+        # Positions (trong movie_id_map) của watched movies
+        excluded = self._watched_positions(user_id, watched_movie_ids, db) if exclude_watched else None
         
-        user_idx = self.user_id_map[user_id]
+        # Vectorized prediction cho tất cả movies (index i <-> movie_id_map.keys()[i])
+        all_movie_ids = self.movie_id_map.keys()
         
-        # Vectorized prediction cho tất cả movies
-        all_movie_ids = np.array(list(self.movie_id_map.keys()))
-        all_movie_indices = np.array([self.movie_id_map[mid] for mid in all_movie_ids])
+        # User không có trong training set (cold-start): popular items theo item bias
+        user_idx = self.user_id_map.get(user_id)
+        if user_idx is None:
+            scores = np.asarray(self.global_mean + self.item_bias, dtype=np.float64)
         
-        # Compute scores vectorized
-        scores = (
-            self.global_mean +
-            self.user_bias[user_idx] +
-            self.item_bias[all_movie_indices] +
-            np.dot(self.item_factors[all_movie_indices], self.user_factors[user_idx])
-        )
+        # Catalog lớn: chỉ score các items trong nprobe IVF lists gần user nhất
+        elif self.ann_index is not None:
+            positions, scores = self.ann_index.search(
+                self._ann_user_queries(np.array([user_idx])), n_results, exclude=[excluded]
+            )[0]
+            offset = self.global_mean + self.user_bias[user_idx]
+            predictions = [
+                (int(all_movie_ids[pos]), float(offset + score))
+                for pos, score in zip(positions, scores)
+            ]
+            self._recommendation_cache.put(user_id, exclude_watched, predictions, n_results, token=cache_token)
+            return predictions[:top_n]
         
-        # Filter watched movies
-        if exclude_watched:
-            mask = np.array([mid not in watched_movies for mid in all_movie_ids])
-            all_movie_ids = all_movie_ids[mask]
-            scores = scores[mask]
+        else:
+            # Compute scores vectorized
+            scores = np.asarray(
+                self.global_mean +
+                self.user_bias[user_idx] +
+                self.item_bias +
+                factor_scores(self.item_factors, self.user_factors[user_idx]),
+                dtype=np.float64
+            )
         
-        # Get top N
-        if len(scores) == 0:
-            return []
+        # Filter watched movies: một phép gán trên item positions
+        if excluded is not None and len(excluded):
+            scores[excluded] = -np.inf
         
-        top_indices = np.argsort(scores)[::-1][:top_n]
-        predictions = [(int(all_movie_ids[i]), float(scores[i])) for i in top_indices]
+        # Top N không cần sort toàn bộ catalog
+        k = min(n_results, len(scores))
+        if k == 0:
+            return []
+        top_indices = np.argpartition(-scores, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-scores[top_indices], kind="stable")]
+        predictions = [
+            (int(all_movie_ids[i]), float(scores[i]))
+            for i in top_indices if np.isfinite(scores[i])
+        ]
         
         # Cache result
-        self._recommendation_cache[cache_key] = predictions
+        self._recommendation_cache.put(user_id, exclude_watched, predictions, n_results, token=cache_token)
         
-        return predictions
+        return predictions[:top_n]
     
-    def is_cold_start_user(self, user_id: int, db: Session) -> bool:
+    def score_items(self, user_id: int, movie_ids: np.ndarray) -> np.ndarray:
         """
-        Kiểm tra user có phải cold-start không
+        Predicted scores của user cho một tập movies (chi phí theo số movies, không
+        theo catalog); NaN với movies không có trong model, item bias cho cold-start user
         """
-        if user_id not in self.user_id_map:
-            return True
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        positions = self.movie_id_map.lookup(movie_ids)
+        known = positions >= 0
+        scores = np.full(len(movie_ids), np.nan)
+        if self.item_factors is None or not known.any():
+            return scores
         
-        # Check số lượng interactions
-        interaction_count = db.query(func.count(UserBehavior.id)).filter(
-            UserBehavior.user_id == user_id
-        ).scalar()
+        item_positions = positions[known]
+        scores[known] = self.global_mean + self.item_bias[item_positions]
+        user_idx = self.user_id_map.get(user_id)
+        if user_idx is not None:
+            scores[known] += self.user_bias[user_idx] + factor_scores(
+                self.item_factors[item_positions], self.user_factors[user_idx]
+            )
+        return scores
+    
+    def co_watched_movies(self, movie_ids: List[int], limit: int) -> List[Tuple[int, int]]:
+        """
+        Movies được xem cùng với movie_ids nhiều nhất (interaction matrix in-memory)
         
-        return interaction_count < self.min_interactions
+        Returns:
+            [(movie_id, số users đã xem cùng), ...], rỗng với model chưa có matrix
+        """
+        if self.watched is None or not movie_ids:
+            return []
+        seeds = self.movie_id_map.lookup(np.asarray(movie_ids, dtype=np.int64))
+        positions, counts = self.watched.co_watched(seeds[seeds >= 0], limit)
+        all_movie_ids = self.movie_id_map.keys()
+        return [(int(all_movie_ids[pos]), int(count)) for pos, count in zip(positions, counts)]
     
-    def _save_model(self):
+    def _watched_positions(
+        self,
+        user_id: int,
+        watched_movie_ids: Optional[Set[int]] = None,
+        db: Session = None
+    ) -> Optional[np.ndarray]:
         """
-        Lưu model ra disk
+        Item positions của các movies user đã tương tác
+        
+        Thứ tự: watched_movie_ids của caller (đã load cùng request) -> interaction
+        matrix in-memory -> query DB (model cũ chưa có matrix, hoặc user mới mà
+        worker này chưa thấy behaviors).
         """
-        try:
-            model_dir = Path(self.model_path).parent
-            model_dir.mkdir(parents=True, exist_ok=True)
+        if watched_movie_ids is not None:
+            source = "caller"
+        elif self.watched is not None and (user_id in self.watched or db is None):
+            metrics.inc("recommendation_watched_lookups_total", labels={"source": "memory"})
+            return self.watched.row(user_id)
+        elif db is not None:
+            source = "db"
+            watched_movie_ids = self._get_watched_movies(user_id, db)
+        else:
+            return None
+        
+        metrics.inc("recommendation_watched_lookups_total", labels={"source": source})
+        if not watched_movie_ids:
+            return None
+        positions = self.movie_id_map.lookup(
+            np.fromiter(watched_movie_ids, dtype=np.int64, count=len(watched_movie_ids))
+        )
+        return positions[positions >= 0]
+    
+    def _solve_user_vector(self, ratings: Dict[int, float]) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Regularized least-squares fold-in: giải latent vector (và bias) của một user
+        với item_factors/item_bias cố định
+        
+        Returns:
+            (user_vector, user_bias) hoặc None nếu user không có movie nào trong model
+        """
+        known = [(self.movie_id_map[mid], score) for mid, score in ratings.items() if mid in self.movie_id_map]
+        if not known:
+            return None
+        
+        item_indices = np.array([idx for idx, _ in known])
+        scores = np.array([score for _, score in known], dtype=np.float64)
+        n_known = len(known)
+        indptr = np.array([0, n_known])
+        
+        # Weights bằng 0 ngoài các movies của user: chỉ cần factors của các movies này
+        item_factors = np.asarray(self.item_factors[item_indices], dtype=np.float64)
+        
+        def weights(data: np.ndarray) -> csr_matrix:
+            return csr_matrix((data, np.arange(n_known), indptr), shape=(1, n_known))
+        
+        if self.engine == "als_implicit":
+            confidence = 1.0 + self.implicit_alpha * scores
+            solution = solve_least_squares(
+                weights(confidence - 1.0),
+                weights(confidence),
+                item_factors,
+                self.als_regularization,
+                base_gram=self._item_gram()
+            )
+            return solution[0], 0.0
+        
+        # Explicit: [p_u, b_u] với design [q_i, 1], target r - mu - b_i
+        design = np.hstack([item_factors, np.ones((n_known, 1))])
+        targets = scores - self.global_mean - self.item_bias[item_indices]
+        solution = solve_least_squares(
+            weights(np.ones(n_known)),
+            weights(targets),
+            design,
+            self.als_regularization * n_known
+        )
+        return solution[0, :self.n_factors], float(solution[0, self.n_factors])
+    
+    def _item_gram(self) -> np.ndarray:
+        """
+        item_factors.T @ item_factors cho implicit fold-in (cache tới khi item factors đổi)
+        """
+        cached = self._item_gram_cache
+        if cached is not None and cached[0] is self.item_factors:
+            return cached[1]
+        item_factors = self.item_factors
+        if isinstance(item_factors, CompactFactors):
+            gram = item_factors.gram()
+        else:
+            gram = item_factors.T @ item_factors
+        self._item_gram_cache = (item_factors, gram)
+        return gram
+    
+    def fold_in_user(
+        self,
+        user_id: int,
+        db: Session = None,
+        user_scores: Optional[List[UserScore]] = None
+    ) -> bool:
+        """
+        Cập nhật latent vector của một user từ behaviors hiện tại mà không retrain
+        
+        User mới được thêm vào user_id_map/user_bias; user đã có được giải lại
+        vector với item_factors cố định. Item factors không thay đổi, nên full
+        retrain định kỳ vẫn cần để cập nhật phía item.
+        
+        user_scores (đã load sẵn) thay cho query bằng db. Có thể gọi từ nhiều
+        threads (threadpool của async endpoints), phần cập nhật arrays được khóa.
+        
+        Returns:
+            True nếu user đã có vector trong model sau khi fold-in
+        """
+        if self.item_factors is None:
+            return False
+        
+        if user_scores is None:
+            user_scores = get_user_scores(db, user_id)
+        ratings = {s.movie_id: s.score for s in user_scores}
+        interaction_count = sum(s.interaction_count for s in user_scores)
+        result = self._solve_user_vector(ratings)
+        if result is None:
+            return user_id in self.user_id_map
+        
+        vector, bias = result
+        compact = isinstance(self.user_factors, CompactFactors)
+        if not compact:
+            vector = vector.astype(self.user_factors.dtype)
+        
+        with self._update_lock:
+            if user_id in self.user_id_map:
+                user_idx = self.user_id_map[user_id]
+                if compact:
+                    self.user_factors.set_row(user_idx, vector)
+                else:
+                    # Arrays memory-mapped là read-only: copy-on-write cho worker này
+                    if not self.user_factors.flags.writeable:
+                        self.user_factors = np.array(self.user_factors)
+                    self.user_factors[user_idx] = vector
+                if not self.user_bias.flags.writeable:
+                    self.user_bias = np.array(self.user_bias)
+                self.user_bias[user_idx] = bias
+                if self.user_interactions is not None:
+                    self._writable_user_interactions()[user_idx] = interaction_count
+            else:
+                # Append vào buffers có capacity dư (amortized O(1) mỗi user, không copy
+                # toàn bộ user matrix trong lúc giữ lock)
+                if compact:
+                    self.user_factors.append_row(vector)
+                else:
+                    self.user_factors = self._append_user_row("user_factors", vector[None, :])
+                self.user_bias = self._append_user_row("user_bias", np.asarray([bias], dtype=self.user_bias.dtype))
+                if self.user_interactions is not None:
+                    self.user_interactions = self._append_user_row(
+                        "user_interactions", np.asarray([interaction_count], dtype=np.int32)
+                    )
+                self.user_id_map.add(user_id)
+        
+        self.record_watched((user_id, movie_id) for movie_id in ratings)
+        self.invalidate_user(user_id)
+        logger.info(f"Folded in user {user_id} with {len(ratings)} rated movies")
+        return True
+    
+    def fold_in_users(self, user_ids: List[int], db: Session) -> Dict[str, int]:
+        """
+        Fold-in nhiều users (ví dụ sau khi nhận batch behaviors mới)
+        """
+        updated = 0
+        for user_id in set(user_ids):
+            if self.fold_in_user(user_id, db):
+                updated += 1
+        return {"requested": len(set(user_ids)), "updated": updated}
+    
+    def _append_user_row(self, name: str, rows: np.ndarray) -> np.ndarray:
+        """append_rows cho một user array (gọi trong _update_lock)"""
+        array, self._user_row_buffers[name] = append_rows(
+            getattr(self, name), rows, self._user_row_buffers.get(name)
+        )
+        return array
+    
+    def _writable_user_interactions(self) -> np.ndarray:
+        if not self.user_interactions.flags.writeable:
+            self.user_interactions = np.array(self.user_interactions)
+        return self.user_interactions
+    
+    def record_interactions(self, counts: Dict[int, int]):
+        """
+        Cộng số behaviors mới vào interaction counts in-memory (gọi sau khi ghi behaviors)
+        
+        User chưa có trong model vẫn là cold-start cho tới khi fold-in/retrain.
+        """
+        if self.user_interactions is None:
+            return
+        user_ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        increments = np.fromiter(counts.values(), dtype=np.int32, count=len(counts))
+        indices = self.user_id_map.lookup(user_ids)
+        known = (indices >= 0) & (indices < len(self.user_interactions))
+        if known.any():
+            with self._update_lock:
+                np.add.at(self._writable_user_interactions(), indices[known], increments[known])
+    
+    def record_watched(self, pairs: Iterable[Tuple[int, int]]):
+        """
+        Thêm các cặp (user_id, movie_id) mới vào interaction matrix in-memory
+        
+        Giống record_interactions, chỉ cập nhật worker hiện tại; các workers khác
+        thấy các cặp này khi load model version tiếp theo (tới lúc đó một movie
+        vừa xem qua worker khác có thể còn xuất hiện trong gợi ý của user).
+        """
+        if self.watched is None:
+            return
+        by_user: Dict[int, List[int]] = {}
+        for user_id, movie_id in pairs:
+            by_user.setdefault(user_id, []).append(movie_id)
+        if not by_user:
+            return
+        self.watched.add(
+            (user_id, self.movie_id_map.lookup(np.asarray(movie_ids, dtype=np.int64)))
+            for user_id, movie_ids in by_user.items()
+        )
+    
+    def invalidate_user(self, user_id: int):
+        """
+        Xóa cache entries của một user (gọi khi UserBehavior của user thay đổi)
+        """
+        self._recommendation_cache.invalidate_user(user_id)
+    
+    def _get_watched_pairs(self, user_ids: List[int], db: Session) -> List[Tuple[int, int]]:
+        """
+        Lấy các cặp (user_id, movie_id) đã xem cho nhiều users bằng một query
+        """
+        return get_watched_pairs(db, user_ids)
+    
+    def _watched_entries(self, chunk: List[int], db: Session = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Watched entries của một chunk users: (row trong chunk, item position)
+        
+        Lấy từ interaction matrix in-memory; users matrix không biết (model cũ
+        chưa có matrix, user mới mà worker này chưa thấy behaviors) được lấy bằng
+        một query cho cả chunk.
+        """
+        rows = cols = np.empty(0, dtype=np.int64)
+        missing = chunk
+        if self.watched is not None:
+            metrics.inc("recommendation_watched_lookups_total", labels={"source": "memory"})
+            rows, cols = self.watched.rows(chunk)
+            missing = [user_id for user_id in chunk if user_id not in self.watched]
+        
+        if not missing or db is None:
+            return rows, cols
+        metrics.inc("recommendation_watched_lookups_total", labels={"source": "db"})
+        pairs = self._get_watched_pairs(missing, db)
+        if not pairs:
+            return rows, cols
+        pair_array = np.asarray(pairs, dtype=np.int64)
+        row_of_user = {user_id: row for row, user_id in enumerate(chunk)}
+        db_rows = np.array([row_of_user[u] for u in pair_array[:, 0]], dtype=np.int64)
+        db_cols = self.movie_id_map.lookup(pair_array[:, 1])
+        valid = db_cols >= 0
+        return np.concatenate([rows, db_rows[valid]]), np.concatenate([cols, db_cols[valid]])
+    
+    def recommend_batch(
+        self,
+        user_ids: List[int],
+        top_n: int = 10,
+        exclude_watched: bool = True,
+        db: Session = None,
+        chunk_size: int = 1000
+    ) -> Iterator[Tuple[int, bool, List[Tuple[int, float]]]]:
+        """
+        Gợi ý top N movies cho nhiều users
+        
+        Mỗi chunk users được score bằng một matrix product
+        user_factors[chunk] @ item_factors.T, watched movies của cả chunk được mask
+        bằng một phép gán (interaction matrix in-memory), và top N được chọn bằng
+        argpartition.
+        
+        Yields:
+            (user_id, is_cold_start, [(movie_id, score), ...]) theo thứ tự user_ids (bỏ trùng lặp)
+        """
+        if self.user_factors is None or not user_ids:
+            return
+        
+        user_ids = list(dict.fromkeys(user_ids))
+        
+        all_movie_ids = self.movie_id_map.keys()
+        n_movies = len(all_movie_ids)
+        k = min(top_n, n_movies)
+        
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = list(user_ids[start:start + chunk_size])
+            user_indices = self.user_id_map.lookup(np.asarray(chunk, dtype=np.int64))
+            known = user_indices >= 0
             
-            model_data = {
-                'user_factors': self.user_factors,
-                'item_factors': self.item_factors,
-                'user_bias': self.user_bias,
-                'item_bias': self.item_bias,
-                'global_mean': self.global_mean,
-                'user_id_map': self.user_id_map,
-                'movie_id_map': self.movie_id_map,
-                'reverse_user_map': self.reverse_user_map,
-                'reverse_movie_map': self.reverse_movie_map,
-                'n_factors': self.n_factors,
-                'last_train_time': self._last_train_time,
-                'min_interactions': self.min_interactions
-            }
+            if self.ann_index is not None:
+                yield from self._recommend_chunk_ann(chunk, user_indices, k, exclude_watched, db)
+                continue
+            
+            # Cold-start users: global mean + item bias
+            scores = np.empty((len(chunk), n_movies), dtype=np.float32)
+            scores[:] = self.global_mean + self.item_bias
+            if known.any():
+                known_indices = user_indices[known]
+                scores[known] += (
+                    self.user_bias[known_indices][:, None] +
+                    factor_scores(self.item_factors, self.user_factors[known_indices])
+                )
+            
+            if exclude_watched:
+                rows, cols = self._watched_entries(chunk, db)
+                scores[rows, cols] = -np.inf
             
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(model_data, f)
+            if k == 0:
+                for user_id, is_known in zip(chunk, known):
+                    yield user_id, not bool(is_known), []
+                continue
             
-            logger.info(f"Model saved to {self.model_path}")
+            # Top N không cần sort toàn bộ catalog
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
             
+            for row, user_id in enumerate(chunk):
+                finite = np.isfinite(top_scores[row])
+                recommendations = [
+                    (int(all_movie_ids[col]), float(score))
+                    for col, score in zip(top[row][finite], top_scores[row][finite])
+                ]
+                yield user_id, not bool(known[row]), recommendations
+    
+    def _recommend_chunk_ann(
+        self,
+        chunk: List[int],
+        user_indices: np.ndarray,
+        k: int,
+        exclude_watched: bool,
+        db: Session
+    ) -> Iterator[Tuple[int, bool, List[Tuple[int, float]]]]:
+        """
+        recommend_batch cho một chunk khi dùng ANN index (không tạo dense score matrix)
+        """
+        all_movie_ids = self.movie_id_map.keys()
+        
+        exclude = [None] * len(chunk)
+        if exclude_watched:
+            rows, cols = self._watched_entries(chunk, db)
+            if len(rows):
+                # Entries được nhóm theo row (sort ổn định) rồi cắt theo từng user
+                order = np.argsort(rows, kind="stable")
+                rows, cols = rows[order], cols[order]
+                bounds = np.searchsorted(rows, np.arange(len(chunk) + 1))
+                for row in np.flatnonzero(np.diff(bounds)):
+                    exclude[row] = cols[bounds[row]:bounds[row + 1]]
+        
+        known_rows = np.flatnonzero(user_indices >= 0)
+        searched = {}
+        if len(known_rows):
+            results = self.ann_index.search(
+                self._ann_user_queries(user_indices[known_rows]),
+                k,
+                exclude=[exclude[row] for row in known_rows]
+            )
+            searched = dict(zip(known_rows.tolist(), results))
+        
+        # Cold-start users: global mean + item bias (thứ tự popularity tính một lần)
+        popular_order = None
+        
+        for row, user_id in enumerate(chunk):
+            if row in searched:
+                positions, scores = searched[row]
+                offset = self.global_mean + self.user_bias[user_indices[row]]
+                yield user_id, False, [
+                    (int(all_movie_ids[pos]), float(offset + score))
+                    for pos, score in zip(positions, scores)
+                ]
+                continue
+            
+            if popular_order is None:
+                popular_order = np.argsort(-np.asarray(self.item_bias))
+            excluded = exclude[row] if exclude[row] is not None else np.empty(0, dtype=np.int64)
+            candidates = popular_order[:k + len(excluded)]
+            candidates = candidates[~np.isin(candidates, excluded)][:k]
+            yield user_id, True, [
+                (int(all_movie_ids[pos]), float(self.global_mean + self.item_bias[pos]))
+                for pos in candidates
+            ]
+    
+    def has_watched_row(self, user_id: int) -> bool:
+        """User có watched movies trong interaction matrix in-memory (không cần query DB)"""
+        return self.watched is not None and user_id in self.watched
+    
+    def has_interaction_count(self, user_id: int) -> bool:
+        """User có interaction count in-memory (cold-start check không cần query DB)"""
+        user_idx = self.user_id_map.get(user_id)
+        return (
+            user_idx is not None and self.user_interactions is not None
+            and user_idx < len(self.user_interactions)
+        )
+    
+    def is_cold_start_user(
+        self,
+        user_id: int,
+        db: Session = None,
+        interaction_count: Optional[int] = None
+    ) -> bool:
+        """
+        Kiểm tra user có phải cold-start không
+        
+        Dùng interaction counts in-memory (array lookup); model cũ chưa có
+        user_interactions thì fallback về interaction_count của caller (nếu có)
+        hoặc query DB. User chưa có trong model (chưa fold-in) dùng interaction_count
+        của caller, không có thì là cold-start.
+        """
+        with metrics.timer("recommendation_cold_start_check_seconds") as labels:
+            user_idx = self.user_id_map.get(user_id)
+            if user_idx is None and interaction_count is not None:
+                labels["source"] = "caller"
+                is_cold = interaction_count < self.min_interactions
+            elif user_idx is None:
+                labels["source"] = "memory"
+                is_cold = True
+            elif self.user_interactions is not None and user_idx < len(self.user_interactions):
+                labels["source"] = "memory"
+                is_cold = int(self.user_interactions[user_idx]) < self.min_interactions
+            elif interaction_count is not None:
+                labels["source"] = "caller"
+                is_cold = interaction_count < self.min_interactions
+            else:
+                labels["source"] = "db"
+                is_cold = get_user_interaction_count(db, user_id) < self.min_interactions
+        
+        metrics.inc("recommendation_cold_start_checks_total", labels={"result": "cold" if is_cold else "warm"})
+        return is_cold
+    
+    def save_model(self) -> int:
+        """
+        Lưu model ra disk thành một version mới (float32 .npy + manifest)
+        
+        Returns:
+            version vừa lưu
+        
+        Raises:
+            Exception: lỗi từ model store (ghi file, rename version, ...) được giữ nguyên
+        """
+        arrays = {
+            'user_factors': np.asarray(self.user_factors, dtype=np.float32),
+            'item_factors': np.asarray(self.item_factors, dtype=np.float32),
+            'user_bias': np.asarray(self.user_bias, dtype=np.float32),
+            'item_bias': np.asarray(self.item_bias, dtype=np.float32),
+            'user_ids': np.asarray(self.user_id_map.keys(), dtype=np.int64),
+            'movie_ids': np.asarray(self.movie_id_map.keys(), dtype=np.int64)
+        }
+        if self.user_interactions is not None:
+            arrays['user_interactions'] = np.asarray(self.user_interactions, dtype=np.int32)
+        if self.watched is not None:
+            arrays.update(self.watched.to_arrays())
+        if self.serving_precision != "float32":
+            # Bản nén cho serving, được memory-map (dùng chung page cache giữa các workers)
+            for name in ('user_factors', 'item_factors'):
+                arrays.update(CompactFactors.quantize(arrays[name], self.serving_precision).to_arrays(name))
+        metadata = {
+            'global_mean': float(self.global_mean),
+            'n_factors': self.n_factors,
+            'engine': self.engine,
+            'last_train_time': self._last_train_time.isoformat() if self._last_train_time else None,
+            'min_interactions': self.min_interactions,
+            'hyperparameters': self.hyperparameters()
+        }
+        
+        if self.ann_index is not None:
+            arrays.update(self.ann_index.to_arrays())
+            metadata['ann'] = self.ann_index.metadata()
+        
+        self.model_version = self.model_store.save(arrays, metadata)
+        logger.info(f"Model saved to {self.model_path} (version {self.model_version})")
+        return self.model_version
+    
+    def _save_model(self):
+        """
+        save_model() nhưng chỉ log lỗi (train đồng bộ, migrate model cũ)
+        """
+        try:
+            self.save_model()
         except Exception as e:
             logger.error(f"Failed to save model: {e}")
     
-    def _load_model(self):
+    def _load_model(self, version: Optional[int] = None):
         """
-        Load model từ disk
+        Load model từ disk (memory-mapped, có kiểm tra checksum)
         """
         try:
-            if not os.path.exists(self.model_path):
-                logger.info("No saved model found. Will train new model.")
-                return
+            if self.model_store.current_version() is None:
+                if self.legacy_model_path and os.path.exists(self.legacy_model_path):
+                    self._migrate_legacy_model()
+                else:
+                    logger.info("No saved model found. Will train new model.")
+                    return
             
-            with open(self.model_path, 'rb') as f:
-                model_data = pickle.load(f)
+            arrays, manifest = self.model_store.load(version=version, mmap=True)
+            metadata = manifest['metadata']
             
-            self.user_factors = model_data['user_factors']
-            self.item_factors = model_data['item_factors']
-            self.user_bias = model_data['user_bias']
-            self.item_bias = model_data['item_bias']
-            self.global_mean = model_data['global_mean']
-            self.user_id_map = model_data['user_id_map']
-            self.movie_id_map = model_data['movie_id_map']
-            self.reverse_user_map = model_data['reverse_user_map']
-            self.reverse_movie_map = model_data['reverse_movie_map']
-            self._last_train_time = model_data.get('last_train_time')
+            self.user_factors = arrays['user_factors']
+            self.item_factors = arrays['item_factors']
+            self.user_bias = arrays['user_bias']
+            self.item_bias = arrays['item_bias']
+            self._item_gram_cache = None
+            self.user_id_map = IdIndex(arrays['user_ids'])
+            self.movie_id_map = IdIndex(arrays['movie_ids'])
+            self.user_interactions = arrays.get('user_interactions')
+            self.watched = InteractionMatrix.from_arrays(arrays, self.user_id_map, len(self.movie_id_map))
+            self.global_mean = metadata['global_mean']
+            self.engine = metadata.get('engine') or 'sgd'
+            # Fold-in phải dùng đúng số factors / regularization của model đã train,
+            # kể cả khi cấu hình serving (cf_config.json) đã đổi từ sau lần train đó
+            self.n_factors = int(self.item_factors.shape[1])
+            trained_with = metadata.get('hyperparameters', {})
+            self.als_regularization = trained_with.get('als_regularization', self.als_regularization)
+            self.implicit_alpha = trained_with.get('implicit_alpha', self.implicit_alpha)
+            last_train_time = metadata.get('last_train_time')
+            self._last_train_time = datetime.fromisoformat(last_train_time) if last_train_time else None
+            self.model_version = manifest['version']
             
-            logger.info(f"Model loaded from {self.model_path}")
+            if 'ann_centroids' in arrays and 'ann' in metadata:
+                self.ann_index = IVFIndex.from_arrays(
+                    arrays, metadata['ann'], self._ann_serving_vectors(self._ann_item_vectors())
+                )
+                tuning = self.ann_index.tuning or {}
+                if self.ann_nprobe > 0:
+                    self.ann_index.nprobe = min(self.ann_nprobe, self.ann_index.n_lists)
+                elif tuning.get('target_recall') != self.ann_target_recall:
+                    # Version lưu với nprobe cố định hoặc recall mục tiêu khác
+                    self._tune_ann_index(self.ann_index)
+            else:
+                self._build_ann_index()
+            
+            # ANN vectors được tạo từ float32 ở trên, sau đó mới thay factors bằng bản nén
+            if self.serving_precision != "float32":
+                self.user_factors = self._serving_factors(arrays, 'user_factors')
+                self.item_factors = self._serving_factors(arrays, 'item_factors')
+            
+            logger.info(f"Model version {self.model_version} loaded from {self.model_path}")
             logger.info(f"Last trained: {self._last_train_time}")
             
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
     
+    def _serving_factors(self, arrays: Dict[str, np.ndarray], name: str) -> CompactFactors:
+        """Factors nén đã lưu cùng version, hoặc nén từ float32 (version lưu với precision khác)"""
+        factors = CompactFactors.from_arrays(arrays, name, self.serving_precision)
+        if factors is None:
+            factors = CompactFactors.quantize(arrays[name], self.serving_precision)
+        return factors
+    
+    def _migrate_legacy_model(self):
+        """
+        Chuyển file pickle cũ sang versioned format
+        """
+        with open(self.legacy_model_path, 'rb') as f:
+            model_data = pickle.load(f)
+        
+        self.user_factors = model_data['user_factors']
+        self.item_factors = model_data['item_factors']
+        self.user_bias = model_data['user_bias']
+        self.item_bias = model_data['item_bias']
+        self.global_mean = model_data['global_mean']
+        self.user_id_map = IdIndex.from_mapping(model_data['user_id_map'])
+        self.movie_id_map = IdIndex.from_mapping(model_data['movie_id_map'])
+        self.engine = model_data.get('engine', 'sgd')
+        self._last_train_time = model_data.get('last_train_time')
+        self._build_ann_index()
+        
+        self._save_model()
+        logger.info(f"Migrated legacy model {self.legacy_model_path} to {self.model_path}")
+    
+    def list_model_versions(self) -> List[Dict]:
+        """
+        Danh sách các version trên disk (để rollback)
+        """
+        current = self.model_store.current_version()
+        versions = []
+        for version in self.model_store.list_versions():
+            versions.append({
+                "version": version,
+                "current": version == current,
+                "loaded": version == self.model_version
+            })
+        return versions
+    
+    def hyperparameters(self) -> Dict:
+        """Các hyperparameters có thể tune (xem TUNABLE_PARAMS)"""
+        return {
+            'n_factors': self.n_factors,
+            'learning_rate': self.initial_lr,
+            'n_iterations': self.n_iterations,
+            'regularization': self.regularization,
+            'lr_decay': self.lr_decay,
+            'als_iterations': self.als_iterations,
+            'als_regularization': self.als_regularization,
+            'implicit_alpha': self.implicit_alpha
+        }
+    
     def get_model_info(self) -> Dict:
         """
         Lấy thông tin về model
@@ -429,9 +1342,17 @@ class CollaborativeFilteringService:
             "n_users": len(self.user_id_map),
             "n_movies": len(self.movie_id_map),
             "n_factors": self.n_factors,
-            "global_mean": self.global_mean,
+            "engine": self.engine,
+            "hyperparameters": self.hyperparameters(),
+            "serving_precision": self.serving_precision,
+            "factor_bytes": factor_nbytes(self.user_factors) + factor_nbytes(self.item_factors),
+            "model_version": self.model_version,
+            "global_mean": float(self.global_mean),
             "last_train_time": self._last_train_time.isoformat() if self._last_train_time else None,
-            "cache_size": len(self._recommendation_cache)
+            "cache_size": len(self._recommendation_cache),
+            "cache": self._recommendation_cache.stats(),
+            "ann": self.ann_index.metadata() if self.ann_index is not None else None,
+            "watched": self.watched.stats() if self.watched is not None else None
         }
     
     def clear_cache(self):
@@ -442,23 +1363,257 @@ class CollaborativeFilteringService:
         logger.info("Recommendation cache cleared")
 
 
+# Cấu hình của model đang serve
+CF_SERVICE_CONFIG = {
+    "n_factors": 20,
+    "learning_rate": 0.01,
+    "n_iterations": 100,
+    "regularization": 0.02,
+    "model_path": "weights/cf_model",
+    "min_interactions": 3,
+    "lr_decay": 0.95,
+    "random_seed": 42,
+    "cache_size": settings.RECOMMENDATION_CACHE_SIZE,
+    "cache_ttl": settings.RECOMMENDATION_CACHE_TTL,
+    "ann_min_items": settings.ANN_MIN_ITEMS,
+    "ann_nprobe": settings.ANN_NPROBE,
+    "ann_target_recall": settings.ANN_TARGET_RECALL,
+    "serving_precision": settings.CF_SERVING_PRECISION
+}
+
+# Hyperparameters có thể được ghi đè bởi kết quả hyperparameter search
+# (settings.CF_TUNED_CONFIG_PATH, xem app/services/hyperparameter_search.py)
+TUNABLE_PARAMS = (
+    "n_factors", "learning_rate", "n_iterations", "regularization", "lr_decay",
+    "als_iterations", "als_regularization", "implicit_alpha"
+)
+
 # Singleton instance
 _cf_service = None
 
+# Đồng bộ model/cache giữa các workers qua CURRENT và CACHE_GENERATION của model store,
+# chạy trong background thread (start_model_reload) thay vì trên request path
+_reload_lock = threading.Lock()
+_reload_stop = threading.Event()
+_reload_thread: Optional[threading.Thread] = None
+_reload_state = {
+    "last_check": 0.0,
+    "cache_generation": None,
+    "reloads": 0,
+    "cache_resets": 0,
+    # Invalidation theo user (ingest, fold-in) chờ được báo cho các workers khác
+    "pending_invalidation": False,
+    "last_invalidation": 0.0,
+    "invalidations_published": 0
+}
+
+
+def load_tuned_config(path: Optional[str] = None) -> Dict:
+    """
+    Đọc cấu hình tốt nhất đã ghi bởi hyperparameter search
+
+    Returns:
+        {"engine": ..., "params": {...}} (chỉ các TUNABLE_PARAMS), {} nếu chưa có file
+    """
+    path = path or settings.CF_TUNED_CONFIG_PATH
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring invalid tuned CF config {path}: {e}")
+        return {}
+    
+    params = {k: v for k, v in (config.get("params") or {}).items() if k in TUNABLE_PARAMS}
+    engine = config.get("engine")
+    return {"engine": engine if engine in TRAINING_ENGINES else None, "params": params}
+
+
+def get_default_engine() -> str:
+    """
+    Engine dùng khi /train không chỉ định: engine của cấu hình đã tune, mặc định sgd
+    """
+    return load_tuned_config().get("engine") or "sgd"
+
+
+def create_cf_service(load_model: bool = True) -> CollaborativeFilteringService:
+    """
+    Tạo service instance mới với cấu hình serving (load model từ disk nếu có)
+    
+    Hyperparameters đã tune (cf_config.json) ghi đè giá trị mặc định trong CF_SERVICE_CONFIG.
+    
+    Args:
+        load_model: False để tạo instance trống (chỉ dùng để train), không load và
+            kiểm tra checksum model hiện tại
+    """
+    tuned_params = load_tuned_config().get("params", {})
+    return CollaborativeFilteringService(**{**CF_SERVICE_CONFIG, **tuned_params}, load_model=load_model)
+
+
 def get_cf_service() -> CollaborativeFilteringService:
     """
     Get or create collaborative filtering service instance
+    
+    Sau lần tạo đầu tiên (warm-up stage cf_model) chỉ là một lần đọc reference: model
+    mới (train/rollback ở worker khác) và cache resets được áp dụng bởi model-reload
+    thread, xem start_model_reload.
     """
     global _cf_service
-    if _cf_service is None:
-        _cf_service = CollaborativeFilteringService(
-            n_factors=20,
-            learning_rate=0.01,
-            n_iterations=100,
-            regularization=0.02,
-            model_path="weights/cf_model.pkl",
-            min_interactions=3,
-            lr_decay=0.95,
-            random_seed=42
-        )
-    return _cf_service
\ No newline at end of file
+    service = _cf_service
+    if service is None:
+        with _reload_lock:
+            if _cf_service is None:
+                _cf_service = create_cf_service()
+                _reload_state["cache_generation"] = _cf_service.model_store.cache_generation()
+                _reload_state["last_check"] = time.monotonic()
+            service = _cf_service
+    return service
+
+
+def _run_model_reload():
+    while not _reload_stop.wait(settings.MODEL_RELOAD_CHECK_SECONDS):
+        if _cf_service is None:
+            continue
+        with _reload_lock:
+            try:
+                _sync_with_model_store()
+            except Exception as e:
+                logger.error(f"Worker {os.getpid()} failed to sync with model store: {e}")
+
+
+def start_model_reload():
+    """
+    Start background thread kiểm tra model store mỗi MODEL_RELOAD_CHECK_SECONDS (gọi từ startup)
+    
+    Thread load model mới nếu CURRENT trỏ tới version khác, xóa cache nếu cache
+    generation thay đổi và publish invalidations đang chờ. Load model (checksum,
+    InteractionMatrix, ANN) chạy ở thread này rồi mới swap reference, nên không
+    request nào phải chờ.
+    """
+    global _reload_thread
+    with _reload_lock:
+        if _reload_thread is not None:
+            return
+        _reload_stop.clear()
+        _reload_thread = threading.Thread(target=_run_model_reload, name="model-reload", daemon=True)
+        _reload_thread.start()
+
+
+def stop_model_reload():
+    """Dừng model-reload thread (worker shutdown)"""
+    global _reload_thread
+    _reload_stop.set()
+    thread, _reload_thread = _reload_thread, None
+    if thread is not None:
+        thread.join(timeout=5.0)
+
+
+def _sync_with_model_store():
+    """Đọc CURRENT + CACHE_GENERATION, reload model / xóa cache nếu cần (model-reload thread, giữ _reload_lock)"""
+    global _cf_service
+    _reload_state["last_check"] = time.monotonic()
+    service = _cf_service
+    store = service.model_store
+    
+    version = store.current_version()
+    if version is not None and version != service.model_version:
+        new_service = create_cf_service()
+        if new_service.model_version == version:
+            _cf_service = service = new_service
+            _reload_state["reloads"] += 1
+            logger.info(f"Worker {os.getpid()} reloaded model version {version}")
+        else:
+            logger.warning(f"Worker {os.getpid()} failed to reload model version {version}")
+    
+    generation = store.cache_generation()
+    if generation != _reload_state["cache_generation"]:
+        service.clear_cache()
+        _reload_state["cache_generation"] = generation
+        _reload_state["cache_resets"] += 1
+    
+    _publish_pending_invalidation()
+
+
+def publish_user_invalidations():
+    """
+    Báo các workers khác rằng cache của một số users đã cũ (sau ingest / fold-in)
+    
+    Worker hiện tại đã xóa đúng entries của các users đó (invalidate_user); các
+    workers khác không biết là users nào nên xóa toàn bộ cache khi cache generation
+    đổi. Để cache vẫn có ích khi behaviors đến liên tục, generation được bump tối đa
+    một lần mỗi CACHE_INVALIDATION_SECONDS; lần bị hoãn được thực hiện ở lần gọi sau
+    hoặc lần kiểm tra model store tiếp theo của model-reload thread. Cache của worker khác vì vậy cũ tối đa
+    khoảng CACHE_INVALIDATION_SECONDS + MODEL_RELOAD_CHECK_SECONDS.
+    """
+    _reload_state["pending_invalidation"] = True
+    if _reload_lock.acquire(blocking=False):
+        try:
+            _publish_pending_invalidation()
+        finally:
+            _reload_lock.release()
+
+
+def _publish_pending_invalidation():
+    """Bump cache generation nếu có invalidation đang chờ và đã qua rate limit (giữ _reload_lock)"""
+    service = _cf_service
+    if service is None or not _reload_state["pending_invalidation"]:
+        return
+    if time.monotonic() - _reload_state["last_invalidation"] < settings.CACHE_INVALIDATION_SECONDS:
+        return
+    
+    _reload_state["pending_invalidation"] = False
+    _reload_state["last_invalidation"] = time.monotonic()
+    store = service.model_store
+    try:
+        # Reset do worker khác bump trước đó vẫn phải áp dụng ở worker này
+        if store.cache_generation() != _reload_state["cache_generation"]:
+            service.clear_cache()
+            _reload_state["cache_resets"] += 1
+        _reload_state["cache_generation"] = store.bump_cache_generation()
+        _reload_state["invalidations_published"] += 1
+    except OSError as e:
+        logger.warning(f"Failed to publish cache invalidation: {e}")
+
+
+def swap_cf_service(service: CollaborativeFilteringService):
+    """
+    Thay model đang serve bằng một instance đã build xong
+
+    Chỉ gán lại reference nên atomic: request đang chạy tiếp tục dùng instance cũ,
+    request mới dùng instance mới, không ai thấy factors đang cập nhật dở.
+    """
+    global _cf_service
+    _cf_service = service
+
+
+def clear_all_worker_caches():
+    """
+    Xóa recommendation cache ở worker này ngay và ở các worker khác trong lần
+    kiểm tra model store tiếp theo
+    """
+    service = get_cf_service()
+    generation = service.model_store.bump_cache_generation()
+    service.clear_cache()
+    _reload_state["cache_generation"] = generation
+
+
+def get_worker_model_status() -> Dict:
+    """
+    Model version của worker này so với CURRENT trên disk
+    """
+    service = _cf_service
+    store_version = service.model_store.current_version() if service is not None else None
+    last_check = _reload_state["last_check"]
+    return {
+        "pid": os.getpid(),
+        "model_version": service.model_version if service is not None else None,
+        "store_version": store_version,
+        "cache_generation": _reload_state["cache_generation"],
+        "seconds_since_check": round(time.monotonic() - last_check, 3) if last_check else None,
+        "check_interval_seconds": settings.MODEL_RELOAD_CHECK_SECONDS,
+        "reloads": _reload_state["reloads"],
+        "cache_resets": _reload_state["cache_resets"],
+        "pending_invalidation": _reload_state["pending_invalidation"],
+        "invalidations_published": _reload_state["invalidations_published"]
+    }
@@ -0,0 +1,129 @@
+"""
+Offline evaluation cho các recommendation strategies
+
+- time_based_split: chia user behaviors theo thời gian (train = quá khứ, test = tương lai)
+- precision/recall/NDCG@K với relevance nhị phân (movie user tương tác trong test period)
+- catalog coverage, overlap@K giữa hai rankings và latency percentiles
+
+Không phụ thuộc DB, dùng được từ scripts (xem app/scripts/benchmark.py).
+"""
+import math
+from typing import Callable, Dict, Iterable, List, Sequence, Set, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+def time_based_split(
+    behaviors: Sequence[T],
+    test_fraction: float = 0.2,
+    timestamp: Callable[[T], float] = lambda b: b.created_at
+) -> Tuple[List[T], List[T], float]:
+    """
+    Chia behaviors theo một mốc thời gian chung cho mọi user
+
+    Args:
+        behaviors: danh sách behaviors (có created_at hoặc dùng timestamp)
+        test_fraction: tỷ lệ behaviors mới nhất dùng làm test set
+        timestamp: hàm lấy thời điểm (số, datetime, ...) của một behavior
+
+    Returns:
+        (train, test, cutoff) - train có timestamp < cutoff
+    """
+    if not 0.0 < test_fraction < 1.0:
+        raise ValueError("test_fraction phải nằm trong khoảng (0, 1)")
+    if not behaviors:
+        return [], [], 0.0
+
+    times = sorted(timestamp(b) for b in behaviors)
+    cutoff = times[min(len(times) - 1, int(len(times) * (1.0 - test_fraction)))]
+
+    train = [b for b in behaviors if timestamp(b) < cutoff]
+    test = [b for b in behaviors if timestamp(b) >= cutoff]
+    return train, test, cutoff
+
+
+def precision_at_k(recommended: Sequence[int], relevant: Set[int], k: int) -> float:
+    if k <= 0:
+        return 0.0
+    hits = sum(1 for movie_id in recommended[:k] if movie_id in relevant)
+    return hits / k
+
+
+def recall_at_k(recommended: Sequence[int], relevant: Set[int], k: int) -> float:
+    if not relevant:
+        return 0.0
+    hits = sum(1 for movie_id in recommended[:k] if movie_id in relevant)
+    return hits / len(relevant)
+
+
+def ndcg_at_k(recommended: Sequence[int], relevant: Set[int], k: int) -> float:
+    """NDCG@K với relevance nhị phân"""
+    if not relevant:
+        return 0.0
+    dcg = sum(
+        1.0 / math.log2(rank + 2)
+        for rank, movie_id in enumerate(recommended[:k])
+        if movie_id in relevant
+    )
+    ideal = sum(1.0 / math.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return dcg / ideal
+
+
+def overlap_at_k(recommended: Sequence[int], reference: Sequence[int], k: int) -> float:
+    """Tỷ lệ top-K của reference (ví dụ scoring full precision) có trong top-K recommended"""
+    if k <= 0:
+        return 0.0
+    return len(set(recommended[:k]) & set(reference[:k])) / k
+
+
+def catalog_coverage(recommendation_lists: Iterable[Sequence[int]], n_items: int, k: int) -> float:
+    """Tỷ lệ movies trong catalog xuất hiện trong ít nhất một top-K list"""
+    if n_items <= 0:
+        return 0.0
+    distinct = set()
+    for recommended in recommendation_lists:
+        distinct.update(recommended[:k])
+    return len(distinct) / n_items
+
+
+def evaluate_rankings(
+    recommendations: Dict[int, Sequence[int]],
+    relevant: Dict[int, Set[int]],
+    k: int,
+    n_items: int
+) -> Dict:
+    """
+    Tính trung bình các metrics trên những user có relevant items
+
+    Args:
+        recommendations: user_id -> ranked movie ids
+        relevant: user_id -> movie ids trong test period (chưa xem trong train)
+        k: cutoff
+        n_items: số movies trong catalog (cho coverage)
+    """
+    users = [user_id for user_id in recommendations if relevant.get(user_id)]
+    if not users:
+        return {"n_users": 0, "precision": 0.0, "recall": 0.0, "ndcg": 0.0, "coverage": 0.0}
+
+    return {
+        "n_users": len(users),
+        "precision": float(np.mean([precision_at_k(recommendations[u], relevant[u], k) for u in users])),
+        "recall": float(np.mean([recall_at_k(recommendations[u], relevant[u], k) for u in users])),
+        "ndcg": float(np.mean([ndcg_at_k(recommendations[u], relevant[u], k) for u in users])),
+        "coverage": catalog_coverage((recommendations[u] for u in users), n_items, k)
+    }
+
+
+def latency_percentiles(samples: Sequence[float]) -> Dict:
+    """Latency samples (giây) -> p50/p99/mean (ms)"""
+    if not len(samples):
+        return {"n": 0, "p50_ms": None, "p99_ms": None, "mean_ms": None}
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        "n": int(len(ms)),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3)
+    }
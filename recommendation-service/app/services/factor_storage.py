@@ -0,0 +1,177 @@
+"""
+Lưu latent factors ở độ chính xác thấp cho serving
+
+- float16: mỗi phần tử 2 bytes
+- int8: mỗi phần tử 1 byte + một scale float32 cho mỗi row (max |x| / 127)
+
+Scoring luôn làm bằng float32: các rows được dequantize theo block nên bộ nhớ tạm
+bị giới hạn, không tạo lại toàn bộ matrix float32. Training vẫn dùng float64/float32
+(CollaborativeFilteringService.fit), chỉ model đã load để serve mới được nén.
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+
+# Số rows được dequantize mỗi block khi scoring / quantize
+_BLOCK_ROWS = 65536
+
+_INT8_MAX = 127.0
+
+# Capacity tối thiểu khi append rows (fold-in users mới)
+_MIN_CAPACITY = 1024
+
+
+def append_rows(
+    array: np.ndarray,
+    rows: np.ndarray,
+    buffer: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Append rows vào cuối array với amortized O(len(rows))
+
+    array là prefix buffer[:n] của một buffer có capacity dư; khi hết chỗ (hoặc array
+    không còn là prefix của buffer, vd. model vừa load) buffer mới gấp đôi được cấp
+    và copy một lần. Rows cũ không bị ghi, nên reader đang giữ view cũ vẫn thấy dữ
+    liệu nhất quán.
+
+    Returns:
+        (view buffer[:n + len(rows)], buffer) - caller giữ buffer cho lần append sau
+    """
+    n, extra = len(array), len(rows)
+    is_prefix = (
+        buffer is not None and array.base is buffer
+        and array.ctypes.data == buffer.ctypes.data and array.dtype == buffer.dtype
+    )
+    if not is_prefix or len(buffer) < n + extra:
+        capacity = max(2 * n, n + extra, _MIN_CAPACITY)
+        new_buffer = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        new_buffer[:n] = array
+        buffer = new_buffer
+    buffer[n:n + extra] = rows
+    return buffer[:n + extra], buffer
+
+
+class CompactFactors:
+    """Factor matrix (n_rows, n_factors) dạng float16 hoặc int8 + per-row scale"""
+
+    def __init__(self, values: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.values = values
+        self.scales = scales
+        # Buffers có capacity dư cho append_row (xem append_rows)
+        self._values_buffer: Optional[np.ndarray] = None
+        self._scales_buffer: Optional[np.ndarray] = None
+
+    @classmethod
+    def quantize(cls, array: np.ndarray, precision: str) -> "CompactFactors":
+        if precision not in ("float16", "int8"):
+            raise ValueError(f"Precision không hợp lệ: {precision}. Hỗ trợ: float16, int8")
+        array = np.asarray(array)
+        if precision == "float16":
+            return cls(array.astype(np.float16))
+
+        values = np.empty(array.shape, dtype=np.int8)
+        scales = np.empty(len(array), dtype=np.float32)
+        for start in range(0, len(array), _BLOCK_ROWS):
+            block = np.asarray(array[start:start + _BLOCK_ROWS], dtype=np.float32)
+            max_abs = np.abs(block).max(axis=1) if block.shape[1] else np.zeros(len(block), dtype=np.float32)
+            block_scales = np.where(max_abs > 0, max_abs / _INT8_MAX, 1.0).astype(np.float32)
+            values[start:start + len(block)] = np.clip(
+                np.rint(block / block_scales[:, None]), -_INT8_MAX, _INT8_MAX
+            )
+            scales[start:start + len(block)] = block_scales
+        return cls(values, scales)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], name: str, precision: str) -> Optional["CompactFactors"]:
+        """Factors đã lưu cùng model version (xem to_arrays), None nếu version không có"""
+        values = arrays.get(f"{name}_{precision}")
+        if values is None:
+            return None
+        if precision == "int8":
+            scales = arrays.get(f"{name}_scale")
+            if scales is None:
+                return None
+            return cls(values, scales)
+        return cls(values)
+
+    def to_arrays(self, name: str) -> Dict[str, np.ndarray]:
+        arrays = {f"{name}_{self.precision}": self.values}
+        if self.scales is not None:
+            arrays[f"{name}_scale"] = self.scales
+        return arrays
+
+    @property
+    def precision(self) -> str:
+        return "int8" if self.scales is not None else "float16"
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.values.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        """Rows đã dequantize (float32)"""
+        values = np.asarray(self.values[rows], dtype=np.float32)
+        if self.scales is not None:
+            values *= np.asarray(self.scales[rows], dtype=np.float32)[..., None]
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        full = self[:]
+        return full if dtype is None else full.astype(dtype, copy=False)
+
+    def scores(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        vectors @ self.T bằng float32: (n_factors,) -> (n_rows,), (n, n_factors) -> (n, n_rows)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        result = np.empty(vectors.shape[:-1] + (len(self),), dtype=np.float32)
+        for start in range(0, len(self), _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, len(self))
+            result[..., start:end] = vectors @ self[start:end].T
+        return result
+
+    def gram(self) -> np.ndarray:
+        """self.T @ self (float64), tính theo block"""
+        dim = self.shape[1]
+        gram = np.zeros((dim, dim))
+        for start in range(0, len(self), _BLOCK_ROWS):
+            block = self[start:start + _BLOCK_ROWS].astype(np.float64)
+            gram += block.T @ block
+        return gram
+
+    def set_row(self, row: int, vector: np.ndarray):
+        """Ghi một row (arrays memory-mapped read-only được copy trước)"""
+        update = CompactFactors.quantize(np.asarray(vector, dtype=np.float32)[None, :], self.precision)
+        if not self.values.flags.writeable:
+            self.values = np.array(self.values)
+            if self.scales is not None:
+                self.scales = np.array(self.scales)
+        self.values[row] = update.values[0]
+        if self.scales is not None:
+            self.scales[row] = update.scales[0]
+
+    def append_row(self, vector: np.ndarray):
+        update = CompactFactors.quantize(np.asarray(vector, dtype=np.float32)[None, :], self.precision)
+        self.values, self._values_buffer = append_rows(self.values, update.values, self._values_buffer)
+        if self.scales is not None:
+            self.scales, self._scales_buffer = append_rows(self.scales, update.scales, self._scales_buffer)
+
+
+def factor_scores(factors, vectors: np.ndarray) -> np.ndarray:
+    """vectors @ factors.T cho ndarray hoặc CompactFactors"""
+    if isinstance(factors, CompactFactors):
+        return factors.scores(vectors)
+    return vectors @ factors.T
+
+
+def factor_nbytes(factors) -> int:
+    return int(factors.nbytes) if factors is not None else 0
@@ -0,0 +1,482 @@
+"""
+Hyperparameter search song song cho collaborative filtering model
+
+Mỗi candidate (engine + hyperparameters) được train trong một process của
+ProcessPoolExecutor (spawn), dùng hết các cores. Rating data (train/validation)
+được đặt một lần vào shared memory: các workers attach read-only thay vì mỗi task
+nhận một bản copy qua pickle.
+
+Candidates được xếp hạng theo validation RMSE và ranking metrics
+(precision/recall/NDCG@K trên held-out ratings, xem app/services/evaluation.py).
+Candidate có metric không hữu hạn (training diverge) bị loại như candidate lỗi.
+Cấu hình mặc định hiện tại được đánh giá cùng split làm baseline; cấu hình tốt
+nhất chỉ được ghi ra settings.CF_TUNED_CONFIG_PATH khi tốt hơn baseline,
+create_cf_service() đọc file này làm cấu hình serving/training mặc định.
+"""
+import math
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import get_context, shared_memory
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.collaborative_service import (
+    CF_SERVICE_CONFIG,
+    TRAINING_ENGINES,
+    TUNABLE_PARAMS,
+    CollaborativeFilteringService,
+    get_default_engine,
+    load_tuned_config
+)
+from app.services.evaluation import evaluate_rankings
+from app.services.user_scores import get_all_scores
+
+logger = logging.getLogger(__name__)
+
+# Không gian tìm kiếm mặc định theo engine (grid)
+SEARCH_SPACES: Dict[str, Dict[str, List]] = {
+    "sgd": {
+        "n_factors": [10, 20, 40],
+        "learning_rate": [0.005, 0.01, 0.02],
+        "regularization": [0.005, 0.02, 0.05],
+        "lr_decay": [0.9, 0.95, 0.98]
+    },
+    "als": {
+        "n_factors": [10, 20, 40, 64],
+        "als_regularization": [0.01, 0.1, 1.0, 5.0]
+    },
+    "als_implicit": {
+        "n_factors": [10, 20, 40, 64],
+        "als_regularization": [0.01, 0.1, 1.0],
+        "implicit_alpha": [1.0, 10.0, 40.0]
+    }
+}
+
+# Metrics dùng để xếp hạng: (tên, True nếu lớn hơn là tốt hơn)
+OBJECTIVES = {
+    "ndcg": True,
+    "recall": True,
+    "precision": True,
+    "rmse": False
+}
+
+# Metrics phải hữu hạn để candidate được xếp hạng / ghi ra config
+_FINITE_METRICS = ("rmse", "train_rmse", "precision", "recall", "ndcg", "coverage")
+
+# Biến môi trường giới hạn BLAS threads trong workers (mỗi worker một core)
+_BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+class Candidate(NamedTuple):
+    engine: str
+    params: Dict
+
+
+class RatingData(NamedTuple):
+    """Ratings dạng array (user_idx, item_idx, score) cùng ids gốc của các index"""
+    ratings: np.ndarray   # float64, shape (n, 3)
+    user_ids: np.ndarray  # int64, user_idx -> user_id
+    movie_ids: np.ndarray  # int64, item_idx -> movie_id
+
+
+def to_rating_data(user_ids: np.ndarray, movie_ids: np.ndarray, scores: np.ndarray) -> RatingData:
+    """Đánh index liên tục cho users/movies (giống user_id_map/movie_id_map của fit)"""
+    unique_users, user_idx = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+    unique_movies, movie_idx = np.unique(np.asarray(movie_ids, dtype=np.int64), return_inverse=True)
+    ratings = np.column_stack([user_idx, movie_idx, np.asarray(scores, dtype=np.float64)]).astype(np.float64)
+    return RatingData(ratings, unique_users, unique_movies)
+
+
+def load_rating_data(db: Session) -> RatingData:
+    """Ratings đã decay từ user_movie_scores (giống _build_sparse_rating_data)"""
+    scores = get_all_scores(db)
+    if not scores:
+        return to_rating_data(np.empty(0), np.empty(0), np.empty(0))
+    raw = np.asarray(scores, dtype=np.float64)
+    return to_rating_data(raw[:, 0], raw[:, 1], raw[:, 2])
+
+
+def generate_candidates(
+    engines: Sequence[str],
+    n_candidates: Optional[int] = None,
+    fixed_params: Optional[Dict] = None,
+    seed: int = 42
+) -> List[Candidate]:
+    """
+    Grid của SEARCH_SPACES cho các engines; n_candidates: sample ngẫu nhiên (theo seed)
+    """
+    candidates = []
+    for engine in engines:
+        if engine not in TRAINING_ENGINES:
+            raise ValueError(f"Engine không hợp lệ: {engine}. Hỗ trợ: {', '.join(TRAINING_ENGINES)}")
+        space = SEARCH_SPACES[engine]
+        names = list(space)
+        for values in itertools.product(*(space[name] for name in names)):
+            candidates.append(Candidate(engine, {**dict(zip(names, values)), **(fixed_params or {})}))
+
+    if n_candidates is not None and n_candidates < len(candidates):
+        candidates = random.Random(seed).sample(candidates, n_candidates)
+    return candidates
+
+
+def default_candidate() -> Candidate:
+    """Cấu hình mặc định hiện tại (CF_SERVICE_CONFIG + config đã tune), làm baseline"""
+    config = {**CF_SERVICE_CONFIG, **load_tuned_config().get("params", {})}
+    return Candidate(get_default_engine(), {name: config[name] for name in TUNABLE_PARAMS if name in config})
+
+
+def split_ratings(
+    ratings: np.ndarray,
+    validation_fraction: float = 0.2,
+    min_user_ratings: int = 3,
+    seed: int = 42
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Giữ lại ngẫu nhiên validation_fraction ratings của mỗi user có ít nhất
+    min_user_ratings ratings; user luôn còn ít nhất một rating trong train
+
+    Returns:
+        (train, validation)
+    """
+    if not 0.0 < validation_fraction < 1.0:
+        raise ValueError("validation_fraction phải nằm trong khoảng (0, 1)")
+    rng = np.random.default_rng(seed)
+    users = ratings[:, 0].astype(np.int64)
+    counts = np.bincount(users)
+
+    held_out = (rng.random(len(ratings)) < validation_fraction) & (counts[users] >= min_user_ratings)
+
+    # User bị giữ lại toàn bộ ratings: trả rating đầu tiên về train
+    held_per_user = np.bincount(users, weights=held_out, minlength=len(counts))
+    all_held = np.flatnonzero(held_per_user == counts)
+    if len(all_held):
+        first_index = np.unique(users, return_index=True)[1]
+        held_out[first_index[np.isin(np.unique(users), all_held)]] = False
+
+    return ratings[~held_out], ratings[held_out]
+
+
+class _SharedArray:
+    """numpy array trong shared memory (tạo ở process cha, attach ở workers)"""
+
+    def __init__(self, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf)[...] = array
+        self.spec = (self.shm.name, array.shape, array.dtype.str)
+
+    @staticmethod
+    def attach(spec) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+        name, shape, dtype = spec
+        shm = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        array.flags.writeable = False
+        return shm, array
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# State của mỗi worker process (set bởi _init_worker)
+_worker: Dict = {}
+
+
+def _init_worker(specs: Dict, n_users: int, n_movies: int, k: int, base_config: Dict, model_dir: str):
+    """
+    Attach shared arrays và build các cấu trúc dùng chung cho mọi candidate của worker
+    """
+    arrays = {}
+    for name, spec in specs.items():
+        shm, array = _SharedArray.attach(spec)
+        # Giữ reference tới shm để buffer còn hợp lệ
+        _worker.setdefault("shm", []).append(shm)
+        arrays[name] = array
+
+    train, validation = arrays["train"], arrays["validation"]
+
+    def to_csr(ratings: np.ndarray) -> csr_matrix:
+        return csr_matrix(
+            (np.ones(len(ratings)), (ratings[:, 0].astype(np.int64), ratings[:, 1].astype(np.int64))),
+            shape=(n_users, n_movies)
+        )
+
+    _worker.update({
+        "train": train,
+        "validation": validation,
+        "eval_users": arrays["eval_users"],
+        "train_csr": to_csr(train),
+        "validation_csr": to_csr(validation),
+        "n_users": n_users,
+        "n_movies": n_movies,
+        "k": k,
+        "base_config": base_config,
+        "model_dir": model_dir
+    })
+
+
+def _ranking_metrics(service: CollaborativeFilteringService, batch_size: int = 256) -> Dict:
+    """Top-K trên toàn catalog (loại items đã có trong train) so với validation items"""
+    k = _worker["k"]
+    train_csr, validation_csr = _worker["train_csr"], _worker["validation_csr"]
+    item_factors = np.asarray(service.item_factors)
+    item_offset = service.global_mean + np.asarray(service.item_bias)
+
+    recommendations, relevant = {}, {}
+    eval_users = _worker["eval_users"]
+    for start in range(0, len(eval_users), batch_size):
+        users = eval_users[start:start + batch_size]
+        scores = np.asarray(service.user_factors)[users] @ item_factors.T
+        scores += item_offset[None, :] + np.asarray(service.user_bias)[users][:, None]
+
+        seen = train_csr[users]
+        scores[np.repeat(np.arange(len(users)), np.diff(seen.indptr)), seen.indices] = -np.inf
+
+        top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        top = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+
+        for row, user in enumerate(users):
+            user = int(user)
+            recommendations[user] = top[row].tolist()
+            held = validation_csr[user]
+            relevant[user] = set(held.indices.tolist())
+
+    return evaluate_rankings(recommendations, relevant, k, _worker["n_movies"])
+
+
+def _evaluate_candidate(candidate: Candidate) -> Dict:
+    """Train một candidate trên train split và đánh giá trên validation split (trong worker)"""
+    train, validation = _worker["train"], _worker["validation"]
+    n_users, n_movies = _worker["n_users"], _worker["n_movies"]
+
+    service = CollaborativeFilteringService(**{
+        **_worker["base_config"],
+        **candidate.params,
+        "model_path": str(Path(_worker["model_dir"]) / f"cf_model_{os.getpid()}"),
+        "legacy_model_path": None,
+        "cache_size": 0,
+        "ann_min_items": max(n_movies + 1, _worker["base_config"].get("ann_min_items", 0))
+    })
+
+    start = time.perf_counter()
+    result = service.fit(
+        train,
+        {i: i for i in range(n_users)},
+        {i: i for i in range(n_movies)},
+        engine=candidate.engine,
+        verbose=False,
+        save=False
+    )
+    fit_seconds = time.perf_counter() - start
+
+    users = validation[:, 0].astype(np.int64)
+    items = validation[:, 1].astype(np.int64)
+    predictions = (
+        service.global_mean
+        + np.asarray(service.user_bias)[users]
+        + np.asarray(service.item_bias)[items]
+        + np.einsum("ij,ij->i", np.asarray(service.user_factors)[users], np.asarray(service.item_factors)[items])
+    )
+    validation_rmse = float(np.sqrt(np.mean((validation[:, 2] - predictions) ** 2))) if len(validation) else None
+
+    return {
+        "engine": candidate.engine,
+        "params": service.hyperparameters(),
+        "searched": candidate.params,
+        "train_rmse": float(result["final_rmse"]),
+        "rmse": validation_rmse,
+        **{name: value for name, value in _ranking_metrics(service).items() if name != "n_users"},
+        "fit_seconds": round(fit_seconds, 3),
+        "pid": os.getpid()
+    }
+
+
+def has_finite_metrics(result: Dict) -> bool:
+    """Metrics có mặt đều hữu hạn (NaN/inf khi training diverge)"""
+    for name in _FINITE_METRICS:
+        value = result.get(name)
+        if value is not None and not math.isfinite(value):
+            return False
+    return True
+
+
+def rank_results(results: List[Dict], objective: str = "ndcg") -> List[Dict]:
+    """
+    Sắp xếp kết quả theo objective (tie-break bằng validation RMSE)
+
+    Kết quả có metric không hữu hạn bị loại.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Objective không hợp lệ: {objective}. Hỗ trợ: {', '.join(OBJECTIVES)}")
+    higher_is_better = OBJECTIVES[objective]
+
+    def key(result: Dict):
+        value = result.get(objective)
+        rmse = result.get("rmse")
+        if value is None:
+            return (1, 0.0, 0.0)
+        return (0, -value if higher_is_better else value, rmse if rmse is not None else float("inf"))
+
+    return sorted((r for r in results if has_finite_metrics(r)), key=key)
+
+
+def run_search(
+    data: RatingData,
+    candidates: List[Candidate],
+    workers: Optional[int] = None,
+    validation_fraction: float = 0.2,
+    k: int = 10,
+    max_eval_users: int = 2000,
+    objective: str = "ndcg",
+    seed: int = 42,
+    progress: bool = True,
+    baseline: Optional[Candidate] = None
+) -> Dict:
+    """
+    Train và đánh giá candidates song song
+
+    Args:
+        baseline: cấu hình để so sánh (thường là default_candidate()), được đánh giá
+            cùng split và xếp hạng cùng các candidates (đánh dấu "baseline": True)
+
+    Returns:
+        {"results": [...] đã xếp hạng, "best": results[0], "baseline": kết quả của
+        baseline, thông tin dataset/split}
+    """
+    if len(data.ratings) == 0:
+        raise ValueError("Không có dữ liệu để train model")
+    if not candidates:
+        raise ValueError("Không có candidate nào")
+
+    n_users, n_movies = len(data.user_ids), len(data.movie_ids)
+    train, validation = split_ratings(data.ratings, validation_fraction, seed=seed)
+
+    eval_users = np.unique(validation[:, 0].astype(np.int64))
+    if len(eval_users) > max_eval_users:
+        eval_users = np.sort(np.random.default_rng(seed).choice(eval_users, max_eval_users, replace=False))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(candidates)))
+    shared = {
+        "train": _SharedArray(train),
+        "validation": _SharedArray(validation),
+        "eval_users": _SharedArray(eval_users)
+    }
+    specs = {name: array.spec for name, array in shared.items()}
+
+    # Mỗi worker dùng một BLAS thread, song song hóa ở mức candidates
+    saved_env = {name: os.environ.get(name) for name in _BLAS_THREAD_VARS}
+    os.environ.update({name: "1" for name in _BLAS_THREAD_VARS})
+
+    # Model không được lưu (save=False), thư mục chỉ dùng cho ModelStore của workers
+    model_dir = tempfile.mkdtemp(prefix="cf-search-")
+
+    results = []
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(specs, n_users, n_movies, k, dict(CF_SERVICE_CONFIG), model_dir)
+        ) as pool:
+            futures = {pool.submit(_evaluate_candidate, candidate): candidate for candidate in candidates}
+            if baseline is not None:
+                futures[pool.submit(_evaluate_candidate, baseline)] = baseline
+            for future in as_completed(futures):
+                candidate = futures[future]
+                try:
+                    result = future.result()
+                    if not has_finite_metrics(result):
+                        raise ValueError(f"non-finite metrics (rmse={result.get('rmse')}, train_rmse={result.get('train_rmse')})")
+                except Exception as e:
+                    logger.error(f"Candidate {candidate.engine} {candidate.params} failed: {e}")
+                    result = {"engine": candidate.engine, "searched": candidate.params, "error": str(e)}
+                if candidate is baseline:
+                    result["baseline"] = True
+                results.append(result)
+                if progress:
+                    logger.info(
+                        f"[{len(results)}/{len(candidates)}] {candidate.engine} {candidate.params} -> "
+                        f"rmse={result.get('rmse')} ndcg={result.get('ndcg')}"
+                    )
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        for array in shared.values():
+            array.release()
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+    ranked = rank_results([r for r in results if "error" not in r], objective)
+    return {
+        "objective": objective,
+        "k": k,
+        "workers": workers,
+        "seconds": round(time.perf_counter() - start, 2),
+        "n_users": n_users,
+        "n_movies": n_movies,
+        "n_train": int(len(train)),
+        "n_validation": int(len(validation)),
+        "n_eval_users": int(len(eval_users)),
+        "results": ranked,
+        "failed": [r for r in results if "error" in r],
+        "best": ranked[0] if ranked else None,
+        "baseline": next((r for r in ranked if r.get("baseline")), None)
+    }
+
+
+def write_tuned_config(report: Dict, path: Optional[str] = None) -> str:
+    """
+    Ghi cấu hình tốt nhất ra CF_TUNED_CONFIG_PATH (atomic), đọc bởi load_tuned_config()
+
+    Raises:
+        ValueError: không có candidate thành công, RMSE không hữu hạn, hoặc không có
+            candidate nào tốt hơn baseline (cấu hình mặc định hiện tại)
+    """
+    best = report["best"]
+    if best is None:
+        raise ValueError("Không có candidate nào thành công")
+    for name in ("rmse", "train_rmse"):
+        value = best.get(name)
+        if value is None or not math.isfinite(value):
+            raise ValueError(f"{name} của cấu hình tốt nhất không hữu hạn: {value}")
+    if best.get("baseline"):
+        raise ValueError(
+            f"Không có candidate nào tốt hơn cấu hình mặc định hiện tại "
+            f"({report['objective']}={best.get(report['objective'])})"
+        )
+
+    path = Path(path or settings.CF_TUNED_CONFIG_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    config = {
+        "engine": best["engine"],
+        "params": best["params"],
+        "metrics": {name: best.get(name) for name in ("rmse", "train_rmse", "precision", "recall", "ndcg", "coverage")},
+        "objective": report["objective"],
+        "k": report["k"],
+        "n_candidates": len(report["results"]) + len(report["failed"]),
+        "dataset": {name: report[name] for name in ("n_users", "n_movies", "n_train", "n_validation")},
+        "searched_at": datetime.now().isoformat()
+    }
+
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+    return str(path)
@@ -0,0 +1,264 @@
+"""
+Ma trận user x item (CSR) các cặp đã tương tác, dùng để loại watched movies khi
+recommend mà không cần query DB
+
+- Base CSR: build từ training data (user_movie_scores lúc train), lưu cùng model
+  version và được memory-map (dùng chung page cache giữa các workers)
+- Delta: các cặp mới (behaviors được ingest, fold-in) theo user_id, merge vào CSR
+  khi đủ lớn
+
+Columns là positions trong movie_id_map của model; movies không có trong model
+không thể được recommend nên không cần lưu.
+"""
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from app.services.model_store import IdIndex
+
+# Số entries trong delta trước khi merge vào CSR
+DEFAULT_COMPACT_THRESHOLD = 100000
+
+
+class InteractionMatrix:
+    """CSR (indptr, indices) theo user index + delta theo user_id"""
+
+    def __init__(
+        self,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        user_index: IdIndex,
+        n_items: int,
+        compact_threshold: int = DEFAULT_COMPACT_THRESHOLD
+    ):
+        """
+        Args:
+            indptr, indices: CSR rows theo user index của user_index, indices đã sort
+            user_index: user_id -> row (user_id_map của model, có thể tăng khi fold-in)
+            n_items: số movies của model
+        """
+        # Gán một tuple để reader luôn thấy indptr/indices cùng một version
+        self._csr = (indptr, indices)
+        self.user_index = user_index
+        self.n_items = n_items
+        self.compact_threshold = compact_threshold
+        self._delta: Dict[int, np.ndarray] = {}
+        self._delta_size = 0
+        self._lock = threading.Lock()
+        # (csr, item -> users) cho co_watched
+        self._item_cache = None
+
+    @classmethod
+    def from_pairs(
+        cls,
+        user_indices: np.ndarray,
+        item_indices: np.ndarray,
+        user_index: IdIndex,
+        n_items: int
+    ) -> "InteractionMatrix":
+        matrix = csr_matrix(
+            (np.ones(len(user_indices), dtype=np.int8),
+             (np.asarray(user_indices, dtype=np.int64), np.asarray(item_indices, dtype=np.int64))),
+            shape=(len(user_index), n_items)
+        )
+        matrix.sum_duplicates()
+        matrix.sort_indices()
+        return cls(matrix.indptr.astype(np.int64), matrix.indices.astype(np.int32), user_index, n_items)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        arrays: Dict[str, np.ndarray],
+        user_index: IdIndex,
+        n_items: int
+    ) -> Optional["InteractionMatrix"]:
+        """Matrix đã lưu cùng model version, None với version cũ chưa có"""
+        if 'watched_indptr' not in arrays or 'watched_indices' not in arrays:
+            return None
+        return cls(arrays['watched_indptr'], arrays['watched_indices'], user_index, n_items)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays để lưu cùng model (delta được merge vào)"""
+        indptr, indices = self._merged()
+        return {'watched_indptr': indptr, 'watched_indices': indices}
+
+    @property
+    def n_rows(self) -> int:
+        return len(self._csr[0]) - 1
+
+    @property
+    def nnz(self) -> int:
+        return int(self._csr[0][-1]) + self._delta_size
+
+    def __contains__(self, user_id: int) -> bool:
+        """User có row (có trong model) hoặc có entries trong delta"""
+        user_idx = self.user_index.get(user_id)
+        return (user_idx is not None and user_idx < len(self._csr[0]) - 1) or user_id in self._delta
+
+    def row(self, user_id: int) -> np.ndarray:
+        """Item positions (sorted, unique) của một user"""
+        indptr, indices = self._csr
+        user_idx = self.user_index.get(user_id)
+        if user_idx is not None and user_idx < len(indptr) - 1:
+            base = np.asarray(indices[indptr[user_idx]:indptr[user_idx + 1]])
+        else:
+            base = np.empty(0, dtype=np.int32)
+        extra = self._delta.get(user_id)
+        return base if extra is None else np.union1d(base, extra)
+
+    def rows(self, user_ids) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Entries của nhiều users: (row, position) với row là thứ tự trong user_ids,
+        dùng để mask một score matrix (len(user_ids), n_items) bằng một phép gán
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        row_numbers, positions = _gather(*self._csr, self.user_index.lookup(user_ids))
+
+        if self._delta:
+            extra_rows, extra_positions = [], []
+            for row, user_id in enumerate(user_ids.tolist()):
+                extra = self._delta.get(user_id)
+                if extra is not None:
+                    extra_rows.append(np.full(len(extra), row))
+                    extra_positions.append(extra)
+            if extra_rows:
+                row_numbers = np.concatenate([row_numbers] + extra_rows)
+                positions = np.concatenate([positions] + extra_positions)
+        return row_numbers, positions
+
+    def co_watched(
+        self,
+        item_positions: np.ndarray,
+        limit: int,
+        max_users_per_item: int = 500
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Items được xem cùng với item_positions nhiều nhất: (positions, counts)
+
+        Đếm trên rows của tối đa max_users_per_item users mỗi seed item (lấy đều
+        trong danh sách), nên chi phí không phụ thuộc số users / kích thước catalog.
+        Chỉ dùng base CSR (delta được tính sau lần compact tiếp theo).
+        """
+        indptr, indices = self._csr
+        item_indptr, item_users = self._item_users()
+        users = []
+        for pos in np.asarray(item_positions, dtype=np.int64):
+            if pos < 0 or pos >= self.n_items:
+                continue
+            start, end = item_indptr[pos], item_indptr[pos + 1]
+            step = max(1, -(-(end - start) // max_users_per_item))
+            users.append(item_users[start:end:step])
+        if not users:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        _, positions = _gather(indptr, indices, np.unique(np.concatenate(users)))
+        positions, counts = np.unique(positions, return_counts=True)
+        keep = ~np.isin(positions, item_positions)
+        positions, counts = positions[keep], counts[keep]
+
+        k = min(limit, len(positions))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        top = np.argpartition(-counts, k - 1)[:k]
+        top = top[np.argsort(-counts[top], kind="stable")]
+        return positions[top], counts[top]
+
+    def _item_users(self) -> Tuple[np.ndarray, np.ndarray]:
+        """CSR theo item (users của mỗi item) của base CSR, build lazy và build lại sau compact"""
+        cached = self._item_cache
+        if cached is not None and cached[0] is self._csr:
+            return cached[1]
+        csr = self._csr
+        indptr, indices = csr
+        transposed = csr_matrix(
+            (np.ones(len(indices), dtype=np.int8), np.asarray(indices), np.asarray(indptr)),
+            shape=(len(indptr) - 1, self.n_items)
+        ).tocsc()
+        item_users = (transposed.indptr.astype(np.int64), transposed.indices.astype(np.int64))
+        self._item_cache = (csr, item_users)
+        return item_users
+
+    def add(self, entries: Iterable[Tuple[int, np.ndarray]]):
+        """
+        Thêm các cặp mới: (user_id, item positions) - user chưa có trong model cũng được lưu
+        """
+        with self._lock:
+            for user_id, positions in entries:
+                positions = np.asarray(positions, dtype=np.int32)
+                positions = positions[(positions >= 0) & (positions < self.n_items)]
+                if not len(positions):
+                    continue
+                current = self._delta.get(user_id)
+                merged = np.unique(positions) if current is None else np.union1d(current, positions)
+                self._delta_size += len(merged) - (0 if current is None else len(current))
+                self._delta[user_id] = merged
+            if self._delta_size >= self.compact_threshold:
+                self._compact_locked()
+
+    def _merged(self) -> Tuple[np.ndarray, np.ndarray]:
+        """CSR gồm cả delta của các users đã có index (user mới từ fold-in được thêm rows)"""
+        indptr, indices = self._csr
+        delta = [(self.user_index.get(user_id), positions) for user_id, positions in self._delta.items()]
+        delta = [(user_idx, positions) for user_idx, positions in delta if user_idx is not None]
+        n_rows = max(len(indptr) - 1, len(self.user_index))
+        if not delta:
+            if n_rows == len(indptr) - 1:
+                return np.asarray(indptr), np.asarray(indices)
+            padded = np.concatenate([indptr, np.full(n_rows - (len(indptr) - 1), indptr[-1], dtype=indptr.dtype)])
+            return padded, np.asarray(indices)
+
+        base = csr_matrix(
+            (np.ones(len(indices), dtype=np.int8), np.asarray(indices), np.asarray(indptr)),
+            shape=(len(indptr) - 1, self.n_items)
+        )
+        base.resize((n_rows, self.n_items))
+        extra = csr_matrix(
+            (np.ones(sum(len(p) for _, p in delta), dtype=np.int8),
+             (np.concatenate([np.full(len(p), idx) for idx, p in delta]),
+              np.concatenate([p for _, p in delta]))),
+            shape=(n_rows, self.n_items)
+        )
+        merged = (base + extra).tocsr()
+        merged.sort_indices()
+        return merged.indptr.astype(np.int64), merged.indices.astype(np.int32)
+
+    def _compact_locked(self):
+        merged = self._merged()
+        # Giữ delta của users chưa có index (chưa fold-in)
+        remaining = {
+            user_id: positions for user_id, positions in self._delta.items()
+            if self.user_index.get(user_id) is None
+        }
+        self._csr = merged
+        self._delta = remaining
+        self._delta_size = sum(len(p) for p in remaining.values())
+
+    def stats(self) -> Dict:
+        return {
+            "rows": self.n_rows,
+            "nnz": self.nnz,
+            "delta_users": len(self._delta),
+            "delta_entries": self._delta_size,
+            "bytes": int(self._csr[0].nbytes + self._csr[1].nbytes)
+        }
+
+
+def _gather(indptr: np.ndarray, indices: np.ndarray, user_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Entries của các rows user_indices (-1 / ngoài CSR: không có entry): (thứ tự trong
+    user_indices, item position), gather các đoạn indices[start:end] không cần vòng lặp Python
+    """
+    user_indices = np.asarray(user_indices, dtype=np.int64)
+    known = (user_indices >= 0) & (user_indices < len(indptr) - 1)
+
+    starts = np.zeros(len(user_indices), dtype=np.int64)
+    lengths = np.zeros(len(user_indices), dtype=np.int64)
+    starts[known] = indptr[user_indices[known]]
+    lengths[known] = indptr[user_indices[known] + 1] - starts[known]
+
+    row_numbers = np.repeat(np.arange(len(user_indices)), lengths)
+    offsets = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.asarray(indices[np.repeat(starts, lengths) + offsets], dtype=np.int64)
+    return row_numbers, positions
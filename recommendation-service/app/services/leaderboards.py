@@ -0,0 +1,186 @@
+"""
+In-process leaderboards cho /popular, /top-rated và rails theo thể loại
+
+Columnar catalog (MovieCatalog) được xếp hạng sẵn theo
+(imdb_rating desc, no_of_votes desc). Với các min_votes thresholds đang dùng,
+top lists được tính trước; threshold khác được lọc trên ranking bằng numpy.
+Mỗi thể loại có ranking riêng. Request được serve từ memory, không cần query DB.
+
+Snapshot được refresh lazy: tối đa một lần mỗi refresh_seconds worker kiểm tra
+catalog fingerprint (một aggregate query) và chỉ rebuild khi catalog thay đổi.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.catalog import MovieCatalog, MovieRecord, catalog_fingerprint, get_movie_catalog
+
+logger = logging.getLogger(__name__)
+
+# min_votes mặc định của get_popular_movies / get_top_rated_movies
+POPULAR_MIN_VOTES = (10000,)
+TOP_RATED_MIN_VOTES = (5000,)
+
+
+class _Snapshot:
+    """Rankings của một version catalog (immutable sau khi build)"""
+
+    def __init__(self, catalog: MovieCatalog, thresholds: Sequence[int], depth: int):
+        start = time.perf_counter()
+        self.catalog = catalog
+        self.fingerprint = catalog.fingerprint
+
+        ratings = np.where(np.isnan(catalog.imdb_rating), -np.inf, catalog.imdb_rating)
+        votes = catalog.no_of_votes
+
+        # Rating desc, votes desc (NULL xếp cuối)
+        self.ranking = np.lexsort((-votes, -ratings))
+        self.ranked_votes = votes[self.ranking]
+
+        self.by_threshold: Dict[int, np.ndarray] = {
+            min_votes: self.ranking[self.ranked_votes >= min_votes][:depth]
+            for min_votes in thresholds
+        }
+
+        # Genre (lowercase) -> ranking của movies thuộc genre đó (từ inverted index)
+        rank_of = np.empty(len(catalog), dtype=np.int64)
+        rank_of[self.ranking] = np.arange(len(catalog))
+        self.by_genre: Dict[str, np.ndarray] = {}
+        for code, genre in enumerate(catalog.genre_vocab):
+            positions = catalog.movies_with_genre(code)
+            self.by_genre[genre.lower()] = positions[np.argsort(rank_of[positions])]
+        self.rank_of = rank_of
+
+        self.built_at = time.time()
+        self.build_seconds = time.perf_counter() - start
+
+
+class Leaderboards:
+    """Precomputed rankings, refresh theo lịch hoặc khi catalog thay đổi"""
+
+    def __init__(
+        self,
+        refresh_seconds: float = 300.0,
+        depth: int = 200,
+        thresholds: Sequence[int] = POPULAR_MIN_VOTES + TOP_RATED_MIN_VOTES
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.depth = depth
+        self.thresholds = tuple(sorted(set(thresholds)))
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def refresh(self, db: Session, force: bool = False) -> bool:
+        """
+        Rebuild snapshot nếu catalog thay đổi (hoặc force)
+
+        Returns:
+            True nếu snapshot được rebuild
+        """
+        with self._lock:
+            return self._refresh_locked(db, force)
+
+    def _refresh_locked(self, db: Session, force: bool = False) -> bool:
+        fingerprint = catalog_fingerprint(db)
+        self._checked_at = time.monotonic()
+        if not force and self._snapshot is not None and self._snapshot.fingerprint == fingerprint:
+            return False
+
+        catalog = get_movie_catalog(db, fingerprint)
+        self._snapshot = _Snapshot(catalog, self.thresholds, self.depth)
+        self.refreshes += 1
+        logger.info(
+            f"Leaderboards rebuilt: {len(catalog)} movies, "
+            f"{len(self._snapshot.by_genre)} genres, {self._snapshot.build_seconds:.3f}s"
+        )
+        return True
+
+    def _get_snapshot(self, db: Session) -> _Snapshot:
+        if self._snapshot is None:
+            self.refresh(db)
+        elif time.monotonic() - self._checked_at > self.refresh_seconds:
+            # Một thread kiểm tra catalog, các request khác tiếp tục dùng snapshot hiện tại
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._refresh_locked(db)
+                finally:
+                    self._lock.release()
+        return self._snapshot
+
+    def ranked(self, db: Session, limit: int, min_votes: int) -> List[MovieRecord]:
+        """
+        Top movies theo (rating, votes) với no_of_votes >= min_votes
+        """
+        snapshot = self._get_snapshot(db)
+        precomputed = snapshot.by_threshold.get(min_votes)
+        if precomputed is not None and limit <= len(precomputed):
+            positions = precomputed[:limit]
+        else:
+            positions = snapshot.ranking[snapshot.ranked_votes >= min_votes][:limit]
+        return [snapshot.catalog.record(pos) for pos in positions]
+
+    def by_genre(
+        self,
+        db: Session,
+        genre: str,
+        limit: int,
+        exclude_movie_id: Optional[int] = None
+    ) -> List[MovieRecord]:
+        """
+        Top movies của một thể loại (match không phân biệt hoa thường, giống ILIKE '%genre%')
+        """
+        snapshot = self._get_snapshot(db)
+        key = genre.strip().lower()
+
+        positions = snapshot.by_genre.get(key)
+        if positions is None:
+            # Match một phần tên thể loại, ví dụ "sci" -> "Sci-Fi"
+            matched = [snapshot.by_genre[g] for g in snapshot.by_genre if key in g]
+            if not matched:
+                return []
+            positions = np.unique(np.concatenate(matched))
+            positions = positions[np.argsort(snapshot.rank_of[positions])]
+
+        if exclude_movie_id is not None:
+            positions = positions[:limit + 1]
+            positions = positions[snapshot.catalog.ids[positions] != exclude_movie_id]
+        return [snapshot.catalog.record(pos) for pos in positions[:limit]]
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"status": "not_built"}
+        return {
+            "status": "ready",
+            "fingerprint": snapshot.fingerprint,
+            "n_movies": len(snapshot.catalog),
+            "n_genres": len(snapshot.by_genre),
+            "thresholds": list(self.thresholds),
+            "depth": self.depth,
+            "refresh_seconds": self.refresh_seconds,
+            "refreshes": self.refreshes,
+            "build_seconds": round(snapshot.build_seconds, 4),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(snapshot.built_at)),
+            "catalog": snapshot.catalog.stats()
+        }
+
+
+# Singleton instance (per worker)
+_leaderboards = None
+
+
+def get_leaderboards() -> Leaderboards:
+    """
+    Get or create leaderboards instance
+    """
+    global _leaderboards
+    if _leaderboards is None:
+        _leaderboards = Leaderboards(refresh_seconds=settings.LEADERBOARD_REFRESH_SECONDS)
+    return _leaderboards
@@ -0,0 +1,187 @@
+"""
+Metrics in-process (per worker) cho service, xuất ra text format của Prometheus
+
+- counter: số lần / tổng, có labels
+- histogram: latency (giây) theo buckets cố định, kèm sum/count
+
+Không phụ thuộc prometheus_client; mỗi worker có registry riêng, Prometheus
+scrape từng worker và cộng lại (label pid giúp phân biệt).
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Buckets (giây) cho latency histograms: 10µs .. 10s
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Ước lượng quantile theo upper bound của bucket"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            cumulative += n
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Counters + histograms, thread-safe"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(
+        self,
+        name: str,
+        seconds: float,
+        labels: Optional[Dict[str, str]] = None,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, labels: Optional[Dict[str, str]] = None) -> Iterator[Dict[str, str]]:
+        """
+        Đo thời gian một block; labels yield ra có thể được bổ sung bên trong block
+        """
+        labels = dict(labels or {})
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def snapshot(self) -> Dict:
+        """Dạng JSON: counters và count/sum/p50/p99 (ước lượng) của histograms"""
+        with self._lock:
+            counters = {
+                name: {_format_labels(key) or "total": value for key, value in series.items()}
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: {
+                    _format_labels(key) or "all": {
+                        "count": h.count,
+                        "sum_seconds": round(h.sum, 6),
+                        "mean_seconds": round(h.sum / h.count, 9) if h.count else None,
+                        "p50_seconds_le": h.quantile(0.5),
+                        "p99_seconds_le": h.quantile(0.99)
+                    }
+                    for key, h in series.items()
+                }
+                for name, series in self._histograms.items()
+            }
+        return {"pid": os.getpid(), "counters": counters, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        pid_label = ("pid", str(os.getpid()))
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key + (pid_label,))} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    key = key + (pid_label,)
+                    cumulative = 0
+                    for bound, n in zip(h.buckets, h.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {h.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Registry dùng chung trong worker
+metrics = MetricsRegistry()
+
+metrics.describe(
+    "recommendation_cold_start_check_seconds",
+    "Time spent deciding whether a user is cold-start (source=memory|caller|db)"
+)
+metrics.describe(
+    "recommendation_cold_start_checks_total",
+    "Cold-start decisions by result"
+)
+metrics.describe(
+    "recommendation_watched_lookups_total",
+    "Watched-movie lookups used for exclusion (source=memory|caller|db)"
+)
+metrics.describe(
+    "hybrid_stage_seconds",
+    "Duration of the hybrid recommendation stages (stage=candidates|ranking)"
+)
+metrics.describe(
+    "hybrid_source_seconds",
+    "Duration of each hybrid candidate source"
+)
+metrics.describe(
+    "hybrid_budget_exceeded_total",
+    "Hybrid stages that ran past their time budget or skipped sources/features"
+)
+metrics.describe(
+    "startup_warmup_seconds",
+    "Duration of each startup warm-up stage (stage=cf_model|content_index|leaderboards|trending|total)"
+)
@@ -0,0 +1,317 @@
+"""
+Versioned on-disk format cho collaborative filtering model
+
+Mỗi version là một thư mục chứa các array .npy contiguous (float32 cho factors
+và biases, int64 cho id mappings) và manifest.json với shape, dtype, sha256 của
+từng file. File CURRENT trỏ tới version đang serve. Workers mở các array bằng
+memory-mapping nên dùng chung một bản trong page cache và không cần deserialize.
+
+CURRENT và CACHE_GENERATION là tín hiệu giữa các workers: mỗi worker định kỳ đọc
+hai file nhỏ này, load lại model khi CURRENT đổi và xóa cache khi generation đổi.
+
+    weights/cf_model/
+        CURRENT
+        CACHE_GENERATION
+        v000001/manifest.json, user_factors.npy, item_factors.npy, ...
+        v000002/...
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+CACHE_GENERATION_FILE = "CACHE_GENERATION"
+
+
+class ModelIntegrityError(Exception):
+    """Artifact không khớp checksum hoặc manifest"""
+    pass
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Khóa giữa các workers / processes trên cùng host (file path + ".lock")"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(path.suffix + ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class IdIndex:
+    """
+    Mapping id -> index dựa trên int array, tra cứu bằng searchsorted
+
+    ids[idx] là id của row idx. Khi ids đã sort (trường hợp model vừa train),
+    không cần thêm array nào; ngược lại giữ thêm thứ tự argsort. Id thêm sau
+    khi load (ví dụ fold-in user mới) được giữ trong một dict nhỏ riêng.
+    """
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = np.asarray(ids)
+        if len(self.ids) > 1 and not np.all(self.ids[1:] > self.ids[:-1]):
+            self._order = np.argsort(self.ids, kind="stable")
+            self._sorted_ids = self.ids[self._order]
+        else:
+            self._order = None
+            self._sorted_ids = self.ids
+        self._extra: Dict[int, int] = {}
+        self._extra_ids: List[int] = []
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[int, int]) -> "IdIndex":
+        """Tạo từ dict id -> idx (idx liên tục từ 0)"""
+        ids = np.empty(len(mapping), dtype=np.int64)
+        for key, idx in mapping.items():
+            ids[idx] = key
+        return cls(ids)
+
+    def _base_position(self, key) -> int:
+        pos = int(np.searchsorted(self._sorted_ids, key))
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == key:
+            return pos if self._order is None else int(self._order[pos])
+        return -1
+
+    def get(self, key, default=None):
+        idx = self._base_position(key)
+        if idx >= 0:
+            return idx
+        return self._extra.get(key, default)
+
+    def __getitem__(self, key) -> int:
+        idx = self.get(key)
+        if idx is None:
+            raise KeyError(key)
+        return idx
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self._extra_ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.keys())
+
+    def keys(self) -> np.ndarray:
+        """Tất cả ids theo thứ tự index"""
+        if not self._extra_ids:
+            return self.ids
+        return np.concatenate([self.ids, np.asarray(self._extra_ids, dtype=self.ids.dtype)])
+
+    def id_at(self, idx: int) -> int:
+        """Reverse lookup: index -> id"""
+        if idx < len(self.ids):
+            return int(self.ids[idx])
+        return self._extra_ids[idx - len(self.ids)]
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Vectorized lookup: trả về index cho từng id, -1 nếu không có
+        """
+        keys = np.asarray(keys)
+        result = np.full(len(keys), -1, dtype=np.int64)
+        if len(self._sorted_ids) and len(keys):
+            pos = np.searchsorted(self._sorted_ids, keys)
+            pos = np.minimum(pos, len(self._sorted_ids) - 1)
+            found = self._sorted_ids[pos] == keys
+            idx = pos if self._order is None else self._order[pos]
+            result[found] = idx[found]
+        if self._extra:
+            for i in np.flatnonzero(result < 0):
+                result[i] = self._extra.get(int(keys[i]), -1)
+        return result
+
+    def add(self, key: int) -> int:
+        """Thêm id mới, trả về index của nó"""
+        idx = self.get(key)
+        if idx is not None:
+            return idx
+        idx = len(self)
+        self._extra[key] = idx
+        self._extra_ids.append(key)
+        return idx
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """Quản lý các version của model artifacts trong một thư mục"""
+
+    def __init__(self, root: str, keep_versions: int = 5):
+        self.root = Path(root)
+        self.keep_versions = keep_versions
+
+    @staticmethod
+    def _version_dir_name(version: int) -> str:
+        return f"v{version:06d}"
+
+    def version_path(self, version: int) -> Path:
+        return self.root / self._version_dir_name(version)
+
+    def list_versions(self) -> List[int]:
+        """Các version có trên disk, tăng dần"""
+        if not self.root.exists():
+            return []
+        versions = []
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name.startswith("v") and path.name[1:].isdigit():
+                if (path / MANIFEST_FILE).exists():
+                    versions.append(int(path.name[1:]))
+        return sorted(versions)
+
+    def current_version(self) -> Optional[int]:
+        """Version đang được trỏ bởi CURRENT"""
+        try:
+            with open(self.root / CURRENT_FILE) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def set_current(self, version: int):
+        """Trỏ CURRENT tới version (dùng cho publish và rollback), ghi atomic"""
+        if not (self.version_path(version) / MANIFEST_FILE).exists():
+            raise ValueError(f"Model version {version} không tồn tại")
+        tmp_path = self.root / f"{CURRENT_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(version))
+        os.replace(tmp_path, self.root / CURRENT_FILE)
+
+    def cache_generation(self) -> Optional[str]:
+        """Generation hiện tại của recommendation caches (None nếu chưa bump lần nào)"""
+        try:
+            with open(self.root / CACHE_GENERATION_FILE) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def bump_cache_generation(self) -> str:
+        """
+        Đổi cache generation để mọi worker xóa recommendation cache
+
+        Giá trị là timestamp + pid (không cần read-modify-write), ghi atomic.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        generation = f"{time.time_ns()}-{os.getpid()}"
+        tmp_path = self.root / f"{CACHE_GENERATION_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(generation)
+        os.replace(tmp_path, self.root / CACHE_GENERATION_FILE)
+        return generation
+
+    def save(self, arrays: Dict[str, np.ndarray], metadata: Dict) -> int:
+        """
+        Ghi một version mới và trỏ CURRENT tới nó
+
+        Arrays được ghi vào thư mục tạm rồi rename, nên reader chỉ thấy version
+        hoàn chỉnh. Số version được cấp, rename và CURRENT được ghi trong file lock
+        để hai processes lưu cùng lúc (training job, tune script) không lấy cùng
+        một version.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=".tmp-", dir=self.root))
+        try:
+            entries = {}
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                file_name = f"{name}.npy"
+                np.save(tmp_dir / file_name, array)
+                entries[name] = {
+                    "file": file_name,
+                    "dtype": str(array.dtype),
+                    "shape": list(array.shape),
+                    "sha256": _sha256(tmp_dir / file_name)
+                }
+
+            with file_lock(self.root):
+                versions = self.list_versions()
+                version = (versions[-1] if versions else 0) + 1
+                manifest = {
+                    "format_version": FORMAT_VERSION,
+                    "version": version,
+                    "created_at": datetime.now().isoformat(),
+                    "arrays": entries,
+                    "metadata": metadata
+                }
+                with open(tmp_dir / MANIFEST_FILE, "w") as f:
+                    json.dump(manifest, f, indent=2)
+
+                os.rename(tmp_dir, self.version_path(version))
+                self.set_current(version)
+                self._prune()
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"Model version {version} saved to {self.version_path(version)}")
+        return version
+
+    def load(
+        self,
+        version: Optional[int] = None,
+        mmap: bool = True,
+        verify: bool = True
+    ) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """
+        Load arrays và manifest của một version (mặc định: CURRENT)
+
+        Raises:
+            FileNotFoundError: không có version nào
+            ModelIntegrityError: manifest hoặc checksum không khớp
+        """
+        if version is None:
+            version = self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"No model version in {self.root}")
+
+        path = self.version_path(version)
+        with open(path / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ModelIntegrityError(
+                f"Unsupported model format {manifest.get('format_version')} in {path}"
+            )
+
+        arrays = {}
+        for name, entry in manifest["arrays"].items():
+            file_path = path / entry["file"]
+            if verify and _sha256(file_path) != entry["sha256"]:
+                raise ModelIntegrityError(f"Checksum mismatch for {file_path}")
+            array = np.load(file_path, mmap_mode="r" if mmap else None)
+            if list(array.shape) != entry["shape"] or str(array.dtype) != entry["dtype"]:
+                raise ModelIntegrityError(f"Shape/dtype mismatch for {file_path}")
+            arrays[name] = array
+
+        return arrays, manifest
+
+    def _prune(self):
+        """Giữ keep_versions version mới nhất (và luôn giữ CURRENT) để rollback"""
+        current = self.current_version()
+        versions = self.list_versions()
+        for version in versions[:-self.keep_versions]:
+            if version != current:
+                shutil.rmtree(self.version_path(version), ignore_errors=True)
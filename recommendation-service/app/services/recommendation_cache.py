@@ -0,0 +1,138 @@
+"""
+Bounded cache cho collaborative recommendations
+
+Mỗi user có tối đa một entry cho mỗi giá trị exclude_watched, lưu kết quả ở
+max_top_n; request với top_n nhỏ hơn được cắt từ entry đó. Entries bị loại theo
+LRU khi vượt max_entries và hết hạn sau ttl_seconds.
+
+Cache là per worker: invalidate_user chỉ xóa entries ở worker nhận behaviors mới.
+Các workers khác được báo qua cache generation của model store
+(collaborative_service.publish_user_invalidations), nên entries cũ ở đó sống tối đa
+khoảng CACHE_INVALIDATION_SECONDS + MODEL_RELOAD_CHECK_SECONDS chứ không phải ttl_seconds.
+
+Kết quả được tính ngoài lock: caller lấy token() trước khi tính và truyền vào put().
+Mỗi invalidate_user / clear tăng một sequence; put() bỏ qua kết quả nếu user bị
+invalidate (hoặc cache bị clear) sau token đó, để kết quả cũ không bị cache lại.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class RecommendationCache:
+    """LRU + TTL cache, key theo (user_id, exclude_watched)"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 600.0, max_top_n: int = 50):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_top_n = max_top_n
+        self._entries: "OrderedDict[Tuple[int, bool], Tuple[float, int, List]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Sequence của invalidation gần nhất theo user (tối đa max_entries users; token
+        # cũ hơn floor bị coi là stale vì invalidations trước đó đã bị loại khỏi dict)
+        self._sequence = 0
+        self._floor = 0
+        self._invalidated: "OrderedDict[int, int]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def token(self) -> int:
+        """Token lấy trước khi tính kết quả, truyền vào put()"""
+        with self._lock:
+            return self._sequence
+
+    def get(self, user_id: int, exclude_watched: bool, top_n: int) -> Optional[List]:
+        """
+        Lấy top_n recommendations từ cache, None nếu miss, đã hết hạn hoặc
+        entry được tính ở độ sâu nhỏ hơn top_n
+        """
+        key = (user_id, exclude_watched)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            created_at, depth, results = entry
+            if time.monotonic() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            if top_n > depth:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results[:top_n]
+
+    def put(self, user_id: int, exclude_watched: bool, results: List, depth: int, token: Optional[int] = None):
+        """
+        Lưu kết quả cho user, depth là top_n đã dùng để tính results
+
+        Với token (từ token() trước khi tính), kết quả không được lưu nếu user đã bị
+        invalidate hoặc cache đã bị clear trong lúc tính.
+        """
+        key = (user_id, exclude_watched)
+        with self._lock:
+            if token is not None and (token < self._floor or self._invalidated.get(user_id, -1) > token):
+                self.stale_puts += 1
+                return
+            self._entries[key] = (time.monotonic(), depth, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        """
+        Xóa entries của một user (gọi khi behaviors của user thay đổi)
+        """
+        with self._lock:
+            self._sequence += 1
+            self._invalidated[user_id] = self._sequence
+            self._invalidated.move_to_end(user_id)
+            while len(self._invalidated) > self.max_entries:
+                _, sequence = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, sequence)
+            for exclude_watched in (True, False):
+                if self._entries.pop((user_id, exclude_watched), None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sequence += 1
+            self._floor = self._sequence
+            self._invalidated.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """
+        Counters của cache (hit/miss/eviction)
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts
+            }
@@ -1,8 +1,10 @@
-from typing import List, Set, Tuple
+from typing import Dict, List, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models.movie import Movie
-from app.models.user_behavior import UserBehavior
 from app.schemas.recommendation import MovieRecommendation
+from app.services.user_scores import get_user_scores, get_user_scores_async
 
 
 def fill_with_popular_movies(
@@ -33,7 +35,7 @@ def fill_with_popular_movies(
     
     results = existing_recommendations.copy()
     
-    for movie in popular_movies:
+    for movie, _ in popular_movies:
         if movie.id not in exclude_movie_ids and len(results) < target_count:
             results.append(
                 MovieRecommendation(
@@ -83,14 +85,30 @@ def movie_to_recommendation(
 
 def get_user_watched_movies(db: Session, user_id: int) -> Tuple[List, Set[int]]:
     """
-    Get user's watched movies and their IDs from UserBehavior
+    Get user's watched movies and their IDs from user_movie_scores
     
     Returns:
-        Tuple of (user_behaviors_list, watched_movie_ids_set)
+        Tuple of (user_scores_list, watched_movie_ids_set), one UserScore
+        (movie_id, time-decayed score, interaction_count) per watched movie
     """
-    user_behaviors = db.query(UserBehavior).filter(UserBehavior.user_id == user_id).all()
-    watched_movie_ids = {b.movie_id for b in user_behaviors}
-    return user_behaviors, watched_movie_ids
+    user_scores = get_user_scores(db, user_id)
+    watched_movie_ids = {s.movie_id for s in user_scores}
+    return user_scores, watched_movie_ids
+
+
+async def get_user_watched_movies_async(db: AsyncSession, user_id: int) -> Tuple[List, Set[int]]:
+    """Async version of get_user_watched_movies"""
+    user_scores = await get_user_scores_async(db, user_id)
+    watched_movie_ids = {s.movie_id for s in user_scores}
+    return user_scores, watched_movie_ids
+
+
+async def get_movies_by_ids_async(db: AsyncSession, movie_ids: List[int]) -> Dict[int, Movie]:
+    """Load movies by ID in one query, keyed by movie ID"""
+    if not movie_ids:
+        return {}
+    result = await db.execute(select(Movie).where(Movie.id.in_(movie_ids)))
+    return {movie.id: movie for movie in result.scalars()}
 
 
 def get_content_based_from_user_history(
@@ -104,30 +122,24 @@ def get_content_based_from_user_history(
     """
     Get content-based recommendations from user's top scored movies
     
+    Builds one content profile from the user's history and scores it against
+    the catalog in a single pass (see RecommendationService.get_content_based_from_profile).
+    
     Returns:
         List of tuples (movie, similarity, reason, source_title)
     """
     if not user_behaviors:
         return []
     
-    # Sort by score (higher score = better)
-    top_scored = sorted(user_behaviors, key=lambda x: x.score, reverse=True)[:num_source_movies]
-    content_based_results = []
-    seen_movie_ids = set()
-    
-    for behavior in top_scored:
-        source_movie, similar_movies = rec_service.get_similar_movies_content_based(
-            db=db,
-            movie_id=behavior.movie_id,
-            limit=top_n * 2
-        )
-        
-        if similar_movies:
-            for movie, similarity, reason in similar_movies:
-                if movie.id not in watched_movie_ids and movie.id not in seen_movie_ids:
-                    content_based_results.append((movie, similarity, reason, source_movie.series_title))
-                    seen_movie_ids.add(movie.id)
+    # Aggregate score theo movie (một movie có thể có nhiều behaviors)
+    movie_scores = {}
+    for behavior in user_behaviors:
+        movie_scores[behavior.movie_id] = movie_scores.get(behavior.movie_id, 0.0) + behavior.score
     
-    # Sort by similarity
-    content_based_results.sort(key=lambda x: x[1], reverse=True)
-    return content_based_results
\ No newline at end of file
+    return rec_service.get_content_based_from_profile(
+        db=db,
+        movie_scores=movie_scores,
+        exclude_movie_ids=watched_movie_ids,
+        limit=top_n * 2,
+        num_source_movies=num_source_movies
+    )
@@ -1,11 +1,17 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, List, Set, Tuple, Optional
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import logging
+import threading
 import numpy as np
 
-from app.models.movie import Movie
+from app.config import settings
+from app.services.ann_index import TUNING_QUERIES, IVFIndex
+from app.services.catalog import MovieCatalog, MovieRecord, STAR_ATTRS, catalog_fingerprint, get_movie_catalog
+from app.services.leaderboards import POPULAR_MIN_VOTES, TOP_RATED_MIN_VOTES, get_leaderboards
+from app.services.similarity_index import ContentNeighborIndex, MIN_SIMILARITY
+
+logger = logging.getLogger(__name__)
 
 
 class RecommendationService:
@@ -16,9 +22,18 @@ class RecommendationService:
         'vectorizer': None,
         'matrix': None,
         'movie_ids': None,
-        'movies': None
+        'catalog': None,
+        'fingerprint': None,
+        'ann': None
     }
     
+    # Precomputed top-K neighbor table cho /similar (shared across instances)
+    _neighbor_index: Optional[ContentNeighborIndex] = None
+    # Một thread load/build index, các request đồng thời chờ và dùng lại kết quả
+    _neighbor_lock = threading.Lock()
+    NEIGHBOR_INDEX_PATH = "weights/content_index"
+    NEIGHBOR_TOP_K = 50
+    
     def __init__(self, db: Session = None):
         """
         Initialize recommendation service
@@ -35,10 +50,13 @@ class RecommendationService:
             'vectorizer': None,
             'matrix': None,
             'movie_ids': None,
-            'movies': None
+            'catalog': None,
+            'fingerprint': None,
+            'ann': None
         }
+        cls._neighbor_index = None
     
-    def _build_feature_string(self, movie: Movie) -> str:
+    def _build_feature_string(self, movie: MovieRecord) -> str:
         """
         Build feature string for TF-IDF from movie attributes
         Includes: genre, director, overview, cast (star1-star4)
@@ -55,27 +73,42 @@ class RecommendationService:
             features.append(movie.overview)
         
         # Add cast members (star1, star2, star3, star4)
-        for star_attr in ['star1', 'star2', 'star3', 'star4']:
+        for star_attr in STAR_ATTRS:
             star = getattr(movie, star_attr, None)
             if star:
                 features.append(star)
         
         return ' '.join(features)
     
-    def _ensure_tfidf_cache(self, all_movies: List[Movie]):
+    def _catalog_fingerprint(self, db: Session) -> str:
+        """
+        Cheap catalog version (see catalog.catalog_fingerprint)
+        """
+        return catalog_fingerprint(db)
+    
+    def _ensure_tfidf_cache(self, db: Session, fingerprint: Optional[str] = None):
         """
         Build or reuse TF-IDF vectorizer and matrix
-        Cache is invalidated when movie IDs change
+        Cache is invalidated when the catalog fingerprint changes
+        
+        Args:
+            db: Database session
+            fingerprint: Catalog fingerprint if the caller already has it
         """
-        current_movie_ids = [m.id for m in all_movies]
+        if fingerprint is None:
+            fingerprint = self._catalog_fingerprint(db)
         
         # Check if cache is valid
-        if (self._tfidf_cache['movie_ids'] is not None and 
-            self._tfidf_cache['movie_ids'] == current_movie_ids):
+        if (self._tfidf_cache['fingerprint'] is not None and
+            self._tfidf_cache['fingerprint'] == fingerprint):
             return  # Cache is valid, no rebuild needed
         
-        # Rebuild TF-IDF
-        feature_strings = [self._build_feature_string(m) for m in all_movies]
+        # Full reload chỉ khi catalog thay đổi (rows theo thứ tự id của catalog)
+        catalog = get_movie_catalog(db, fingerprint)
+        if len(catalog) == 0:
+            return
+        
+        feature_strings = [self._build_feature_string(catalog.record(pos)) for pos in range(len(catalog))]
         
         vectorizer = TfidfVectorizer(
             stop_words='english',
@@ -88,14 +121,68 @@ class RecommendationService:
         # Update cache
         self._tfidf_cache['vectorizer'] = vectorizer
         self._tfidf_cache['matrix'] = tfidf_matrix
-        self._tfidf_cache['movie_ids'] = current_movie_ids
-        self._tfidf_cache['movies'] = all_movies
+        self._tfidf_cache['movie_ids'] = catalog.ids
+        self._tfidf_cache['catalog'] = catalog
+        self._tfidf_cache['fingerprint'] = fingerprint
+        self._tfidf_cache['ann'] = self._load_or_build_content_ann(tfidf_matrix, fingerprint)
+    
+    def _load_or_build_content_ann(self, tfidf_matrix, fingerprint: str) -> Optional[IVFIndex]:
+        """
+        ANN index (cosine) trên TF-IDF rows, chỉ khi catalog đủ lớn
+        
+        Lưu cạnh neighbor index trong weights/ và dùng lại nếu fingerprint khớp.
+        """
+        if tfidf_matrix.shape[0] < settings.ANN_MIN_ITEMS:
+            return None
+        
+        path = type(self).NEIGHBOR_INDEX_PATH
+        index, metadata = IVFIndex.load(path, tfidf_matrix)
+        if index is not None and metadata.get('fingerprint') == fingerprint:
+            tuning = index.tuning or {}
+            if settings.ANN_NPROBE > 0:
+                index.nprobe = min(settings.ANN_NPROBE, index.n_lists)
+            elif tuning.get('target_recall') != settings.ANN_TARGET_RECALL:
+                self._tune_content_ann(index, tfidf_matrix)
+            return index
+        
+        index = self._build_content_ann(tfidf_matrix)
+        try:
+            index.save(path, extra_metadata={'fingerprint': fingerprint})
+        except OSError as e:
+            logger.warning(f"Failed to persist content ANN index: {e}")
+        return index
+    
+    def _build_content_ann(self, tfidf_matrix) -> IVFIndex:
+        """IVF index trên TF-IDF rows; nprobe theo cấu hình, hoặc tune trên một sample movies"""
+        index = IVFIndex.build(tfidf_matrix, metric="cosine", nprobe=settings.ANN_NPROBE)
+        if settings.ANN_NPROBE <= 0:
+            self._tune_content_ann(index, tfidf_matrix)
+        return index
+    
+    @staticmethod
+    def _tune_content_ann(index: IVFIndex, tfidf_matrix):
+        rng = np.random.RandomState(42)
+        sample = rng.choice(tfidf_matrix.shape[0], min(TUNING_QUERIES, tfidf_matrix.shape[0]), replace=False)
+        index.tune_nprobe(tfidf_matrix[sample], target_recall=settings.ANN_TARGET_RECALL)
+    
+    def _ranked_movies(self, limit: int, min_votes: int, reason: Callable[[MovieRecord], str]) -> List[Tuple[MovieRecord, str]]:
+        """
+        Movies ranked by (IMDB rating, votes) with at least min_votes votes, with a reason each
+        
+        Served from the in-process leaderboard, no per-request query. Popular and
+        top-rated share this ranking and differ only in the vote threshold and reason.
+        """
+        if not self.db:
+            raise ValueError("Database session required for this method")
+        
+        movies = get_leaderboards().ranked(self.db, limit=limit, min_votes=min_votes)
+        return [(movie, reason(movie)) for movie in movies]
     
     def get_popular_movies(
         self, 
         limit: int = 10, 
-        min_votes: int = 10000
-    ) -> List[Tuple[Movie, str]]:
+        min_votes: int = POPULAR_MIN_VOTES[0]
+    ) -> List[Tuple[MovieRecord, str]]:
         """
         Get popular movies based on IMDB rating and vote count
         
@@ -106,27 +193,16 @@ class RecommendationService:
         Returns:
             List of tuples (Movie, reason)
         """
-        if not self.db:
-            raise ValueError("Database session required for this method")
-        
-        movies = (
-            self.db.query(Movie)
-            .filter(Movie.no_of_votes >= min_votes)
-            .order_by(desc(Movie.imdb_rating), desc(Movie.no_of_votes))
-            .limit(limit)
-            .all()
+        return self._ranked_movies(
+            limit, min_votes,
+            lambda movie: f"Phim phổ biến - Rating {movie.imdb_rating}/10 với {movie.no_of_votes:,} votes"
         )
-        
-        return [
-            (movie, f"Phim phổ biến - Rating {movie.imdb_rating}/10 với {movie.no_of_votes:,} votes")
-            for movie in movies
-        ]
     
     def get_top_rated_movies(
         self, 
         limit: int = 10, 
-        min_votes: int = 5000
-    ) -> List[Tuple[Movie, str]]:
+        min_votes: int = TOP_RATED_MIN_VOTES[0]
+    ) -> List[Tuple[MovieRecord, str]]:
         """
         Get top rated movies based on IMDB rating
         
@@ -137,30 +213,133 @@ class RecommendationService:
         Returns:
             List of tuples (Movie, reason)
         """
-        if not self.db:
-            raise ValueError("Database session required for this method")
+        return self._ranked_movies(limit, min_votes, lambda movie: f"Top rated - {movie.imdb_rating}/10")
+    
+    def get_neighbor_index(
+        self,
+        db: Session,
+        force_rebuild: bool = False,
+        fingerprint: Optional[str] = None
+    ) -> Optional[ContentNeighborIndex]:
+        """
+        Get the precomputed neighbor index, rebuilding it only when the catalog changed
         
-        movies = (
-            self.db.query(Movie)
-            .filter(Movie.no_of_votes >= min_votes)
-            .order_by(desc(Movie.imdb_rating))
-            .limit(limit)
-            .all()
-        )
+        Lookup order: in-process index -> index persisted in weights/ -> rebuild
+        from TF-IDF.
         
-        return [
-            (movie, f"Top rated - {movie.imdb_rating}/10")
-            for movie in movies
+        Args:
+            db: Database session
+            force_rebuild: Rebuild even if the catalog did not change
+            fingerprint: Catalog fingerprint if the caller already has it
+            
+        Returns:
+            ContentNeighborIndex, or None if the catalog has fewer than 2 movies
+        """
+        cls = type(self)
+        if fingerprint is None:
+            fingerprint = self._catalog_fingerprint(db)
+        
+        if not force_rebuild:
+            index = cls._neighbor_index
+            if index is not None and index.fingerprint == fingerprint:
+                return index
+        
+        with cls._neighbor_lock:
+            if not force_rebuild:
+                # Request khác có thể vừa build xong trong lúc chờ lock
+                index = cls._neighbor_index
+                if index is not None and index.fingerprint == fingerprint:
+                    return index
+                
+                index = ContentNeighborIndex.load(cls.NEIGHBOR_INDEX_PATH)
+                if index is not None and index.fingerprint == fingerprint:
+                    cls._neighbor_index = index
+                    return index
+            
+            self._ensure_tfidf_cache(db, fingerprint)
+            if self._tfidf_cache['catalog'] is None or len(self._tfidf_cache['catalog']) < 2:
+                return None
+            
+            index = ContentNeighborIndex.build(
+                self._tfidf_cache['matrix'],
+                self._tfidf_cache['catalog'],
+                fingerprint=fingerprint,
+                top_k=cls.NEIGHBOR_TOP_K,
+                ann=self._tfidf_cache['ann']
+            )
+            
+            try:
+                index.save(cls.NEIGHBOR_INDEX_PATH)
+            except OSError as e:
+                logger.warning(f"Failed to persist content neighbor index: {e}")
+            
+            cls._neighbor_index = index
+            return index
+    
+    def evaluate_content_ann(self, db: Session, k: int = 10, n_queries: int = 200) -> Dict:
+        """
+        Recall@k của TF-IDF ANN index so với exact cosine, dùng movie rows làm queries
+        """
+        self._ensure_tfidf_cache(db)
+        matrix = self._tfidf_cache['matrix']
+        if matrix is None:
+            raise ValueError("Catalog rỗng")
+        
+        index = self._tfidf_cache['ann']
+        if index is None:
+            # Catalog nhỏ: build tạm một index để xem trade-off
+            index = self._build_content_ann(matrix)
+        
+        rng = np.random.RandomState(42)
+        sample = rng.choice(matrix.shape[0], min(n_queries, matrix.shape[0]), replace=False)
+        report = index.evaluate(matrix[sample], k=k)
+        report["serving"] = self._tfidf_cache['ann'] is not None
+        return report
+    
+    def _build_similarity_reason(
+        self,
+        catalog: MovieCatalog,
+        source_pos: int,
+        similarity: float,
+        common_genre_mask: int,
+        same_director: bool,
+        common_cast_slots: List[int]
+    ) -> str:
+        """
+        Build reason text from precomputed reason features and catalog columns
+        """
+        common_features = []
+        
+        # Giữ thứ tự thể loại của phim nguồn
+        common_genres = [
+            catalog.genre_vocab[code]
+            for code in catalog.genres_of(source_pos)
+            if common_genre_mask >> int(code) & 1
         ]
+        if common_genres:
+            common_features.append(f"cùng thể loại {', '.join(common_genres[:2])}")
+        
+        director = catalog.string(catalog.director[source_pos])
+        if same_director and director:
+            common_features.append(f"cùng đạo diễn {director}")
+        
+        common_cast = [catalog.string(catalog.stars[source_pos, slot]) for slot in common_cast_slots]
+        if common_cast:
+            common_features.append(f"cùng diễn viên {', '.join(common_cast[:2])}")
+        
+        reason = f"Tương tự {round(similarity * 100, 1)}%"
+        if common_features:
+            reason += f" ({', '.join(common_features[:2])})"
+        return reason
     
     def get_similar_movies_content_based(
         self,
         db: Session,
         movie_id: int,
         limit: int = 10
-    ) -> Tuple[Optional[Movie], List[Tuple[Movie, float, str]]]:
+    ) -> Tuple[Optional[MovieRecord], List[Tuple[MovieRecord, float, str]]]:
         """
-        Get similar movies using TF-IDF content-based filtering with caching
+        Get similar movies from the precomputed TF-IDF neighbor index
         
         Features used: genre, director, overview, cast (star1-star4)
         
@@ -172,92 +351,189 @@ class RecommendationService:
         Returns:
             Tuple of (source_movie, [(similar_movie, similarity_score, reason)])
         """
-        source_movie = db.query(Movie).filter(Movie.id == movie_id).first()
+        fingerprint = self._catalog_fingerprint(db)
+        catalog = get_movie_catalog(db, fingerprint)
         
-        if not source_movie:
+        source_pos = catalog.position(movie_id)
+        if source_pos is None:
             return None, []
+        source_movie = catalog.record(source_pos)
         
-        # Get all movies
-        all_movies = db.query(Movie).all()
-        
-        if len(all_movies) < 2:
+        index = self.get_neighbor_index(db, fingerprint=fingerprint)
+        if index is None:
             return source_movie, []
         
-        # Ensure TF-IDF cache is built/updated
-        self._ensure_tfidf_cache(all_movies)
-        
-        # Get cached data
-        tfidf_matrix = self._tfidf_cache['matrix']
-        cached_movie_ids = self._tfidf_cache['movie_ids']
-        cached_movies = self._tfidf_cache['movies']
-        
-        # Find source movie index
-        try:
-            source_idx = cached_movie_ids.index(movie_id)
-        except ValueError:
+        # O(K) lookup thay vì tính similarity với toàn bộ catalog
+        neighbors = index.lookup(movie_id, limit)
+        if not neighbors:
             return source_movie, []
         
-        # Compute cosine similarity (fast because matrix is cached)
-        cosine_sim = cosine_similarity(
-            tfidf_matrix[source_idx:source_idx+1], 
-            tfidf_matrix
-        ).flatten()
-        
-        # Get top similar movies (exclude source)
-        similar_indices = np.argsort(cosine_sim)[::-1]
-        similar_indices = [idx for idx in similar_indices if idx != source_idx]
+        neighbor_positions = catalog.positions([n[0] for n in neighbors])
         
         results = []
-        for idx in similar_indices:
-            if len(results) >= limit:
-                break
-                
-            similarity = float(cosine_sim[idx])
-            
-            # Skip very low similarity
-            if similarity <= 0.01:
+        for (_, similarity, genre_mask, same_director, cast_slots), pos in zip(neighbors, neighbor_positions):
+            if pos < 0:
                 continue
             
-            similar_movie = cached_movies[idx]
-            
-            # Build reason with common features
-            common_features = []
-            
-            if source_movie.genre and similar_movie.genre:
-                source_genres = set(g.strip() for g in source_movie.genre.split(','))
-                similar_genres = set(g.strip() for g in similar_movie.genre.split(','))
-                common = source_genres & similar_genres
-                if common:
-                    common_features.append(f"cùng thể loại {', '.join(list(common)[:2])}")
-            
-            if source_movie.director and similar_movie.director:
-                if source_movie.director == similar_movie.director:
-                    common_features.append(f"cùng đạo diễn {source_movie.director}")
-            
-            # Check common cast members
-            source_cast = set()
-            for attr in ['star1', 'star2', 'star3', 'star4']:
-                star = getattr(source_movie, attr, None)
-                if star:
-                    source_cast.add(star)
-            
-            similar_cast = set()
-            for attr in ['star1', 'star2', 'star3', 'star4']:
-                star = getattr(similar_movie, attr, None)
-                if star:
-                    similar_cast.add(star)
-            
-            common_cast = source_cast & similar_cast
-            if common_cast:
-                common_features.append(f"cùng diễn viên {', '.join(list(common_cast)[:2])}")
+            reason = self._build_similarity_reason(
+                catalog, source_pos, similarity, genre_mask, same_director, cast_slots
+            )
+            results.append((catalog.record(pos), similarity, reason))
+        
+        return source_movie, results
+    
+    def get_content_based_from_profile(
+        self,
+        db: Session,
+        movie_scores: Dict[int, float],
+        exclude_movie_ids: Set[int],
+        limit: int = 10,
+        num_source_movies: int = 5
+    ) -> List[Tuple[MovieRecord, float, str, str]]:
+        """
+        Content-based recommendations from a user content profile
+        
+        The profile is the score-weighted sum of the TF-IDF rows of the user's
+        top scored movies. It is scored against the whole catalog in one sparse
+        product instead of one similarity scan per source movie.
+        
+        Args:
+            db: Database session
+            movie_scores: movie_id -> user score for the user's history
+            exclude_movie_ids: Movie IDs to mask out (watched, already recommended)
+            limit: Number of recommendations to return
+            num_source_movies: Number of top scored movies used to build the profile
             
+        Returns:
+            List of tuples (movie, similarity, reason, source_title), where
+            source_title is the history movie contributing most to the score
+        """
+        if not movie_scores or limit <= 0:
+            return []
+        
+        profile = self._content_profile(db, movie_scores, num_source_movies)
+        if profile is None:
+            return []
+        source_pos, weights, source_rows, profile_norm = profile
+        matrix = self._tfidf_cache['matrix']
+        catalog = self._tfidf_cache['catalog']
+        
+        # Positions bị loại: watched/excluded và chính các source movies
+        excluded_pos = source_pos
+        if exclude_movie_ids:
+            excluded = catalog.positions(np.fromiter(exclude_movie_ids, dtype=np.int64, count=len(exclude_movie_ids)))
+            excluded_pos = np.union1d(excluded_pos, excluded[excluded >= 0])
+        
+        # Catalog lớn: chỉ score candidates từ ANN index, ngược lại score toàn bộ
+        ann = self._tfidf_cache['ann']
+        if ann is not None:
+            profile = np.asarray(source_rows.T @ weights).ravel() / profile_norm
+            candidates, _ = ann.search(profile[None, :], limit, exclude=[excluded_pos])[0]
+        else:
+            candidates = np.arange(len(catalog))
+        
+        # contributions[i, j] = weight_i * cos(source_i, candidate_j)
+        contributions = (source_rows @ matrix[candidates].T).toarray() * weights[:, None]
+        
+        # Cosine giữa profile vector và từng candidate
+        scores = contributions.sum(axis=0) / profile_norm
+        
+        # Mask watched/excluded bằng vector operations
+        scores[np.isin(candidates, excluded_pos)] = -np.inf
+        
+        n_candidates = int(np.count_nonzero(scores > MIN_SIMILARITY))
+        k = min(limit, n_candidates)
+        if k == 0:
+            return []
+        
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        
+        # Source movie đóng góp nhiều nhất cho từng kết quả
+        best_source = source_pos[np.argmax(contributions[:, top], axis=0)]
+        
+        results = []
+        for pos, score, source in zip(candidates[top], scores[top], best_source):
+            similarity = float(score)
             reason = f"Tương tự {round(similarity * 100, 1)}%"
-            if common_features:
-                reason += f" ({', '.join(common_features[:2])})"
-            
-            results.append((similar_movie, similarity, reason))
+            source_title = catalog.string(catalog.columns['series_title'][source])
+            results.append((catalog.record(pos), similarity, reason, source_title))
         
-        return source_movie, results
+        return results
+    
+    def _content_profile(
+        self,
+        db: Session,
+        movie_scores: Dict[int, float],
+        num_source_movies: int
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, object, float]]:
+        """
+        Content profile of a user history: (source positions, weights, source TF-IDF
+        rows, profile norm), or None if no history movie is in the catalog
+        """
+        self._ensure_tfidf_cache(db)
+        matrix = self._tfidf_cache['matrix']
+        catalog = self._tfidf_cache['catalog']
+        if matrix is None:
+            return None
+        
+        # Top scored movies có trong catalog
+        top_scored = sorted(movie_scores.items(), key=lambda x: x[1], reverse=True)
+        source_pos = catalog.positions([movie_id for movie_id, _ in top_scored])
+        in_catalog = source_pos >= 0
+        source_pos = source_pos[in_catalog][:num_source_movies]
+        weights = np.array([score for _, score in top_scored], dtype=np.float64)[in_catalog][:num_source_movies]
+        if len(source_pos) == 0:
+            return None
+        
+        source_rows = matrix[source_pos]
+        profile_norm = np.sqrt(weights @ (source_rows @ source_rows.T).toarray() @ weights)
+        if profile_norm <= 0:
+            return None
+        return source_pos, weights, source_rows, profile_norm
+    
+    def content_similarity(
+        self,
+        db: Session,
+        movie_scores: Dict[int, float],
+        movie_ids: np.ndarray,
+        num_source_movies: int = 5
+    ) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """
+        Cosine between the user content profile and a given set of movies
+        
+        Cost is bounded by the number of movies (one sparse product on their
+        TF-IDF rows), not by the catalog size.
+        
+        Returns:
+            (similarities, source_titles): 0 for movies outside the catalog or
+            without a profile; source_title is the history movie contributing most
+        """
+        similarities = np.zeros(len(movie_ids))
+        source_titles: List[Optional[str]] = [None] * len(movie_ids)
+        if not movie_scores or len(movie_ids) == 0:
+            return similarities, source_titles
+        
+        profile = self._content_profile(db, movie_scores, num_source_movies)
+        if profile is None:
+            return similarities, source_titles
+        source_pos, weights, source_rows, profile_norm = profile
+        matrix = self._tfidf_cache['matrix']
+        catalog = self._tfidf_cache['catalog']
+        
+        positions = catalog.positions(np.asarray(movie_ids, dtype=np.int64))
+        in_catalog = np.flatnonzero(positions >= 0)
+        if len(in_catalog) == 0:
+            return similarities, source_titles
+        
+        contributions = (source_rows @ matrix[positions[in_catalog]].T).toarray() * weights[:, None]
+        similarities[in_catalog] = contributions.sum(axis=0) / profile_norm
+        
+        best_source = source_pos[np.argmax(contributions, axis=0)]
+        titles = catalog.columns['series_title']
+        for i, source in zip(in_catalog, best_source):
+            source_titles[i] = catalog.string(titles[source])
+        return similarities, source_titles
     
     def get_movies_by_genre(
         self,
@@ -265,7 +541,7 @@ class RecommendationService:
         genre: str,
         limit: int = 10,
         exclude_movie_id: Optional[int] = None
-    ) -> List[Tuple[Movie, str]]:
+    ) -> List[Tuple[MovieRecord, str]]:
         """
         Get movies by genre, sorted by rating
         
@@ -278,16 +554,11 @@ class RecommendationService:
         Returns:
             List of tuples (Movie, reason)
         """
-        query = db.query(Movie).filter(Movie.genre.ilike(f'%{genre}%'))
-        
-        if exclude_movie_id:
-            query = query.filter(Movie.id != exclude_movie_id)
-        
-        movies = (
-            query
-            .order_by(desc(Movie.imdb_rating))
-            .limit(limit)
-            .all()
+        movies = get_leaderboards().by_genre(
+            db,
+            genre=genre,
+            limit=limit,
+            exclude_movie_id=exclude_movie_id
         )
         
         return [
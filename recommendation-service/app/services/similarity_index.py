@@ -0,0 +1,265 @@
+"""
+Precomputed item-to-item neighbor index cho content-based similarity
+
+Với mỗi movie lưu top-K neighbors (movie ids, cosine scores) và reason features
+(thể loại chung, cùng đạo diễn, diễn viên chung). Index được build một lần từ
+TF-IDF matrix bằng sparse matrix-matrix products theo chunk, lưu cạnh model
+trong weights/ và chỉ rebuild khi catalog thay đổi.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.catalog import STAR_ATTRS, MovieCatalog
+
+logger = logging.getLogger(__name__)
+
+# Bỏ qua neighbors có similarity quá thấp
+MIN_SIMILARITY = 0.01
+
+# Giới hạn bộ nhớ cho dense similarity block / reason features của một chunk (bytes)
+_CHUNK_MEMORY_BUDGET = 64 * 1024 * 1024
+
+# Genre bitmask dùng uint64
+_MAX_GENRES = 64
+
+# File chứa arrays và metadata của index (trong NEIGHBOR_INDEX_PATH)
+INDEX_FILE = "neighbors.npz"
+
+
+class ContentNeighborIndex:
+    """Top-K neighbor table: movie_id -> (neighbor ids, scores, reason features)"""
+
+    ARRAY_FIELDS = ('movie_ids', 'neighbor_ids', 'scores', 'common_genres', 'same_director', 'common_cast')
+
+    def __init__(
+        self,
+        movie_ids: np.ndarray,
+        neighbor_ids: np.ndarray,
+        scores: np.ndarray,
+        common_genres: np.ndarray,
+        same_director: np.ndarray,
+        common_cast: np.ndarray,
+        genre_vocab: List[str],
+        fingerprint: str,
+        report: Dict
+    ):
+        self.movie_ids = movie_ids
+        self.neighbor_ids = neighbor_ids
+        self.scores = scores
+        self.common_genres = common_genres
+        self.same_director = same_director
+        self.common_cast = common_cast
+        self.genre_vocab = genre_vocab
+        self.fingerprint = fingerprint
+        self.report = report
+
+    @property
+    def top_k(self) -> int:
+        return self.neighbor_ids.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(getattr(self, name).nbytes for name in self.ARRAY_FIELDS))
+
+    @classmethod
+    def build(cls, tfidf_matrix, catalog: MovieCatalog, fingerprint: str, top_k: int = 50, ann=None) -> "ContentNeighborIndex":
+        """
+        Build neighbor table từ TF-IDF matrix (rows L2-normalized, cùng thứ tự với catalog)
+
+        Nếu có ann (IVFIndex, metric="cosine"), neighbors của mỗi movie được lấy
+        từ ANN search thay vì so sánh với toàn bộ catalog.
+        """
+        start = time.perf_counter()
+        n_movies = tfidf_matrix.shape[0]
+        k = max(1, min(top_k, n_movies - 1))
+
+        movie_ids = catalog.ids
+        neighbor_pos = np.full((n_movies, k), -1, dtype=np.int64)
+        scores = np.zeros((n_movies, k), dtype=np.float32)
+
+        matrix = tfidf_matrix.tocsr().astype(np.float32)
+
+        if ann is not None:
+            chunk_size = 1024
+            for lo in range(0, n_movies, chunk_size):
+                hi = min(lo + chunk_size, n_movies)
+                results = ann.search(matrix[lo:hi], k, exclude=[np.array([i]) for i in range(lo, hi)])
+                for row, (positions, top_scores) in enumerate(results, start=lo):
+                    keep = top_scores > MIN_SIMILARITY
+                    neighbor_pos[row, :keep.sum()] = positions[keep]
+                    scores[row, :keep.sum()] = top_scores[keep]
+        else:
+            matrix_t = matrix.T.tocsc()
+            chunk_size = max(1, _CHUNK_MEMORY_BUDGET // max(n_movies * 4, 1))
+
+            for lo in range(0, n_movies, chunk_size):
+                hi = min(lo + chunk_size, n_movies)
+                block = (matrix[lo:hi] @ matrix_t).toarray()
+                block[np.arange(hi - lo), np.arange(lo, hi)] = -np.inf  # bỏ chính nó
+
+                top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(block, top, axis=1)
+                order = np.argsort(-top_scores, axis=1)
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+                keep = top_scores > MIN_SIMILARITY
+                neighbor_pos[lo:hi] = np.where(keep, top, -1)
+                scores[lo:hi] = np.where(keep, top_scores, 0.0)
+
+        genre_vocab, common_genres, same_director, common_cast = cls._reason_features(catalog, neighbor_pos)
+
+        neighbor_ids = np.where(neighbor_pos >= 0, movie_ids[np.maximum(neighbor_pos, 0)], -1)
+
+        index = cls(
+            movie_ids=movie_ids,
+            neighbor_ids=neighbor_ids,
+            scores=scores,
+            common_genres=common_genres,
+            same_director=same_director,
+            common_cast=common_cast,
+            genre_vocab=genre_vocab,
+            fingerprint=fingerprint,
+            report={}
+        )
+        index.report = {
+            "n_movies": int(n_movies),
+            "top_k": int(k),
+            "build_seconds": round(time.perf_counter() - start, 3),
+            "index_bytes": index.nbytes,
+            "chunk_size": int(chunk_size),
+            "peak_chunk_bytes": int(min(chunk_size, n_movies) * n_movies * 4) if ann is None else None,
+            "ann": ann.metadata() if ann is not None else None,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+        logger.info(f"Content neighbor index built: {index.report}")
+        return index
+
+    @staticmethod
+    def _reason_features(catalog: MovieCatalog, neighbor_pos: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Tính reason features cho mỗi cặp (movie, neighbor) từ các cột của catalog
+
+        - common_genres: bitmask theo genre_vocab
+        - same_director: cùng đạo diễn
+        - common_cast: bitmask theo vị trí star1..star4 của movie nguồn
+        """
+        genre_vocab = catalog.genre_vocab[:_MAX_GENRES]
+        n_movies = len(catalog)
+
+        genre_rows = np.repeat(np.arange(n_movies), np.diff(catalog.genre_indptr))
+        in_mask = catalog.genre_codes < _MAX_GENRES
+        genre_masks = np.zeros(n_movies, dtype=np.uint64)
+        np.bitwise_or.at(
+            genre_masks,
+            genre_rows[in_mask],
+            np.left_shift(np.uint64(1), catalog.genre_codes[in_mask].astype(np.uint64))
+        )
+
+        # Director/cast đã được intern thành int codes (-1 = không có)
+        directors = catalog.director.astype(np.int64)
+        stars = catalog.stars.astype(np.int64)
+
+        common_genres = np.zeros(neighbor_pos.shape, dtype=np.uint64)
+        same_director = np.zeros(neighbor_pos.shape, dtype=bool)
+        common_cast = np.zeros(neighbor_pos.shape, dtype=np.uint8)
+
+        # Theo chunk rows như lúc build neighbors: stars của neighbors là (rows, k, 4) int64
+        k = max(neighbor_pos.shape[1], 1)
+        chunk_size = max(1, _CHUNK_MEMORY_BUDGET // (k * len(STAR_ATTRS) * 8 * 2))
+        for lo in range(0, n_movies, chunk_size):
+            hi = min(lo + chunk_size, n_movies)
+            valid = neighbor_pos[lo:hi] >= 0
+            nbr = np.maximum(neighbor_pos[lo:hi], 0)
+
+            common_genres[lo:hi] = np.where(valid, genre_masks[lo:hi, None] & genre_masks[nbr], np.uint64(0))
+
+            source_director = directors[lo:hi, None]
+            same_director[lo:hi] = valid & (source_director == directors[nbr]) & (source_director >= 0)
+
+            neighbor_stars = stars[nbr]  # (rows, k, 4)
+            for slot in range(len(STAR_ATTRS)):
+                source_star = stars[lo:hi, slot][:, None, None]
+                shared = (neighbor_stars == source_star).any(axis=2) & (source_star[:, :, 0] >= 0) & valid
+                common_cast[lo:hi] |= (shared.astype(np.uint8) << slot)
+
+        return genre_vocab, common_genres, same_director, common_cast
+
+    def lookup(self, movie_id: int, limit: int) -> List[Tuple[int, float, int, bool, List[int]]]:
+        """
+        O(K) lookup neighbors của một movie
+
+        Returns:
+            List of (neighbor_id, score, common_genre_mask, same_director, common_cast_slots),
+            bit i của common_genre_mask là genre_vocab[i]
+        """
+        pos = int(np.searchsorted(self.movie_ids, movie_id))
+        if pos >= len(self.movie_ids) or self.movie_ids[pos] != movie_id:
+            return []
+
+        results = []
+        for j in range(self.top_k):
+            neighbor_id = int(self.neighbor_ids[pos, j])
+            if neighbor_id < 0 or len(results) >= limit:
+                break
+            cast_mask = int(self.common_cast[pos, j])
+            cast_slots = [slot for slot in range(len(STAR_ATTRS)) if cast_mask >> slot & 1]
+            results.append((
+                neighbor_id,
+                float(self.scores[pos, j]),
+                int(self.common_genres[pos, j]),
+                bool(self.same_director[pos, j]),
+                cast_slots
+            ))
+        return results
+
+    def save(self, path: str):
+        """
+        Lưu index thành một file neighbors.npz (arrays + meta JSON)
+
+        Ghi vào file tạm riêng của lần lưu rồi rename atomic, nên các workers lưu
+        cùng lúc không ghi đè file tạm của nhau và reader không thấy arrays / meta lệch nhau.
+        """
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        meta = json.dumps({
+            "fingerprint": self.fingerprint,
+            "genre_vocab": self.genre_vocab,
+            "report": self.report
+        })
+        fd, tmp_path = tempfile.mkstemp(prefix=".neighbors-", suffix=".npz", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, meta=np.array(meta), **{name: getattr(self, name) for name in self.ARRAY_FIELDS})
+            os.replace(tmp_path, directory / INDEX_FILE)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ContentNeighborIndex"]:
+        """Load index từ disk, None nếu chưa có hoặc bị lỗi"""
+        directory = Path(path)
+        try:
+            with np.load(directory / INDEX_FILE) as data:
+                meta = json.loads(str(data["meta"]))
+                arrays = {name: data[name] for name in cls.ARRAY_FIELDS}
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Failed to load content neighbor index: {e}")
+            return None
+
+        return cls(
+            genre_vocab=meta["genre_vocab"],
+            fingerprint=meta["fingerprint"],
+            report=meta.get("report", {}),
+            **arrays
+        )
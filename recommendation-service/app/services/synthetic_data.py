@@ -0,0 +1,310 @@
+"""
+Synthetic dataset quy mô lớn cho load test / capacity test
+
+Dữ liệu được sinh theo block (USERS_PER_BLOCK users, MOVIES_PER_BLOCK movies),
+mỗi block có RNG riêng tạo từ (seed, block index): cùng seed và tham số luôn cho
+cùng dataset, không phụ thuộc cách caller ghi (batch size, driver) và không cần
+giữ toàn bộ dataset trong memory.
+
+Skew giống dữ liệu thật:
+- popularity theo Zipf: movie hạng r có trọng số 1 / r^zipf_exponent
+- genre affinity clusters: mỗi user thuộc một cluster (2-3 thể loại yêu thích),
+  movies thuộc các thể loại đó được chọn nhiều hơn; một phần events là "explore"
+  theo popularity chung
+- temporal bursts: mỗi movie có một thời điểm burst, một phần events của movie tập
+  trung ngay sau burst (phân phối exponential), phần còn lại rải đều trong window
+- activity của users lệch (lognormal): ít heavy users, nhiều light users
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+from app.services.behavior_ingestion import BEHAVIOR_SCORES
+from app.services.user_scores import forward_weights
+
+GENRES = [
+    'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Drama',
+    'Family', 'Fantasy', 'Film-Noir', 'History', 'Horror', 'Music', 'Musical',
+    'Mystery', 'Romance', 'Sci-Fi', 'Sport', 'Thriller', 'War', 'Western'
+]
+
+# Tần suất tương đối của thể loại chính (Drama/Comedy/Action phổ biến hơn)
+GENRE_FREQUENCY = np.array([
+    8, 5, 3, 3, 8, 6, 12, 3, 3, 1, 2, 4, 2, 1, 3, 5, 4, 2, 5, 2, 1
+], dtype=np.float64)
+
+BEHAVIOR_NAMES = ('view', 'book', 'rate')
+BEHAVIOR_PROBABILITIES = (0.5, 0.3, 0.2)
+BEHAVIOR_SCORE_ARRAY = np.array([BEHAVIOR_SCORES[name] for name in BEHAVIOR_NAMES])
+
+# Kích thước block cố định: thuộc về định nghĩa dataset (đổi = dataset khác)
+USERS_PER_BLOCK = 1000
+MOVIES_PER_BLOCK = 10000
+
+# Số từ vựng mỗi thể loại cho overview (TF-IDF cần overlap giữa các movies)
+WORDS_PER_GENRE = 40
+
+# Stream ids cho RNG của từng phần dataset
+_MOVIE_STREAM = 1
+_USER_STREAM = 2
+_STRUCTURE_STREAM = 3
+
+
+class BehaviorBlock(NamedTuple):
+    """Behaviors của một block users, dạng cột (sorted theo user, thời gian)"""
+    user_ids: np.ndarray        # int64
+    movie_ids: np.ndarray       # int64
+    behavior_codes: np.ndarray  # int8, index vào BEHAVIOR_NAMES
+    scores: np.ndarray          # float64
+    created_at: np.ndarray      # float64, Unix seconds (UTC)
+
+
+class ScoreBlock(NamedTuple):
+    """Các rows user_movie_scores tương ứng với một BehaviorBlock"""
+    user_ids: np.ndarray
+    movie_ids: np.ndarray
+    scores: np.ndarray          # forward-decayed (xem user_scores)
+    interaction_counts: np.ndarray
+    last_interaction_at: np.ndarray
+
+
+class SyntheticDataset:
+    """Định nghĩa một dataset: tham số + seed, các block được sinh lazily"""
+
+    def __init__(
+        self,
+        n_movies: int,
+        n_users: int,
+        behaviors_per_user: float = 30.0,
+        n_clusters: int = 12,
+        zipf_exponent: float = 1.0,
+        genre_affinity: float = 8.0,
+        explore_fraction: float = 0.2,
+        burst_fraction: float = 0.4,
+        burst_days: float = 7.0,
+        days: int = 365,
+        end: Optional[datetime] = None,
+        seed: int = 42
+    ):
+        """
+        Args:
+            n_movies: số movies trong catalog (ids 1..n_movies)
+            n_users: số users (ids 1..n_users)
+            behaviors_per_user: số behaviors trung bình mỗi user
+            n_clusters: số genre affinity clusters
+            zipf_exponent: độ lệch popularity (0 = đều, lớn hơn = lệch hơn)
+            genre_affinity: hệ số tăng xác suất cho movies thuộc thể loại của cluster
+            explore_fraction: tỷ lệ events chọn theo popularity chung
+            burst_fraction: tỷ lệ events rơi vào burst của movie
+            burst_days: độ dài trung bình (ngày) của một burst
+            days: độ dài window thời gian
+            end: cuối window (default: 00:00 UTC hôm nay - truyền cố định để dataset lặp lại được)
+            seed: random seed
+        """
+        if n_movies <= 0 or n_users <= 0:
+            raise ValueError("n_movies và n_users phải dương")
+        self.n_movies = n_movies
+        self.n_users = n_users
+        self.behaviors_per_user = behaviors_per_user
+        self.n_clusters = n_clusters
+        self.zipf_exponent = zipf_exponent
+        self.genre_affinity = genre_affinity
+        self.explore_fraction = explore_fraction
+        self.burst_fraction = burst_fraction
+        self.burst_seconds = burst_days * 86400.0
+        if end is None:
+            end = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        elif end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        self.end = end
+        self.start = end - timedelta(days=days)
+        self.seed = seed
+
+        self._build_structure()
+
+    def _rng(self, stream: int, block: int = 0) -> np.random.Generator:
+        return np.random.default_rng([self.seed, stream, block])
+
+    def _build_structure(self):
+        """
+        Phần dùng chung cho mọi block: thể loại, popularity, burst của movies,
+        clusters và bảng CDF để sample movies cho từng cluster
+        """
+        rng = self._rng(_STRUCTURE_STREAM)
+        n = self.n_movies
+
+        # Thể loại: primary theo GENRE_FREQUENCY, thêm 0-2 thể loại phụ
+        self.primary_genre = rng.choice(len(GENRES), size=n, p=GENRE_FREQUENCY / GENRE_FREQUENCY.sum())
+        self.genre_mask = np.zeros((n, len(GENRES)), dtype=bool)
+        self.genre_mask[np.arange(n), self.primary_genre] = True
+        extra = rng.integers(0, 3, size=n)
+        for k in range(1, 3):
+            has_extra = extra >= k
+            self.genre_mask[np.flatnonzero(has_extra), rng.integers(0, len(GENRES), size=int(has_extra.sum()))] = True
+
+        # Zipf popularity theo một thứ hạng ngẫu nhiên
+        self.popularity_rank = rng.permutation(n)
+        self.popularity = 1.0 / (self.popularity_rank + 1.0) ** self.zipf_exponent
+
+        # Thời điểm burst của mỗi movie (phát hành / trending), Unix seconds
+        start_ts, end_ts = self.start.timestamp(), self.end.timestamp()
+        self.burst_at = rng.uniform(start_ts, end_ts, size=n)
+
+        # Clusters: 2-3 thể loại yêu thích, kích thước clusters lệch
+        self.cluster_genres: List[np.ndarray] = [
+            rng.choice(len(GENRES), size=int(rng.integers(2, 4)), replace=False,
+                       p=GENRE_FREQUENCY / GENRE_FREQUENCY.sum())
+            for _ in range(self.n_clusters)
+        ]
+        cluster_sizes = rng.dirichlet(np.full(self.n_clusters, 2.0))
+        self.cluster_probabilities = cluster_sizes / cluster_sizes.sum()
+
+        # CDF cho sample movies: một row mỗi cluster + row cuối là popularity chung
+        self._cdf = np.empty((self.n_clusters + 1, n), dtype=np.float64)
+        for c, genres in enumerate(self.cluster_genres):
+            in_cluster = self.genre_mask[:, genres].any(axis=1)
+            np.cumsum(self.popularity * (1.0 + self.genre_affinity * in_cluster), out=self._cdf[c])
+        np.cumsum(self.popularity, out=self._cdf[-1])
+
+    @property
+    def n_user_blocks(self) -> int:
+        return (self.n_users + USERS_PER_BLOCK - 1) // USERS_PER_BLOCK
+
+    @property
+    def n_movie_blocks(self) -> int:
+        return (self.n_movies + MOVIES_PER_BLOCK - 1) // MOVIES_PER_BLOCK
+
+    def movie_blocks(self) -> Iterator[List[Dict]]:
+        """Movies theo block, mỗi movie một dict theo columns của bảng movies"""
+        genre_words = [
+            np.array([f"{genre.lower()}_{i}" for i in range(WORDS_PER_GENRE)]) for genre in GENRES
+        ]
+        max_votes = 2_500_000
+
+        for block in range(self.n_movie_blocks):
+            rng = self._rng(_MOVIE_STREAM, block)
+            lo = block * MOVIES_PER_BLOCK
+            hi = min(self.n_movies, lo + MOVIES_PER_BLOCK)
+            size = hi - lo
+
+            votes = np.maximum(
+                10, (max_votes * self.popularity[lo:hi] * rng.lognormal(0.0, 0.3, size=size)).astype(np.int64)
+            )
+            # Rating tương quan nhẹ với popularity
+            ratings = np.clip(
+                5.5 + 0.25 * np.log10(votes) + rng.normal(0.0, 0.6, size=size), 1.0, 9.8
+            ).round(1)
+            meta_scores = np.clip(ratings * 10 + rng.normal(0.0, 8.0, size=size), 1, 100).astype(int)
+            years = np.clip(2025 - rng.exponential(15.0, size=size).astype(int), 1920, 2025)
+            n_directors = max(1, self.n_movies // 5)
+            n_stars = max(4, self.n_movies // 2)
+            directors = rng.integers(0, n_directors, size=size)
+            stars = rng.integers(0, n_stars, size=(size, 4))
+            word_ids = rng.integers(0, WORDS_PER_GENRE, size=(size, 12))
+
+            rows = []
+            for i in range(size):
+                index = lo + i
+                genres = [GENRES[g] for g in np.flatnonzero(self.genre_mask[index])]
+                # Thể loại chính đứng đầu (content-based dùng cả danh sách)
+                primary = GENRES[self.primary_genre[index]]
+                genres.remove(primary)
+                rows.append({
+                    'id': index + 1,
+                    'series_title': f"Synthetic Movie {index + 1}",
+                    'released_year': str(int(years[i])),
+                    'genre': ', '.join([primary] + genres),
+                    'imdb_rating': float(ratings[i]),
+                    'meta_score': int(meta_scores[i]),
+                    'director': f"Director {directors[i]}",
+                    'overview': ' '.join(genre_words[self.primary_genre[index]][word_ids[i]]),
+                    'star1': f"Star {stars[i, 0]}",
+                    'star2': f"Star {stars[i, 1]}",
+                    'star3': f"Star {stars[i, 2]}",
+                    'star4': f"Star {stars[i, 3]}",
+                    'no_of_votes': int(votes[i])
+                })
+            yield rows
+
+    def behavior_block(self, block: int) -> BehaviorBlock:
+        """Behaviors của users trong block (deterministic theo seed + block)"""
+        rng = self._rng(_USER_STREAM, block)
+        first_user = block * USERS_PER_BLOCK + 1
+        last_user = min(self.n_users, first_user + USERS_PER_BLOCK - 1)
+        user_ids = np.arange(first_user, last_user + 1, dtype=np.int64)
+        n = len(user_ids)
+
+        clusters = rng.choice(self.n_clusters, size=n, p=self.cluster_probabilities)
+        # Activity lệch: lognormal với mean = behaviors_per_user
+        sigma = 1.0
+        activity = rng.lognormal(np.log(self.behaviors_per_user) - sigma ** 2 / 2, sigma, size=n)
+        counts = np.maximum(1, rng.poisson(activity))
+        total = int(counts.sum())
+
+        event_users = np.repeat(user_ids, counts)
+        tables = np.repeat(clusters, counts)
+        tables[rng.random(total) < self.explore_fraction] = self.n_clusters
+
+        # Inverse-CDF sampling theo bảng của từng cluster
+        draws = rng.random(total)
+        movie_index = np.empty(total, dtype=np.int64)
+        for table in np.unique(tables):
+            mask = tables == table
+            cdf = self._cdf[table]
+            movie_index[mask] = np.searchsorted(cdf, draws[mask] * cdf[-1], side='right')
+        np.minimum(movie_index, self.n_movies - 1, out=movie_index)
+
+        codes = rng.choice(len(BEHAVIOR_NAMES), size=total, p=BEHAVIOR_PROBABILITIES).astype(np.int8)
+
+        # Timestamps: burst sau burst_at của movie, còn lại rải đều trong window
+        start_ts, end_ts = self.start.timestamp(), self.end.timestamp()
+        created_at = rng.uniform(start_ts, end_ts, size=total)
+        in_burst = rng.random(total) < self.burst_fraction
+        burst_times = self.burst_at[movie_index] + rng.exponential(self.burst_seconds, size=total)
+        in_burst &= burst_times < end_ts
+        created_at[in_burst] = burst_times[in_burst]
+
+        order = np.lexsort((created_at, event_users))
+        return BehaviorBlock(
+            user_ids=event_users[order],
+            movie_ids=movie_index[order] + 1,
+            behavior_codes=codes[order],
+            scores=BEHAVIOR_SCORE_ARRAY[codes[order]],
+            created_at=created_at[order]
+        )
+
+    def behavior_blocks(self) -> Iterator[BehaviorBlock]:
+        for block in range(self.n_user_blocks):
+            yield self.behavior_block(block)
+
+
+def aggregate_block(block: BehaviorBlock, n_movies: int) -> ScoreBlock:
+    """
+    Gom một BehaviorBlock theo (user, movie) giống aggregate_behaviors, vectorized
+
+    Mỗi user chỉ nằm trong một block nên các ScoreBlock không trùng cặp với nhau.
+    """
+    keys = block.user_ids * (n_movies + 1) + block.movie_ids
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    weighted = block.scores * forward_weights(block.created_at)
+    last_at = np.full(len(unique_keys), -np.inf)
+    np.maximum.at(last_at, inverse, block.created_at)
+    return ScoreBlock(
+        user_ids=unique_keys // (n_movies + 1),
+        movie_ids=unique_keys % (n_movies + 1),
+        scores=np.bincount(inverse, weights=weighted, minlength=len(unique_keys)),
+        interaction_counts=np.bincount(inverse, minlength=len(unique_keys)),
+        last_interaction_at=last_at
+    )
+
+
+def to_datetimes(epoch_seconds: np.ndarray) -> List[datetime]:
+    """Unix seconds -> naive UTC datetimes (quy ước của user_scores cho SQLite)"""
+    return np.asarray(epoch_seconds * 1e6, dtype=np.int64).astype('datetime64[us]').tolist()
+
+
+def to_iso_strings(epoch_seconds: np.ndarray) -> np.ndarray:
+    """Unix seconds -> ISO 8601 UTC strings cho COPY"""
+    values = np.asarray(epoch_seconds * 1e6, dtype=np.int64).astype('datetime64[us]')
+    return np.char.add(np.datetime_as_string(values, unit='us'), '+00:00')
@@ -0,0 +1,294 @@
+"""
+Background training jobs cho collaborative filtering
+
+Training chạy trong một process riêng (spawn) để không chặn event loop và không
+động vào model đang serve. Khi job xong, worker build một service instance mới
+từ model đã lưu và swap vào get_cf_service() một cách atomic.
+
+Mỗi lúc chỉ có một job trên cả host: submit() kiểm tra các job files trong JOBS_DIR
+(của mọi workers) dưới file lock trước khi start process mới.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.services.collaborative_service import (
+    CF_SERVICE_CONFIG,
+    create_cf_service,
+    swap_cf_service
+)
+from app.services.model_store import file_lock
+
+logger = logging.getLogger(__name__)
+
+# Thư mục lưu trạng thái job (để worker khác cũng đọc được)
+JOBS_DIR = Path(CF_SERVICE_CONFIG["model_path"]).parent / "jobs"
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _run_training_job(engine: str, progress_queue):
+    """
+    Entry point của training process
+
+    Tạo DB session và service instance riêng trong process con (không load model
+    hiện tại), train và lưu model ra disk, gửi tiến trình về process cha qua queue.
+    Job chỉ "completed" khi version mới đã được lưu.
+    """
+    from app.database import SessionLocal
+
+    def report_progress(iteration: int, n_iterations: int, rmse: float):
+        progress_queue.put(("progress", {
+            "iteration": iteration + 1,
+            "n_iterations": n_iterations,
+            "rmse": rmse
+        }))
+
+    db = SessionLocal()
+    try:
+        progress_queue.put(("running", {}))
+        service = create_cf_service(load_model=False)
+        result = service.train(
+            db, verbose=True, engine=engine, progress_callback=report_progress, save=False
+        )
+        result["model_version"] = service.save_model()
+        progress_queue.put(("completed", {k: _to_builtin(v) for k, v in result.items()}))
+    except Exception as e:
+        progress_queue.put(("failed", {"error": str(e)}))
+    finally:
+        db.close()
+
+
+def _to_builtin(value):
+    """Convert numpy scalars sang kiểu Python để serialize"""
+    return value.item() if hasattr(value, "item") else value
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TrainingJobManager:
+    """Quản lý training jobs chạy trong process riêng"""
+
+    def __init__(self, jobs_dir: Path = JOBS_DIR):
+        self.jobs_dir = Path(jobs_dir)
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context("spawn")
+
+    def _active_job_on_host(self) -> Optional[Dict]:
+        """
+        Job đang queued/running của bất kỳ worker nào (đọc từ job files)
+
+        Job file có status active nhưng training process đã chết (worker bị kill giữa
+        chừng) không chặn job mới.
+        """
+        if not self.jobs_dir.exists():
+            return None
+        for path in self.jobs_dir.glob("*.json"):
+            try:
+                with open(path) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job.get("status") in ACTIVE_STATUSES and _pid_alive(job.get("pid")):
+                return job
+        return None
+
+    def submit(self, engine: str) -> Dict:
+        """
+        Tạo training job mới
+
+        Raises:
+            RuntimeError: nếu đã có job đang chạy (ở worker bất kỳ trên host)
+        """
+        # File lock giữ tới khi job mới đã có pid trong job file, để submit song song ở
+        # worker khác thấy job này
+        with file_lock(self.jobs_dir):
+            return self._submit_locked(engine)
+
+    def _submit_locked(self, engine: str) -> Dict:
+        with self._lock:
+            active = [job for job in self._jobs.values() if job["status"] in ACTIVE_STATUSES]
+        active = active[0] if active else self._active_job_on_host()
+        if active:
+            raise RuntimeError(f"Training job {active['job_id']} đang chạy")
+
+        with self._lock:
+            job_id = uuid.uuid4().hex
+            job = {
+                "job_id": job_id,
+                "engine": engine,
+                "status": "queued",
+                "progress": 0.0,
+                "iteration": 0,
+                "n_iterations": None,
+                "rmse": None,
+                "result": None,
+                "error": None,
+                "created_at": datetime.now().isoformat(),
+                "started_at": None,
+                "finished_at": None,
+                "pid": None
+            }
+            self._jobs[job_id] = job
+
+        progress_queue = self._context.Queue()
+        process = self._context.Process(
+            target=_run_training_job,
+            args=(engine, progress_queue),
+            daemon=True
+        )
+        process.start()
+        self._update(job_id, pid=process.pid)
+
+        watcher = threading.Thread(
+            target=self._watch,
+            args=(job_id, process, progress_queue),
+            name=f"training-job-{job_id[:8]}",
+            daemon=True
+        )
+        watcher.start()
+
+        logger.info(f"Started training job {job_id} (engine={engine}, pid={process.pid})")
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Lấy trạng thái job (từ memory, hoặc từ file nếu job do worker khác tạo)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+
+        path = self.jobs_dir / f"{job_id}.json"
+        if path.exists():
+            with open(path) as f:
+                return json.load(f)
+        return None
+
+    def list(self) -> List[Dict]:
+        """Danh sách jobs của worker hiện tại, mới nhất trước"""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            snapshot = dict(job)
+        self._persist(snapshot)
+
+    def _persist(self, job: Dict):
+        try:
+            self.jobs_dir.mkdir(parents=True, exist_ok=True)
+            path = self.jobs_dir / f"{job['job_id']}.json"
+            tmp_path = path.with_suffix(".json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(job, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to persist training job status: {e}")
+
+    def _watch(self, job_id: str, process, progress_queue):
+        """
+        Đọc tiến trình từ process con; khi xong thì build model mới và hot-swap
+        """
+        while True:
+            try:
+                event, payload = progress_queue.get(timeout=1.0)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                # Process con đã thoát: message cuối (vd. "completed") có thể được gửi
+                # ngay trước khi thoát, đọc nốt queue trước khi coi là lỗi
+                try:
+                    event, payload = progress_queue.get_nowait()
+                except queue.Empty:
+                    self._update(
+                        job_id,
+                        status="failed",
+                        error=f"Training process exited with code {process.exitcode}",
+                        finished_at=datetime.now().isoformat()
+                    )
+                    return
+
+            if event == "running":
+                self._update(job_id, status="running", started_at=datetime.now().isoformat())
+            elif event == "progress":
+                self._update(
+                    job_id,
+                    iteration=payload["iteration"],
+                    n_iterations=payload["n_iterations"],
+                    rmse=payload["rmse"],
+                    progress=round(payload["iteration"] / payload["n_iterations"], 4)
+                )
+            elif event == "completed":
+                try:
+                    # Build instance mới hoàn chỉnh từ model vừa lưu rồi mới swap
+                    service = create_cf_service()
+                    if service.model_version == payload["model_version"]:
+                        swap_cf_service(service)
+                        logger.info(f"Training job {job_id} completed, model swapped")
+                    else:
+                        # Worker khác đã save/rollback sau job này: model đã lưu thành công,
+                        # chỉ không swap để không ghi đè CURRENT mới hơn
+                        logger.info(
+                            f"Training job {job_id} saved version {payload['model_version']}, "
+                            f"CURRENT is now {service.model_version}; not swapping"
+                        )
+                    self._update(
+                        job_id,
+                        status="completed",
+                        progress=1.0,
+                        result=payload,
+                        finished_at=datetime.now().isoformat()
+                    )
+                except Exception as e:
+                    self._update(
+                        job_id,
+                        status="failed",
+                        error=f"Failed to load trained model: {e}",
+                        finished_at=datetime.now().isoformat()
+                    )
+                break
+            elif event == "failed":
+                self._update(
+                    job_id,
+                    status="failed",
+                    error=payload["error"],
+                    finished_at=datetime.now().isoformat()
+                )
+                break
+
+        process.join(timeout=5)
+
+
+# Singleton instance
+_job_manager = None
+
+
+def get_training_job_manager() -> TrainingJobManager:
+    """
+    Get or create training job manager instance
+    """
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = TrainingJobManager()
+    return _job_manager
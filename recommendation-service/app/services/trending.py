@@ -0,0 +1,442 @@
+"""
+Trending: counter decay theo thời gian cho mỗi movie, cập nhật khi behaviors được ingest
+
+- Forward decay giống user_movie_scores: mỗi event cộng
+  weight * 2^((t - epoch) / half_life) vào counter của movie, không cần decay lại
+  toàn bộ counters theo thời gian. Giá trị tại now = stored * 2^(-(now - epoch) / half_life),
+  cùng một hệ số cho mọi movie nên thứ hạng chỉ đổi khi có events mới.
+- Top lists (toàn bộ và theo thể loại) được tính lại lazy khi có events mới, tối đa
+  một lần mỗi TRENDING_REFRESH_SECONDS; /trending đọc O(K) từ top lists, không scan
+  user_behaviors.
+- Snapshot (TRENDING_SNAPSHOT_PATH) dùng chung giữa các workers: mỗi
+  TRENDING_SYNC_SECONDS worker cộng các increments chưa ghi của mình vào file (có
+  file lock; counters cộng được nhờ forward decay) rồi đọc lại tổng của mọi workers.
+  Worker restart load lại snapshot; chưa có snapshot thì bootstrap một lần từ
+  user_behaviors gần đây.
+- Timestamps trong tương lai được clamp về now trước khi tính weight, và values không
+  hữu hạn (snapshot lỗi) bị bỏ khi đọc/ghi snapshot, để một event lỗi không làm
+  counter thành inf và chiếm top lists.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.user_behavior import UserBehavior
+from app.services.catalog import MovieRecord, catalog_fingerprint, get_movie_catalog
+from app.services.model_store import file_lock
+
+logger = logging.getLogger(__name__)
+
+# Trọng số mỗi loại behavior (behavior khác: 1.0)
+BEHAVIOR_WEIGHTS = {
+    'view': 1.0,
+    'book': 3.0,
+    'rate': 2.0,
+}
+
+# Bootstrap từ user_behaviors trong số half-lives gần nhất (events cũ hơn gần như bằng 0)
+BOOTSTRAP_HALF_LIVES = 10
+
+# Dời epoch khi stored values đã tăng quá 2^REBASE_HALF_LIVES (tránh overflow)
+REBASE_HALF_LIVES = 32
+
+# Counters có giá trị hiện tại nhỏ hơn ngưỡng này bị bỏ khi sync
+MIN_SCORE = 1e-3
+
+
+def _timestamp(created_at: Optional[datetime]) -> float:
+    if created_at is None:
+        return time.time()
+    if created_at.tzinfo is None:
+        # Naive timestamps (SQLite, seed.py) được coi là UTC
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+
+def _remap(ids: np.ndarray, values: np.ndarray, target_ids: np.ndarray) -> np.ndarray:
+    """values theo ids (sorted) -> theo target_ids (sorted, chứa ids)"""
+    result = np.zeros(len(target_ids))
+    if len(ids):
+        result[np.searchsorted(target_ids, ids)] = values
+    return result
+
+
+class _TopLists:
+    """Top movies (catalog positions + stored values) của một lần refresh, immutable"""
+
+    def __init__(self, catalog, overall: Tuple[np.ndarray, np.ndarray], by_genre: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        self.catalog = catalog
+        self.fingerprint = catalog.fingerprint
+        self.overall = overall
+        self.by_genre = by_genre
+        self.built_at = time.time()
+
+
+class TrendingCounters:
+    """Counters decay theo thời gian của các movies (thread-safe)"""
+
+    def __init__(
+        self,
+        half_life_hours: float = 72.0,
+        snapshot_path: Optional[str] = None,
+        sync_seconds: float = 30.0,
+        refresh_seconds: float = 5.0,
+        depth: int = 200
+    ):
+        self.half_life = half_life_hours * 3600.0
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.sync_seconds = sync_seconds
+        self.refresh_seconds = refresh_seconds
+        self.depth = depth
+
+        self.epoch = time.time()
+        # Cùng index: movie_ids (sorted), base (tổng trong snapshot), pending (chưa ghi)
+        self.movie_ids = np.empty(0, dtype=np.int64)
+        self.base = np.empty(0)
+        self.pending = np.empty(0)
+
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._top: Optional[_TopLists] = None
+        self._dirty = True
+        self._checked_at = 0.0
+        self._synced_at = time.monotonic()
+        self._initialized = False
+        self.counters = {"events": 0, "syncs": 0, "refreshes": 0}
+
+    # --- Cập nhật ---
+
+    def add(self, events: Iterable):
+        """
+        Cộng các behavior events (user_id, movie_id, behavior, score, created_at) vào counters
+        """
+        events = list(events)
+        if not events:
+            return
+        movie_ids = np.fromiter((e.movie_id for e in events), dtype=np.int64, count=len(events))
+        timestamps = np.fromiter((_timestamp(e.created_at) for e in events), dtype=np.float64, count=len(events))
+        weights = np.fromiter((BEHAVIOR_WEIGHTS.get(e.behavior, 1.0) for e in events), dtype=np.float64, count=len(events))
+        self._add_arrays(movie_ids, timestamps, weights)
+
+    def _add_arrays(self, movie_ids: np.ndarray, timestamps: np.ndarray, weights: np.ndarray):
+        timestamps = np.minimum(timestamps, time.time())
+        unique_ids, inverse = np.unique(movie_ids, return_inverse=True)
+        with self._lock:
+            values = np.bincount(inverse, weights=weights * np.exp2((timestamps - self.epoch) / self.half_life))
+            self._ensure_ids_locked(unique_ids)
+            self.pending[np.searchsorted(self.movie_ids, unique_ids)] += values
+            self._dirty = True
+            self.counters["events"] += len(movie_ids)
+
+    def _ensure_ids_locked(self, ids: np.ndarray):
+        missing = np.setdiff1d(ids, self.movie_ids, assume_unique=True)
+        if not len(missing):
+            return
+        merged = np.union1d(self.movie_ids, missing)
+        self.base = _remap(self.movie_ids, self.base, merged)
+        self.pending = _remap(self.movie_ids, self.pending, merged)
+        self.movie_ids = merged
+
+    def decay_factor(self, now: Optional[float] = None) -> float:
+        """Hệ số đổi stored values thành giá trị tại now"""
+        return float(np.exp2(-((now or time.time()) - self.epoch) / self.half_life))
+
+    def scores(self, movie_ids: np.ndarray) -> np.ndarray:
+        """Giá trị hiện tại của các movies (0 nếu không có counter), O(n log n_counters)"""
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        result = np.zeros(len(movie_ids))
+        with self._lock:
+            ids, base, pending, factor = self.movie_ids, self.base, self.pending, self.decay_factor()
+        if len(ids) and len(movie_ids):
+            pos = np.minimum(np.searchsorted(ids, movie_ids), len(ids) - 1)
+            found = ids[pos] == movie_ids
+            pos = pos[found]
+            result[found] = (base[pos] + pending[pos]) * factor
+        return result
+
+    # --- Snapshot dùng chung giữa workers ---
+
+    def _read_snapshot(self) -> Optional[Tuple[float, np.ndarray, np.ndarray]]:
+        if self.snapshot_path is None or not self.snapshot_path.exists():
+            return None
+        with np.load(self.snapshot_path) as data:
+            if float(data["half_life"]) != self.half_life:
+                # Values lưu theo half-life khác không cộng được, bootstrap lại
+                logger.warning("Trending snapshot has a different half-life, ignoring it")
+                return None
+            epoch = float(data["epoch"])
+            if not np.isfinite(epoch):
+                logger.warning("Trending snapshot has an invalid epoch, ignoring it")
+                return None
+            movie_ids, values = data["movie_ids"].astype(np.int64), data["values"].astype(np.float64)
+            finite = np.isfinite(values)
+            return epoch, movie_ids[finite], values[finite]
+
+    def _write_snapshot(self, epoch: float, movie_ids: np.ndarray, values: np.ndarray):
+        tmp_path = self.snapshot_path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, epoch=np.float64(epoch), movie_ids=movie_ids, values=values,
+                 half_life=np.float64(self.half_life))
+        os.replace(tmp_path, self.snapshot_path)
+
+    def initialize(self, db: Session) -> str:
+        """
+        Load snapshot, hoặc bootstrap từ user_behaviors nếu chưa có (một worker làm, các
+        workers khác chờ file lock rồi load)
+
+        Returns:
+            "snapshot", "bootstrap", "memory" (không cấu hình snapshot path) hoặc
+            "initialized" (đã initialize trước đó)
+        """
+        with self._sync_lock:
+            if self._initialized:
+                return "initialized"
+            if self.snapshot_path is None:
+                self._bootstrap(db)
+                self._initialized = True
+                return "memory"
+
+            with file_lock(self.snapshot_path):
+                source = "snapshot"
+                if self._read_snapshot() is None:
+                    self._bootstrap(db)
+                    source = "bootstrap"
+                self._sync_locked()
+            self._initialized = True
+        logger.info(f"Trending counters initialized from {source}: {len(self.movie_ids)} movies")
+        return source
+
+    def _bootstrap(self, db: Session, chunk_size: int = 50000):
+        """Một lần scan user_behaviors trong BOOTSTRAP_HALF_LIVES half-lives gần nhất"""
+        cutoff = datetime.fromtimestamp(time.time() - BOOTSTRAP_HALF_LIVES * self.half_life, tz=timezone.utc)
+        query = db.query(UserBehavior.movie_id, UserBehavior.behavior, UserBehavior.created_at).filter(
+            UserBehavior.created_at >= cutoff
+        ).yield_per(chunk_size)
+
+        chunk = []
+        for row in query:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                self._add_rows(chunk)
+                chunk = []
+        self._add_rows(chunk)
+
+    def _add_rows(self, rows: List):
+        if not rows:
+            return
+        movie_ids = np.fromiter((r.movie_id for r in rows), dtype=np.int64, count=len(rows))
+        timestamps = np.fromiter((_timestamp(r.created_at) for r in rows), dtype=np.float64, count=len(rows))
+        weights = np.fromiter((BEHAVIOR_WEIGHTS.get(r.behavior, 1.0) for r in rows), dtype=np.float64, count=len(rows))
+        self._add_arrays(movie_ids, timestamps, weights)
+
+    def maybe_sync(self):
+        """
+        Sync nếu đã quá TRENDING_SYNC_SECONDS (không chờ nếu thread khác đang sync)
+
+        Trước khi initialize, events chỉ được giữ trong pending: snapshot chưa có
+        phải được bootstrap trước.
+        """
+        if (self.snapshot_path is None or not self._initialized or
+                time.monotonic() - self._synced_at < self.sync_seconds):
+            return
+        if self._sync_lock.acquire(blocking=False):
+            try:
+                with file_lock(self.snapshot_path):
+                    self._sync_locked()
+            except Exception as e:
+                logger.warning(f"Trending snapshot sync failed: {e}")
+            finally:
+                self._sync_lock.release()
+
+    def sync(self):
+        """Ghi pending increments vào snapshot và đọc lại tổng của mọi workers"""
+        if self.snapshot_path is None or not self._initialized:
+            return
+        with self._sync_lock, file_lock(self.snapshot_path):
+            self._sync_locked()
+
+    def _sync_locked(self):
+        # Lấy pending ra trước, events mới trong lúc sync vào pending mới
+        with self._lock:
+            epoch, ids, pending = self.epoch, self.movie_ids, self.pending
+            self.pending = np.zeros(len(ids))
+
+        try:
+            snapshot = self._read_snapshot()
+            now = time.time()
+            if snapshot is None:
+                target_epoch, file_ids, file_values = epoch, np.empty(0, dtype=np.int64), np.empty(0)
+            else:
+                target_epoch, file_ids, file_values = snapshot
+
+            # Đổi pending sang epoch của file rồi cộng (forward-decayed values cộng được)
+            merged_ids = np.union1d(file_ids, ids)
+            merged = (
+                _remap(file_ids, file_values, merged_ids) +
+                _remap(ids, pending * np.exp2((epoch - target_epoch) / self.half_life), merged_ids)
+            )
+
+            if now - target_epoch > REBASE_HALF_LIVES * self.half_life:
+                merged *= np.exp2(-(now - target_epoch) / self.half_life)
+                target_epoch = now
+
+            keep = np.isfinite(merged) & (merged * np.exp2(-(now - target_epoch) / self.half_life) >= MIN_SCORE)
+            merged_ids, merged = merged_ids[keep], merged[keep]
+            self._write_snapshot(target_epoch, merged_ids, merged)
+        except Exception:
+            # Trả pending lại để lần sync sau ghi
+            with self._lock:
+                self._ensure_ids_locked(ids)
+                self.pending[np.searchsorted(self.movie_ids, ids)] += pending
+            raise
+
+        with self._lock:
+            # Pending mới (nhận trong lúc sync) đổi sang epoch mới
+            new_pending_ids, new_pending = self.movie_ids, self.pending
+            scale = np.exp2((self.epoch - target_epoch) / self.half_life)
+            all_ids = np.union1d(merged_ids, new_pending_ids[new_pending != 0])
+            self.base = _remap(merged_ids, merged, all_ids)
+            self.pending = _remap(new_pending_ids[new_pending != 0], new_pending[new_pending != 0] * scale, all_ids)
+            self.movie_ids = all_ids
+            self.epoch = target_epoch
+            self._dirty = True
+        self._synced_at = time.monotonic()
+        self.counters["syncs"] += 1
+
+    # --- Đọc ---
+
+    def _build_top_lists(self, db: Session) -> _TopLists:
+        with self._lock:
+            ids, totals = self.movie_ids, self.base + self.pending
+            self._dirty = False
+        catalog = get_movie_catalog(db)
+
+        # Counter index của mỗi catalog position (-1: movie chưa có events)
+        positions = catalog.positions(ids)
+        in_catalog = (positions >= 0) & (totals > 0)
+        counter_of_pos = np.full(len(catalog), -1, dtype=np.int64)
+        counter_of_pos[positions[in_catalog]] = np.flatnonzero(in_catalog)
+
+        def top(counter_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            k = min(self.depth, len(counter_indices))
+            if k == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0)
+            values = totals[counter_indices]
+            order = np.argpartition(-values, k - 1)[:k]
+            order = order[np.argsort(-values[order], kind="stable")]
+            chosen = counter_indices[order]
+            return positions[chosen], totals[chosen]
+
+        overall = top(np.flatnonzero(in_catalog))
+        by_genre = {}
+        for code, genre in enumerate(catalog.genre_vocab):
+            counters = counter_of_pos[catalog.movies_with_genre(code)]
+            by_genre[genre.lower()] = top(counters[counters >= 0])
+
+        self.counters["refreshes"] += 1
+        return _TopLists(catalog, overall, by_genre)
+
+    def _get_top_lists(self, db: Session) -> _TopLists:
+        if not self._initialized:
+            self.initialize(db)
+        self.maybe_sync()
+
+        if self._top is None:
+            with self._refresh_lock:
+                if self._top is None:
+                    self._top = self._build_top_lists(db)
+                    self._checked_at = time.monotonic()
+        elif time.monotonic() - self._checked_at > self.refresh_seconds:
+            # Một thread refresh, các request khác tiếp tục dùng top lists hiện tại
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    self._checked_at = time.monotonic()
+                    if self._dirty or catalog_fingerprint(db) != self._top.fingerprint:
+                        self._top = self._build_top_lists(db)
+                finally:
+                    self._refresh_lock.release()
+        return self._top
+
+    def top(self, db: Session, limit: int, genre: Optional[str] = None) -> List[Tuple[MovieRecord, float]]:
+        """
+        Top trending movies (toàn bộ hoặc của một thể loại, match giống leaderboards.by_genre)
+
+        Returns:
+            [(movie, trending score tại thời điểm hiện tại), ...]
+        """
+        top_lists = self._get_top_lists(db)
+        if genre is None:
+            positions, values = top_lists.overall
+        else:
+            key = genre.strip().lower()
+            matched = [top_lists.by_genre[key]] if key in top_lists.by_genre else [
+                top_lists.by_genre[g] for g in top_lists.by_genre if key in g
+            ]
+            if not matched:
+                return []
+            positions = np.concatenate([p for p, _ in matched])
+            values = np.concatenate([v for _, v in matched])
+            positions, first = np.unique(positions, return_index=True)
+            values = values[first]
+            order = np.argsort(-values, kind="stable")
+            positions, values = positions[order], values[order]
+
+        factor = self.decay_factor()
+        return [
+            (top_lists.catalog.record(pos), float(value * factor))
+            for pos, value in zip(positions[:limit], values[:limit])
+        ]
+
+    def stats(self) -> Dict:
+        top_lists = self._top
+        return {
+            "initialized": self._initialized,
+            "half_life_hours": self.half_life / 3600.0,
+            "n_movies": len(self.movie_ids),
+            "pending_movies": int(np.count_nonzero(self.pending)),
+            "snapshot_path": str(self.snapshot_path) if self.snapshot_path else None,
+            "sync_seconds": self.sync_seconds,
+            "refresh_seconds": self.refresh_seconds,
+            "depth": self.depth,
+            "n_genres": len(top_lists.by_genre) if top_lists else 0,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(top_lists.built_at)) if top_lists else None,
+            **self.counters
+        }
+
+
+# Singleton instance (per worker)
+_trending = None
+
+
+def get_trending() -> TrendingCounters:
+    """
+    Get or create trending counters
+    """
+    global _trending
+    if _trending is None:
+        _trending = TrendingCounters(
+            half_life_hours=settings.TRENDING_HALF_LIFE_HOURS,
+            snapshot_path=settings.TRENDING_SNAPSHOT_PATH or None,
+            sync_seconds=settings.TRENDING_SYNC_SECONDS,
+            refresh_seconds=settings.TRENDING_REFRESH_SECONDS
+        )
+    return _trending
+
+
+def shutdown_trending():
+    """
+    Ghi pending increments vào snapshot khi worker dừng (không tạo instance nếu chưa dùng)
+    """
+    if _trending is not None and _trending._initialized:
+        try:
+            _trending.sync()
+        except Exception as e:
+            logger.warning(f"Trending snapshot sync on shutdown failed: {e}")
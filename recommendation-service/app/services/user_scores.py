@@ -0,0 +1,308 @@
+"""
+Bảng user_movie_scores: điểm (user, movie) tổng hợp từ user_behaviors với time decay
+
+Decay dạng exponential với half-life SCORE_HALF_LIFE_DAYS, lưu theo "forward decay":
+mỗi behavior đóng góp score * 2^((created_at - DECAY_EPOCH) / half_life). Nhờ đó
+ghi behavior mới chỉ là phép cộng (một multi-row upsert, không cần đọc lại row),
+và giá trị hiện tại được tính khi đọc bằng một hệ số chung:
+
+    decayed(now) = stored * 2^(-(now - DECAY_EPOCH) / half_life)
+
+Training, watched sets và cold-start checks đọc bảng này, nên chi phí tỷ lệ với số
+cặp (user, movie) thay vì số raw events. Đổi SCORE_HALF_LIFE_DAYS cần chạy lại
+rebuild_user_movie_scores (xem app/scripts/backfill_user_scores.py).
+
+Timestamps trong tương lai (client clock lệch, dữ liệu lỗi) được clamp về now trước khi
+tính hệ số, nên exponent không vượt quá (now - DECAY_EPOCH) / half_life: với half-life
+30 ngày, stored score còn cách float64 overflow (2^1024) hơn 80 năm.
+"""
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import case, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.user_behavior import UserBehavior
+from app.models.user_movie_score import UserMovieScore
+
+logger = logging.getLogger(__name__)
+
+# Mốc thời gian của forward decay (giữ cố định, đổi mốc = rebuild bảng)
+DECAY_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Số rows mỗi upsert statement
+_UPSERT_BATCH_SIZE = 1000
+
+# Key của PostgreSQL advisory lock giữ trong lúc rebuild bảng
+_REBUILD_LOCK_KEY = 0x75736d73
+
+
+class UserScore(NamedTuple):
+    """Điểm đã decay của một movie trong lịch sử user"""
+    movie_id: int
+    score: float
+    interaction_count: int
+
+
+def _to_utc(timestamp: Optional[datetime]) -> datetime:
+    if timestamp is None:
+        return datetime.now(timezone.utc)
+    if timestamp.tzinfo is None:
+        # Naive timestamps (SQLite, seed.py) được coi là UTC
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def _half_life_seconds() -> float:
+    return settings.SCORE_HALF_LIFE_DAYS * 86400.0
+
+
+def forward_weight(timestamp: Optional[datetime]) -> float:
+    """
+    Hệ số 2^((t - DECAY_EPOCH) / half_life) của một behavior tại thời điểm t
+
+    t sau thời điểm hiện tại được clamp về now.
+    """
+    elapsed = min(_to_utc(timestamp).timestamp(), time.time()) - DECAY_EPOCH.timestamp()
+    return 2.0 ** (elapsed / _half_life_seconds())
+
+
+def forward_weights(epoch_seconds: np.ndarray) -> np.ndarray:
+    """forward_weight cho một array timestamps (Unix seconds, UTC)"""
+    timestamps = np.minimum(np.asarray(epoch_seconds, dtype=np.float64), time.time())
+    return np.exp2((timestamps - DECAY_EPOCH.timestamp()) / _half_life_seconds())
+
+
+def decay_factor(now: Optional[datetime] = None) -> float:
+    """Hệ số đổi stored score thành giá trị đã decay tại thời điểm now"""
+    elapsed = (_to_utc(now) - DECAY_EPOCH).total_seconds()
+    return 2.0 ** (-elapsed / _half_life_seconds())
+
+
+def aggregate_behaviors(behaviors: Iterable) -> Dict[Tuple[int, int], List]:
+    """
+    Gom behaviors theo (user_id, movie_id)
+
+    Args:
+        behaviors: objects có user_id, movie_id, score, created_at
+
+    Returns:
+        (user_id, movie_id) -> [forward-decayed score, interaction_count, last_interaction_at]
+    """
+    aggregates: Dict[Tuple[int, int], List] = {}
+    for b in behaviors:
+        created_at = _to_utc(b.created_at)
+        weighted = b.score * forward_weight(created_at)
+        key = (b.user_id, b.movie_id)
+        entry = aggregates.get(key)
+        if entry is None:
+            aggregates[key] = [weighted, 1, created_at]
+        else:
+            entry[0] += weighted
+            entry[1] += 1
+            entry[2] = max(entry[2], created_at)
+    return aggregates
+
+
+def _dialect_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def upsert_scores(db: Session, aggregates: Dict[Tuple[int, int], List]) -> int:
+    """
+    Cộng aggregates vào user_movie_scores (INSERT ... ON CONFLICT DO UPDATE)
+
+    Không commit: caller commit cùng transaction với insert user_behaviors.
+
+    Returns:
+        Số cặp (user, movie) được cập nhật
+    """
+    if not aggregates:
+        return 0
+
+    rows = [
+        {
+            'user_id': user_id,
+            'movie_id': movie_id,
+            'score': score,
+            'interaction_count': count,
+            'last_interaction_at': last_at
+        }
+        for (user_id, movie_id), (score, count, last_at) in sorted(aggregates.items())
+    ]
+
+    insert = _dialect_insert(db)
+    if insert is None:
+        # Dialect không hỗ trợ ON CONFLICT: read-modify-write từng row
+        for row in rows:
+            existing = db.get(UserMovieScore, (row['user_id'], row['movie_id']))
+            if existing is None:
+                db.add(UserMovieScore(**row))
+            else:
+                existing.score += row['score']
+                existing.interaction_count += row['interaction_count']
+                if existing.last_interaction_at is None or _to_utc(existing.last_interaction_at) < row['last_interaction_at']:
+                    existing.last_interaction_at = row['last_interaction_at']
+        db.flush()
+        return len(rows)
+
+    # Rows theo thứ tự (user_id, movie_id): các transactions upsert đồng thời lock rows
+    # theo cùng một thứ tự, tránh deadlock trên PostgreSQL
+    table = UserMovieScore.__table__
+    for start in range(0, len(rows), _UPSERT_BATCH_SIZE):
+        statement = insert(table).values(rows[start:start + _UPSERT_BATCH_SIZE])
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.movie_id],
+            set_={
+                'score': table.c.score + excluded.score,
+                'interaction_count': table.c.interaction_count + excluded.interaction_count,
+                'last_interaction_at': case(
+                    (table.c.last_interaction_at.is_(None), excluded.last_interaction_at),
+                    (excluded.last_interaction_at > table.c.last_interaction_at, excluded.last_interaction_at),
+                    else_=table.c.last_interaction_at
+                ),
+                'updated_at': func.now()
+            }
+        )
+        db.execute(statement)
+    return len(rows)
+
+
+def record_behaviors(db: Session, behaviors: Iterable) -> int:
+    """
+    Cập nhật user_movie_scores cho các behaviors vừa ghi (không commit)
+    """
+    return upsert_scores(db, aggregate_behaviors(behaviors))
+
+
+def _lock_for_rebuild(db: Session):
+    """
+    Serialize các rebuild giữa workers/processes (transaction-level advisory lock)
+
+    Hai rebuild chạy song song sẽ cùng xóa bảng rồi cùng upsert, và phép cộng
+    score + excluded.score của upsert đếm mỗi behavior hai lần. Lock được nhả khi
+    transaction commit/rollback. SQLite đã serialize writers, dialect khác không lock.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _REBUILD_LOCK_KEY})
+
+
+def rebuild_user_movie_scores(db: Session, batch_size: int = 50000) -> Dict[str, int]:
+    """
+    Tính lại toàn bộ user_movie_scores từ user_behaviors (backfill / đổi half-life)
+
+    Behaviors được stream theo batch, chỉ giữ aggregates theo cặp trong memory.
+    """
+    _lock_for_rebuild(db)
+    db.query(UserMovieScore).delete(synchronize_session=False)
+
+    query = db.query(
+        UserBehavior.user_id,
+        UserBehavior.movie_id,
+        UserBehavior.score,
+        UserBehavior.created_at
+    ).order_by(UserBehavior.id).yield_per(batch_size)
+
+    aggregates = aggregate_behaviors(query)
+    n_behaviors = sum(entry[1] for entry in aggregates.values())
+
+    n_pairs = upsert_scores(db, aggregates)
+    db.commit()
+    logger.info(f"Rebuilt user_movie_scores: {n_behaviors} behaviors -> {n_pairs} pairs")
+    return {"behaviors": n_behaviors, "pairs": n_pairs}
+
+
+def ensure_user_movie_scores(db: Session) -> bool:
+    """
+    Backfill một lần nếu bảng còn trống nhưng đã có user_behaviors (warm-up stage user_scores)
+
+    Mọi worker đều gọi khi startup: kiểm tra bảng trống sau khi giữ rebuild lock,
+    nên chỉ worker đầu tiên backfill, các worker khác thấy bảng đã có dữ liệu.
+
+    Returns:
+        True nếu đã backfill
+    """
+    _lock_for_rebuild(db)
+    if db.query(UserMovieScore.user_id).first() is not None or db.query(UserBehavior.id).first() is None:
+        db.rollback()
+        return False
+    rebuild_user_movie_scores(db)
+    return True
+
+
+def _user_scores_statement(user_id: int):
+    return select(
+        UserMovieScore.movie_id,
+        UserMovieScore.score,
+        UserMovieScore.interaction_count
+    ).where(UserMovieScore.user_id == user_id)
+
+
+def get_user_scores(db: Session, user_id: int, now: Optional[datetime] = None) -> List[UserScore]:
+    """
+    Lịch sử của một user: mỗi movie một row với score đã decay tới now
+    """
+    factor = decay_factor(now)
+    rows = db.execute(_user_scores_statement(user_id))
+    return [UserScore(r.movie_id, r.score * factor, r.interaction_count) for r in rows]
+
+
+async def get_user_scores_async(
+    db: AsyncSession,
+    user_id: int,
+    now: Optional[datetime] = None
+) -> List[UserScore]:
+    """get_user_scores cho AsyncSession (request path của các async endpoints)"""
+    factor = decay_factor(now)
+    rows = await db.execute(_user_scores_statement(user_id))
+    return [UserScore(r.movie_id, r.score * factor, r.interaction_count) for r in rows]
+
+
+def get_user_interaction_count(db: Session, user_id: int) -> int:
+    """Tổng số behaviors của user (không decay)"""
+    count = db.query(func.sum(UserMovieScore.interaction_count)).filter(
+        UserMovieScore.user_id == user_id
+    ).scalar()
+    return int(count or 0)
+
+
+def get_interaction_counts(db: Session) -> Dict[int, int]:
+    """Tổng số behaviors của mọi user, một GROUP BY trên bảng tổng hợp"""
+    rows = db.query(
+        UserMovieScore.user_id,
+        func.sum(UserMovieScore.interaction_count)
+    ).group_by(UserMovieScore.user_id).all()
+    return {r[0]: int(r[1] or 0) for r in rows}
+
+
+def get_watched_movie_ids(db: Session, user_id: int) -> Set[int]:
+    rows = db.query(UserMovieScore.movie_id).filter(UserMovieScore.user_id == user_id).all()
+    return {r[0] for r in rows}
+
+
+def get_watched_pairs(db: Session, user_ids: List[int]) -> List[Tuple[int, int]]:
+    """Các cặp (user_id, movie_id) đã tương tác của nhiều users, một query"""
+    rows = db.query(UserMovieScore.user_id, UserMovieScore.movie_id).filter(
+        UserMovieScore.user_id.in_(user_ids)
+    ).all()
+    return [(r[0], r[1]) for r in rows]
+
+
+def get_all_scores(db: Session, now: Optional[datetime] = None) -> List[Tuple[int, int, float]]:
+    """Toàn bộ (user_id, movie_id, decayed score) cho training"""
+    factor = decay_factor(now)
+    rows = db.query(UserMovieScore.user_id, UserMovieScore.movie_id, UserMovieScore.score).all()
+    return [(r.user_id, r.movie_id, r.score * factor) for r in rows]
@@ -0,0 +1,245 @@
+"""
+Warm-up khi worker khởi động: load trước các state in-process mà request đầu tiên
+phải trả giá nếu build lazy
+
+- user_scores: backfill user_movie_scores một lần nếu bảng còn trống (chạy cả khi
+  WARMUP_ENABLED=false vì đây là dữ liệu, không chỉ cache)
+- cf_model: load CF model từ model store (get_cf_service)
+- content_index: catalog + TF-IDF vectorizer/matrix + neighbor index của /similar
+- leaderboards: rankings cho /popular, /top-rated và rails theo thể loại
+- trending: load snapshot (hoặc bootstrap) của trending counters và build top lists
+
+Warm-up chạy trong background thread (start từ startup event) để /health vẫn trả
+lời trong lúc load; /ready chỉ thành công khi mọi stage đã thành công. Stage lỗi
+(vd. database chưa sẵn sàng) được chạy lại với backoff bắt đầu từ
+WARMUP_RETRY_SECONDS (gấp đôi mỗi lần, tối đa MAX_RETRY_SECONDS). Mỗi stage được
+log thời gian và ghi vào metric startup_warmup_seconds{stage=...}.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Backoff tối đa giữa hai lần chạy lại các stages lỗi (giây)
+MAX_RETRY_SECONDS = 60.0
+
+
+def _warm_user_scores() -> Dict:
+    from app.database import SessionLocal
+    from app.services.user_scores import ensure_user_movie_scores
+
+    db = SessionLocal()
+    try:
+        backfilled = ensure_user_movie_scores(db)
+        if backfilled:
+            print("✅ user_movie_scores backfilled from user_behaviors")
+        return {"backfilled": backfilled}
+    finally:
+        db.close()
+
+
+def _warm_cf_model() -> Dict:
+    from app.services.collaborative_service import get_cf_service
+
+    info = get_cf_service().get_model_info()
+    return {key: info.get(key) for key in ("status", "model_version", "n_users", "n_movies")}
+
+
+def _warm_content_index() -> Dict:
+    from app.database import SessionLocal
+    from app.services.recommendation_service import RecommendationService
+
+    db = SessionLocal()
+    try:
+        rec_service = RecommendationService(db)
+        fingerprint = rec_service._catalog_fingerprint(db)
+        # TF-IDF dùng cho content-based từ profile, neighbor index cho /similar
+        rec_service._ensure_tfidf_cache(db, fingerprint)
+        index = rec_service.get_neighbor_index(db, fingerprint=fingerprint)
+        catalog = RecommendationService._tfidf_cache['catalog']
+        return {
+            "n_movies": len(catalog) if catalog is not None else 0,
+            "neighbor_index": index is not None
+        }
+    finally:
+        db.close()
+
+
+def _warm_leaderboards() -> Dict:
+    from app.database import SessionLocal
+    from app.services.leaderboards import get_leaderboards
+
+    db = SessionLocal()
+    try:
+        leaderboards = get_leaderboards()
+        leaderboards.refresh(db)
+        stats = leaderboards.stats()
+        return {key: stats.get(key) for key in ("status", "n_movies", "n_genres")}
+    finally:
+        db.close()
+
+
+def _warm_trending() -> Dict:
+    from app.database import SessionLocal
+    from app.services.trending import get_trending
+
+    db = SessionLocal()
+    try:
+        trending = get_trending()
+        source = trending.initialize(db)
+        trending.top(db, limit=1)
+        return {"source": source, "n_movies": trending.stats()["n_movies"]}
+    finally:
+        db.close()
+
+
+# Thứ tự các stages
+WARMUP_STAGES: List[Tuple[str, Callable[[], Dict]]] = [
+    ("user_scores", _warm_user_scores),
+    ("cf_model", _warm_cf_model),
+    ("content_index", _warm_content_index),
+    ("leaderboards", _warm_leaderboards),
+    ("trending", _warm_trending)
+]
+
+# Stages vẫn chạy khi WARMUP_ENABLED=false
+REQUIRED_STAGES = ("user_scores",)
+
+
+class Warmup:
+    """Trạng thái warm-up của worker (thread-safe)"""
+
+    def __init__(self, stages: List[Tuple[str, Callable[[], Dict]]], retry_seconds: float = 5.0):
+        self.stages = stages
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._results: Dict[str, Dict] = {}
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        """Mọi stage đã thành công (hoặc warm-up bị tắt)"""
+        return self._finished_at is not None
+
+    def start(self):
+        """Chạy warm-up trong background thread (một lần)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Dừng việc chạy lại các stages lỗi (worker shutdown)"""
+        self._stop.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready
+
+    def _run_stage(self, name: str, stage: Callable[[], Dict]) -> bool:
+        start = time.perf_counter()
+        with self._lock:
+            attempts = self._results.get(name, {}).get("attempts", 0) + 1
+        result = {"stage": name, "status": "ok", "attempts": attempts}
+        try:
+            result["details"] = stage()
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        metrics.observe("startup_warmup_seconds", result["seconds"], labels={"stage": name})
+
+        if result["status"] == "ok":
+            # print giống các thông báo khác của startup (app không cấu hình logging)
+            print(f"✅ Warm-up {name}: {result['seconds']:.3f}s")
+        else:
+            logger.error(
+                f"Warm-up stage {name} failed after {result['seconds']:.3f}s "
+                f"(attempt {attempts}): {result['error']}"
+            )
+        with self._lock:
+            self._results[name] = result
+        return result["status"] == "ok"
+
+    def run(self):
+        """
+        Chạy lần lượt các stages; stage lỗi được log và ghi lại, các stages sau vẫn chạy.
+        Sau đó các stages lỗi được chạy lại với backoff cho tới khi thành công; worker
+        chỉ ready khi mọi stage đã thành công.
+        """
+        if self._started_at is None:
+            self._started_at = time.time()
+        total_start = time.perf_counter()
+
+        pending = [(name, stage) for name, stage in self.stages if not self._run_stage(name, stage)]
+        delay = self.retry_seconds
+        while pending:
+            logger.warning(f"Warm-up stages failed: {', '.join(name for name, _ in pending)}, retrying in {delay:g}s")
+            if self._stop.wait(delay):
+                return
+            pending = [(name, stage) for name, stage in pending if not self._run_stage(name, stage)]
+            delay = min(delay * 2, MAX_RETRY_SECONDS)
+
+        total = time.perf_counter() - total_start
+        metrics.observe("startup_warmup_seconds", total, labels={"stage": "total"})
+        print(f"🔥 Warm-up finished in {total:.3f}s, worker ready")
+        with self._lock:
+            self._finished_at = time.time()
+
+    def status(self) -> Dict:
+        with self._lock:
+            results = list(self._results.values())
+            started_at, finished_at = self._started_at, self._finished_at
+        failed = [r["stage"] for r in results if r["status"] == "failed"]
+        if finished_at is not None:
+            status = "ready"
+        elif failed:
+            status = "retrying"
+        elif started_at is not None:
+            status = "warming_up"
+        else:
+            status = "not_started"
+        return {
+            "status": status,
+            "ready": finished_at is not None,
+            "elapsed_seconds": round((finished_at or time.time()) - started_at, 3) if started_at else None,
+            "stages": results,
+            "failed": failed,
+            "pending": [name for name, _ in self.stages if name not in self._results]
+        }
+
+
+# Singleton instance (per worker)
+_warmup = None
+
+
+def get_warmup() -> Warmup:
+    """
+    Get or create warm-up state
+    """
+    global _warmup
+    if _warmup is None:
+        stages = WARMUP_STAGES
+        if not settings.WARMUP_ENABLED:
+            stages = [(name, stage) for name, stage in WARMUP_STAGES if name in REQUIRED_STAGES]
+        _warmup = Warmup(stages, retry_seconds=settings.WARMUP_RETRY_SECONDS)
+    return _warmup
+
+
+def start_warmup():
+    """
+    Bắt đầu warm-up từ startup event (WARMUP_ENABLED=false: chỉ chạy REQUIRED_STAGES)
+    """
+    get_warmup().start()